@@ -0,0 +1,150 @@
+# artifacts.py
+# The serving bundle: one versioned directory holding everything /predict needs,
+# written by models/5train_model.py and opened zero-copy by the web app.
+#
+#   serving_bundle/
+#     CURRENT                 name of the active version directory
+#     <version>/
+#       manifest.json         format, model name, embedding dimension, counts, checksum
+#       index.faiss           FAISS index (memory-mapped on load)
+#       labels.int16.npy      cluster label of every index row, in row order (memory-mapped on load)
+#       ids.json              post id of every index row, in row order (not loaded by the server)
+#       clusters.json         cluster id -> {"name", "response"}
+#       prototypes.npy        optional: cluster prototypes for the fast path (models/prototypes.py)
+#       prototype_labels.int16.npy  cluster label of every prototype
+#
+# Memory-mapped files are shared between worker processes through the page cache, so
+# startup time and RSS no longer grow with the number of indexed posts.
+
+import datetime
+import hashlib
+import json
+import os
+import numpy as np
+import faiss
+
+BUNDLE_FORMAT = 1
+CURRENT_FILE = "CURRENT"
+MANIFEST_FILE = "manifest.json"
+INDEX_FILE = "index.faiss"
+LABELS_FILE = "labels.int16.npy"
+IDS_FILE = "ids.json"
+CLUSTERS_FILE = "clusters.json"
+PROTOTYPES_FILE = "prototypes.npy"
+PROTOTYPE_LABELS_FILE = "prototype_labels.int16.npy"
+CHECKSUM_FILES = (INDEX_FILE, LABELS_FILE, IDS_FILE, CLUSTERS_FILE)
+OPTIONAL_CHECKSUM_FILES = (PROTOTYPES_FILE, PROTOTYPE_LABELS_FILE)
+
+
+class BundleError(Exception):
+    pass
+
+
+def _checksum(version_dir):
+    digest = hashlib.sha256()
+    optional = [name for name in OPTIONAL_CHECKSUM_FILES if os.path.exists(os.path.join(version_dir, name))]
+    for name in CHECKSUM_FILES + tuple(optional):
+        with open(os.path.join(version_dir, name), "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def write_bundle(bundle_dir, index, labels, ids, clusters, model_name, extra=None, prototypes=None):
+    # labels and ids are in index row order; clusters maps cluster id -> {"name", "response"};
+    # prototypes, if given, is (prototype vectors, prototype labels)
+    labels = np.asarray([int(label) for label in labels], dtype=np.int16)
+    if len(labels) != index.ntotal or len(ids) != index.ntotal:
+        raise BundleError(f"Index has {index.ntotal} vectors but {len(labels)} labels and {len(ids)} ids")
+
+    created = datetime.datetime.utcnow()
+    staging_dir = os.path.join(bundle_dir, f".staging-{created.strftime('%Y%m%dT%H%M%S%f')}")
+    os.makedirs(staging_dir)
+
+    faiss.write_index(index, os.path.join(staging_dir, INDEX_FILE))
+    np.save(os.path.join(staging_dir, LABELS_FILE), labels)
+    with open(os.path.join(staging_dir, IDS_FILE), "w", encoding="utf-8") as f:
+        json.dump([str(i) for i in ids], f)
+    with open(os.path.join(staging_dir, CLUSTERS_FILE), "w", encoding="utf-8") as f:
+        json.dump({str(k): v for k, v in clusters.items()}, f, ensure_ascii=False, indent=2)
+    if prototypes is not None:
+        np.save(os.path.join(staging_dir, PROTOTYPES_FILE), np.asarray(prototypes[0], dtype=np.float32))
+        np.save(os.path.join(staging_dir, PROTOTYPE_LABELS_FILE), np.asarray(prototypes[1], dtype=np.int16))
+
+    checksum = _checksum(staging_dir)
+    version = f"{created.strftime('%Y%m%dT%H%M%S')}-{checksum[:8]}"
+    manifest = {
+        "format": BUNDLE_FORMAT,
+        "version": version,
+        "created_utc": created.isoformat(),
+        "model_name": model_name,
+        "embedding_dim": index.d,
+        "index_type": type(index).__name__,
+        "num_vectors": int(index.ntotal),
+        "num_clusters": len(clusters),
+        "checksum": checksum,
+    }
+    manifest.update(extra or {})
+    with open(os.path.join(staging_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+    # Publish: rename the finished directory, then atomically repoint CURRENT at it
+    version_dir = os.path.join(bundle_dir, version)
+    os.replace(staging_dir, version_dir)
+    pointer_tmp = os.path.join(bundle_dir, CURRENT_FILE + ".tmp")
+    with open(pointer_tmp, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(pointer_tmp, os.path.join(bundle_dir, CURRENT_FILE))
+    return manifest
+
+
+def current_version_dir(bundle_dir):
+    pointer = os.path.join(bundle_dir, CURRENT_FILE)
+    if not os.path.exists(pointer):
+        return None
+    with open(pointer, "r", encoding="utf-8") as f:
+        return os.path.join(bundle_dir, f.read().strip())
+
+
+def _mmap_flags(index_type):
+    # IO_FLAG_MMAP_IFC maps flat/HNSW vector storage directly; IVF indexes map their inverted lists.
+    # Older FAISS builds only have IO_FLAG_MMAP.
+    if index_type.startswith("IndexIVF") or not hasattr(faiss, "IO_FLAG_MMAP_IFC"):
+        return faiss.IO_FLAG_MMAP
+    return faiss.IO_FLAG_MMAP_IFC
+
+
+def open_bundle(version_dir, verify=False):
+    # Returns (manifest, index, labels, clusters). The index and labels are memory-mapped, not copied.
+    # verify=True re-hashes every file against the manifest checksum (written once, at build time);
+    # it reads the whole index, so opening would again take time proportional to the corpus.
+    with open(os.path.join(version_dir, MANIFEST_FILE), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format") != BUNDLE_FORMAT:
+        raise BundleError(f"Unsupported bundle format {manifest.get('format')} in {version_dir}")
+    if verify and _checksum(version_dir) != manifest["checksum"]:
+        raise BundleError(f"Checksum mismatch in {version_dir}")
+
+    index = faiss.read_index(os.path.join(version_dir, INDEX_FILE), _mmap_flags(manifest["index_type"]))
+    labels = np.load(os.path.join(version_dir, LABELS_FILE), mmap_mode="r")
+    with open(os.path.join(version_dir, CLUSTERS_FILE), "r", encoding="utf-8") as f:
+        clusters = json.load(f)
+
+    if index.ntotal != manifest["num_vectors"] or len(labels) != index.ntotal:
+        raise BundleError(f"Bundle {manifest['version']} has {index.ntotal} vectors and {len(labels)} labels")
+    if index.d != manifest["embedding_dim"]:
+        raise BundleError(f"Bundle {manifest['version']} index dimension {index.d} != {manifest['embedding_dim']}")
+    return manifest, index, labels, clusters
+
+
+def load_bundle_ids(version_dir):
+    with open(os.path.join(version_dir, IDS_FILE), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_bundle_prototypes(version_dir):
+    # (prototype vectors, prototype labels), or None for bundles built without prototypes
+    path = os.path.join(version_dir, PROTOTYPES_FILE)
+    if not os.path.exists(path):
+        return None
+    return np.load(path), np.load(os.path.join(version_dir, PROTOTYPE_LABELS_FILE))
@@ -0,0 +1,148 @@
+# batcher.py
+# Collects concurrent /predict requests into a single batch so that the model
+# runs one encode() call and FAISS runs one search() for all of them.
+
+import asyncio
+from collections import Counter
+from logger import logger
+
+
+class MicroBatcher:
+    def __init__(self, process_batch, max_size, window_ms, max_concurrent=1):
+        # process_batch is a coroutine function that takes a list of texts and
+        # returns one result per text, in order
+        self.process_batch = process_batch
+        self.max_size = max(1, int(max_size))
+        self.window = max(0.0, window_ms) / 1000
+        # Number of batches allowed in flight at once (normally the number of inference workers)
+        self.max_concurrent = max(1, int(max_concurrent))
+        self.queue = None
+        self.worker = None
+        self.slots = None
+        self.in_flight = set()
+
+        # Counters for how full the batches are
+        self.batches = 0
+        self.items = 0
+        self.full_batches = 0
+        self.size_counts = Counter()
+
+    async def submit(self, text):
+        # The queue and worker are created lazily so they belong to the running event loop
+        if self.worker is None or self.worker.done():
+            if self.worker is not None:
+                self._fail_queued(self.worker)
+            self.queue = asyncio.Queue()
+            self.slots = asyncio.Semaphore(self.max_concurrent)
+            self.worker = asyncio.create_task(self._run())
+
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((text, future))
+        return await future
+
+    async def _collect(self, batch):
+        # Wait for the first request, then keep collecting until the window closes or the batch is full
+        # (into the caller's list, so requests already taken are not lost if the worker dies meanwhile)
+        batch.append(await self.queue.get())
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.window
+
+        while len(batch) < self.max_size:
+            if not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+
+    async def _run(self):
+        batch = []
+        try:
+            while True:
+                # Wait for a free worker first, so requests keep accumulating into the next batch meanwhile
+                await self.slots.acquire()
+                await self._collect(batch)
+                self._start(batch)
+                batch = []
+        except BaseException as e:
+            # Requests taken off the queue but not yet dispatched would otherwise wait forever
+            self._fail(batch, e)
+            raise
+
+    def _start(self, batch):
+        # Callers that gave up (e.g. client disconnected) don't need encoding
+        batch = [(text, future) for text, future in batch if not future.cancelled()]
+        if not batch:
+            self.slots.release()
+            return
+
+        self._record(len(batch))
+        # The semaphore this batch holds: a restarted worker gets a new one, which this must not release
+        task = asyncio.create_task(self._dispatch(batch, self.slots))
+        # Keep a reference so the task isn't garbage collected mid-batch
+        self.in_flight.add(task)
+        task.add_done_callback(self.in_flight.discard)
+
+    def _fail_queued(self, worker):
+        # Called before a dead worker is replaced: its queue is dropped with the worker, so the
+        # requests still waiting in it get the worker's error instead of hanging
+        error = None if worker.cancelled() else worker.exception()
+        queued = []
+        while not self.queue.empty():
+            queued.append(self.queue.get_nowait())
+        self._fail(queued, error)
+
+    def _fail(self, batch, error):
+        if not batch:
+            return
+        if not isinstance(error, Exception):
+            error = RuntimeError("Batching worker stopped before the request was processed")
+        logger.error(f"Failing {len(batch)} queued requests: {error!r}")
+        for _, future in batch:
+            if not future.done():
+                try:
+                    future.set_exception(error)
+                except RuntimeError:
+                    # Its event loop has been closed, so nothing is waiting on it any more
+                    pass
+
+    async def _dispatch(self, batch, slots):
+        try:
+            results = await self.process_batch([text for text, _ in batch])
+            if len(results) != len(batch):
+                raise RuntimeError(f"process_batch returned {len(results)} results for {len(batch)} texts")
+        except Exception as e:
+            logger.error(f"Batch of {len(batch)} failed: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            slots.release()
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def _record(self, size):
+        self.batches += 1
+        self.items += size
+        self.size_counts[size] += 1
+        if size >= self.max_size:
+            self.full_batches += 1
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "mean_fill_ratio": round(self.items / (self.batches * self.max_size), 3) if self.batches else 0.0,
+            "full_batches": self.full_batches,
+            "batch_size_counts": {str(size): count for size, count in sorted(self.size_counts.items())},
+            "max_size": self.max_size,
+            "window_ms": self.window * 1000,
+        }
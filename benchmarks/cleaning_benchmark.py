@@ -0,0 +1,121 @@
+"""
+Checks that the compiled text cleaner in preprocessing/text_cleaning.py gives byte-identical output to
+the original step-by-step version, and measures cleaning throughput in posts per second:
+original version, compiled version, and compiled version across a multiprocessing pool.
+
+Posts come from the raw post store (data/raw/store) if there is one, otherwise a synthetic corpus
+that mixes URLs, Reddit terms, punctuation, unicode and odd whitespace is generated. A fixed set of
+edge cases is always checked as well. Exits with status 1 if any output differs.
+
+Run from the repository root:
+  python benchmarks/cleaning_benchmark.py [--posts 50000] [--workers 4]
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+from multiprocessing import Pool
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from preprocessing.text_cleaning import clean_text_sbert, clean_post, clean_posts, REDDIT_TERMS
+from preprocessing.raw_store import RawPostStore, RAW_STORE_DIR
+
+
+def clean_text_sbert_original(text):
+    # The cleaner as it was before the patterns were compiled and combined (the reference output)
+    text = text.lower()
+    text = re.sub(r"http\S+", "", text)
+    text = re.sub(r"\s+", " ", text)
+    reddit_terms = ["tw", "vent", "rant", "update", "throwra", "ama", "crosspost", "cross-post"]
+    for term in reddit_terms:
+        text = re.sub(rf"\b{term}\b", "", text)
+    text = text.strip()
+    text = re.sub(r"\s+", " ", text)
+    return text
+
+
+def clean_post_original(post):
+    return {**clean_post(post), "text": clean_text_sbert_original(post["title"].strip() + " " + post["body"].strip())}
+
+
+EDGE_CASES = [
+    "", "   ", "TW: vent", "tw-vent-rant", "cross-post crosspost cross--post", "CROSS-POST from r/ama",
+    "UPDATE:update_update", "twtw tw_tw tw2 2tw", "vent rant ama", "tw\n\n\tvent \r\n rant",
+    "see https://reddit.com/r/vent?tw=1 and http://x.y/ama", "httpvent http", "tw.vent,rant;update!throwra?",
+    "café tw naïve vent", "ΑΜΑ ama Ama", "\x1ctw\x1d", "i'm so tired... can't sleep", "a-tw-b", "​tw​",
+]
+
+
+def synthetic_posts(n, seed=42):
+    rng = random.Random(seed)
+    words = ["i", "feel", "anxious", "today", "can't", "sleep", "therapy", "work", "friends", "help",
+             "http://example.com/a?b=c", "https://reddit.com/r/ama", "café", "naïve", "—", "...", "!!", "😞",
+             " ", "\t", "\n\n", "  "] + REDDIT_TERMS + [t.upper() for t in REDDIT_TERMS] + ["[tw]", "(vent)", "tw:"]
+    posts = []
+    for i in range(n):
+        title = " ".join(rng.choice(words) for _ in range(rng.randint(1, 12)))
+        body = "".join(rng.choice(words) + rng.choice([" ", " ", " ", "", "\n", ", "])
+                       for _ in range(rng.randint(20, 400)))
+        posts.append({"id": f"s{i}", "subreddit": "synthetic", "category": "new", "title": title, "body": body})
+    return posts
+
+
+def posts_per_second(fn, posts):
+    start = time.perf_counter()
+    for _ in fn(posts):
+        pass
+    return len(posts) / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Equivalence check and throughput of the text cleaner.")
+    parser.add_argument("--posts", type=int, default=50000, help="Synthetic posts when there is no raw store")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--output", default="benchmarks/results/cleaning_benchmark.json")
+    args = parser.parse_args()
+
+    store = RawPostStore(RAW_STORE_DIR)
+    if store.count():
+        source, posts = "raw store", list(store.iter_posts())
+    else:
+        source, posts = "synthetic", synthetic_posts(args.posts)
+    print(f"🧹 {len(posts)} posts ({source}), {len(EDGE_CASES)} edge cases")
+
+    # ----------------------
+    # Byte-identical output
+    # ----------------------
+    mismatches = [text for text in EDGE_CASES if clean_text_sbert(text) != clean_text_sbert_original(text)]
+    expected = list(map(clean_post_original, posts))
+    mismatches += [post["id"] for post, want in zip(posts, expected) if clean_post(post) != want]
+    with Pool(args.workers) as pool:
+        if list(clean_posts(posts, pool)) != expected:
+            mismatches.append("multiprocessing output differs")
+
+    # ----------------------
+    # Throughput
+    # ----------------------
+    results = {
+        "original": posts_per_second(lambda p: map(clean_post_original, p), posts),
+        "compiled": posts_per_second(clean_posts, posts),
+    }
+    with Pool(args.workers) as pool:
+        results[f"compiled, {args.workers} processes"] = posts_per_second(lambda p: clean_posts(p, pool), posts)
+
+    print(f"\n{'cleaner':<28}{'posts/s':>12}{'speedup':>10}")
+    for name, rate in results.items():
+        print(f"{name:<28}{rate:>12.0f}{rate / results['original']:>10.2f}")
+
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"source": source, "posts": len(posts), "identical": not mismatches, "mismatches": mismatches[:20],
+                   "posts_per_second": results}, f, indent=2)
+    print(f"\n🧾 Results saved to {args.output}")
+
+    if mismatches:
+        print(f"❌ {len(mismatches)} outputs differ from the original cleaner, e.g. {mismatches[:5]}")
+        sys.exit(1)
+    print("✅ Output is byte-identical to the original cleaner.")
@@ -0,0 +1,83 @@
+"""
+Shared by serving_benchmark.py and load_test.py: input texts and a description of the environment
+and settings, saved with every result file so that runs can be compared.
+"""
+
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config
+
+CLEANED_POSTS_PATH = "data/processed/cleaned_posts.json"
+
+WORDS = ["i", "feel", "anxious", "today", "and", "can't", "sleep", "since", "therapy", "ended", "work", "is",
+         "too", "much", "my", "friends", "don't", "understand", "why", "everything", "seems", "so", "heavy",
+         "medication", "helps", "a", "little", "but", "the", "nights", "are", "long", "lonely", "tired", "again"]
+
+
+def benchmark_texts(n, min_words=config.MIN_WORD_COUNT, seed=42):
+    """
+    n texts of at least `min_words` words: cleaned posts from 2prepare_dataset.py when available
+    (sampled with replacement if there are fewer than n), otherwise synthetic posts.
+    Returns (source, texts).
+    """
+    rng = random.Random(seed)
+    if os.path.exists(CLEANED_POSTS_PATH):
+        with open(CLEANED_POSTS_PATH, "r", encoding="utf-8") as f:
+            texts = [post["text"] for post in json.load(f) if len(post["text"].split()) >= min_words]
+        if texts:
+            return "cleaned posts", [texts[rng.randrange(len(texts))] for _ in range(n)]
+    return "synthetic", [" ".join(rng.choice(WORDS) for _ in range(rng.randint(min_words, 4 * min_words)))
+                         for _ in range(n)]
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    import numpy
+    import faiss
+    return {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "numpy": numpy.__version__,
+        "faiss": getattr(faiss, "__version__", None),
+        "encoder_backend": config.ENCODER_BACKEND,
+        "embedding_model": config.EMBEDDING_MODEL,
+        "k_neighbors": config.K_NEIGHBORS,
+        "index_type": config.INDEX_TYPE,
+        "index_metric": config.INDEX_METRIC,
+        "batch_max_size": config.BATCH_MAX_SIZE,
+        "batch_window_ms": config.BATCH_WINDOW_MS,
+        "inference_mode": config.INFERENCE_MODE,
+        "inference_workers": config.INFERENCE_WORKERS,
+        "inference_threads": config.INFERENCE_THREADS,
+        "prediction_cache_size": config.PREDICTION_CACHE_SIZE,
+    }
+
+
+def percentiles(values, points=(50, 95, 99)):
+    import numpy
+    values = numpy.asarray(values, dtype=float)
+    if not len(values):
+        return {f"p{p}": None for p in points}
+    return {f"p{p}": float(numpy.percentile(values, p)) for p in points}
+
+
+def save_results(path, results):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"environment": environment(), **results}, f, indent=2)
+    print(f"\n🧾 Results saved to {path}")
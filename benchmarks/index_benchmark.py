@@ -0,0 +1,147 @@
+"""
+Compares the kNN index types from models/index_factory.py on our real embeddings:
+recall@k against the exact flat index, kNN label agreement with the flat index,
+build time, queries per second and index memory.
+
+A random sample of posts is held out as queries; the rest form the indexed corpus.
+
+Run from the repository root:
+  python benchmarks/index_benchmark.py                      # data/processed/post_embeddings.npy if present, else the serving index
+  python benchmarks/index_benchmark.py --source bundle      # vectors and labels of the serving index
+  python benchmarks/index_benchmark.py --queries 2000 --k 6 --nprobe 8 16 32 --ef-search 32 64 128
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+import faiss
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import K_NEIGHBORS, INDEX_NPROBE, INDEX_EF_SEARCH
+from models.index_factory import build_index, apply_search_params, prepare_vectors, INDEX_TYPES
+from models.knn import neighbor_labels, majority_vote
+from serving_state import load_serving_state
+
+parser = argparse.ArgumentParser(description="Recall/latency benchmark for the kNN index types.")
+parser.add_argument("--source", choices=["auto", "embeddings", "bundle"], default="auto")
+parser.add_argument("--embeddings", default="data/processed/post_embeddings.npy")
+parser.add_argument("--metadata", default="data/processed/post_metadata.json")
+parser.add_argument("--labels", default="data/processed/clustered_posts.json",
+                    help="Records with 'id' and 'cluster' used for label agreement (embeddings source)")
+parser.add_argument("--queries", type=int, default=1000)
+parser.add_argument("--k", type=int, default=K_NEIGHBORS)
+parser.add_argument("--metrics", nargs="+", default=["l2", "cosine"])
+parser.add_argument("--nprobe", type=int, nargs="+", default=[INDEX_NPROBE])
+parser.add_argument("--ef-search", type=int, nargs="+", default=[INDEX_EF_SEARCH])
+parser.add_argument("--output", default="benchmarks/results/index_benchmark.json")
+args = parser.parse_args()
+
+# ----------------------
+# Load vectors and labels
+# ----------------------
+source = args.source
+if source == "auto":
+    source = "embeddings" if os.path.exists(args.embeddings) else "bundle"
+
+if source == "embeddings":
+    vectors = np.load(args.embeddings).astype(np.float32)
+    with open(args.metadata, "r", encoding="utf-8") as f:
+        ids = [post["id"] for post in json.load(f)]
+    labels = None
+    if os.path.exists(args.labels):
+        with open(args.labels, "r", encoding="utf-8") as f:
+            id_to_cluster = {post["id"]: post["cluster"] for post in json.load(f)}
+        labels = np.array([id_to_cluster.get(i, -1) for i in ids], dtype=np.int16)
+else:
+    state = load_serving_state()
+    vectors = state.index.reconstruct_n(0, state.index.ntotal)
+    labels = np.asarray(state.labels)
+
+rng = np.random.default_rng(42)
+order = rng.permutation(len(vectors))
+num_queries = min(args.queries, len(vectors) // 5)
+query_rows, corpus_rows = order[:num_queries], order[num_queries:]
+queries, corpus = vectors[query_rows], vectors[corpus_rows]
+corpus_labels = labels[corpus_rows] if labels is not None else None
+print(f"🔍 {source}: {len(corpus)} indexed vectors, {len(queries)} queries, dimension {vectors.shape[1]}, k={args.k}")
+
+
+def index_bytes(index):
+    return len(faiss.serialize_index(index))
+
+
+def timed_search(index, query_vectors):
+    # Batched throughput plus single-query latency (what /predict sees without batching)
+    start = time.perf_counter()
+    _, batch_indices = index.search(query_vectors, args.k)
+    batch_seconds = time.perf_counter() - start
+
+    single = query_vectors[:min(200, len(query_vectors))]
+    start = time.perf_counter()
+    for row in single:
+        index.search(row[None, :], args.k)
+    single_ms = 1000 * (time.perf_counter() - start) / len(single)
+    return batch_indices, len(query_vectors) / batch_seconds, single_ms
+
+
+# ----------------------
+# Run every index type and metric
+# ----------------------
+results = []
+for metric in args.metrics:
+    query_vectors = prepare_vectors(queries, metric)
+    exact = build_index(corpus, "flat", metric)
+    exact_indices, exact_qps, exact_ms = timed_search(exact, query_vectors)
+    exact_votes = majority_vote(neighbor_labels(corpus_labels, exact_indices))[0] if corpus_labels is not None else None
+
+    for index_type in INDEX_TYPES:
+        start = time.perf_counter()
+        index = exact if index_type == "flat" else build_index(corpus, index_type, metric)
+        build_seconds = time.perf_counter() - start
+
+        # Sweep the knob that matters for this index type
+        if faiss.try_extract_index_ivf(index) is not None:
+            settings = [{"nprobe": n} for n in args.nprobe]
+        elif hasattr(index, "hnsw"):
+            settings = [{"ef_search": e} for e in args.ef_search]
+        else:
+            settings = [{}]
+
+        for setting in settings:
+            apply_search_params(index, **setting)
+            indices, qps, single_ms = timed_search(index, query_vectors)
+            recall = np.mean([len(set(a) & set(b)) / args.k for a, b in zip(indices, exact_indices)])
+            row = {
+                "index": index_type,
+                "metric": metric,
+                **setting,
+                "recall_at_k": float(recall),
+                "label_agreement": None,
+                "qps_batched": qps,
+                "ms_per_query_single": single_ms,
+                "build_seconds": build_seconds,
+                "memory_mb": index_bytes(index) / 1e6,
+            }
+            if exact_votes is not None:
+                votes = majority_vote(neighbor_labels(corpus_labels, indices))[0]
+                row["label_agreement"] = float(np.mean(votes == exact_votes))
+            results.append(row)
+
+# ----------------------
+# Report
+# ----------------------
+print(f"\n{'index':<10}{'metric':<8}{'setting':<14}{'recall@k':>9}{'labels':>8}{'QPS':>10}{'ms/q':>8}{'build s':>9}{'MB':>8}")
+for row in results:
+    setting = f"nprobe={row['nprobe']}" if "nprobe" in row else f"ef={row['ef_search']}" if "ef_search" in row else "-"
+    agreement = f"{row['label_agreement']:.3f}" if row["label_agreement"] is not None else "n/a"
+    print(f"{row['index']:<10}{row['metric']:<8}{setting:<14}{row['recall_at_k']:>9.3f}{agreement:>8}"
+          f"{row['qps_batched']:>10.0f}{row['ms_per_query_single']:>8.3f}{row['build_seconds']:>9.2f}{row['memory_mb']:>8.1f}")
+
+os.makedirs(os.path.dirname(args.output), exist_ok=True)
+with open(args.output, "w", encoding="utf-8") as f:
+    json.dump({"source": source, "corpus_size": len(corpus), "queries": len(queries), "k": args.k,
+               "results": results}, f, indent=2)
+print(f"\n🧾 Results saved to {args.output}")
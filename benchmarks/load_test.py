@@ -0,0 +1,151 @@
+"""
+Load generator for /predict. It drives the FastAPI app in-process through its ASGI interface
+(httpx.ASGITransport, no network or uvicorn). The whole request path is exercised: validation,
+the prediction cache, micro-batching, the inference executor, encoding, search and vote.
+
+For each --concurrency level, that many clients send requests back to back until --requests have
+been answered. Reported per level: throughput, p50/p95/p99 latency, status counts, and the mean
+batch size the batcher formed. Every text is unique unless --repeat-share is set, so the cache only
+helps when asked to.
+
+--offline uses the deterministic 'hashing' stand-in encoder (encoders.py), so it runs without
+downloading the model. The index and labels are the real ones; the encode cost is not.
+
+Results are saved as JSON with the commit, machine and config.py settings (see common.py).
+config.py settings such as BATCH_MAX_SIZE, INFERENCE_MODE or K_NEIGHBORS can be changed per run
+through their environment variables.
+
+Needs httpx (pip install httpx). Run from the repository root:
+  python benchmarks/load_test.py --offline
+  python benchmarks/load_test.py --concurrency 1 8 32 --requests 500 --repeat-share 0.2
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import time
+
+parser = argparse.ArgumentParser(description="Concurrent load test of /predict through the ASGI app.")
+parser.add_argument("--offline", action="store_true", help="Use the 'hashing' stand-in encoder")
+parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+parser.add_argument("--requests", type=int, default=500, help="Requests per concurrency level")
+parser.add_argument("--warmup", type=int, default=20, help="Requests sent before measuring (not counted)")
+parser.add_argument("--repeat-share", type=float, default=0.0, help="Share of requests resending an earlier text")
+parser.add_argument("--short-share", type=float, default=0.0, help="Share of requests below the word limit")
+parser.add_argument("--seed", type=int, default=42)
+parser.add_argument("--verbose", action="store_true", help="Keep the app's per-request log lines")
+parser.add_argument("--output", default="benchmarks/results/load_test.json")
+args = parser.parse_args()
+
+# Before config.py is imported (by the app)
+if args.offline:
+    os.environ["ENCODER_BACKEND"] = "hashing"
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import httpx
+import routes
+from main import fastapi_app
+from logger import logger
+from benchmarks.common import benchmark_texts, percentiles, save_results
+
+# Writing several log lines per request would take up much of the time being measured
+if not args.verbose:
+    logger.setLevel(logging.ERROR)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+def make_requests(texts, level, rng):
+    # Unique texts (tagged with the level so earlier levels' cache entries don't match), with the
+    # requested shares of repeats and too-short inputs
+    sent = []
+    for i in range(args.requests):
+        roll = rng.random()
+        if sent and roll < args.repeat_share:
+            text = rng.choice(sent)
+        elif roll < args.repeat_share + args.short_share:
+            text = "too short to classify"
+        else:
+            text = f"{texts[i % len(texts)]} run{level}x{i}"
+            sent.append(text)
+        yield text
+
+
+async def run_level(client, texts, concurrency, rng):
+    pending = iter(make_requests(texts, concurrency, rng))
+    latencies, statuses = [], {}
+
+    async def client_loop():
+        for text in pending:
+            start = time.perf_counter()
+            response = await client.post("/predict", json={"text": text})
+            latencies.append(time.perf_counter() - start)
+            status = "error" if response.status_code != 200 else ("rejected" if "error" in response.json() else "ok")
+            statuses[status] = statuses.get(status, 0) + 1
+
+    batches_before = routes.batcher.stats()
+    start = time.perf_counter()
+    await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+    seconds = time.perf_counter() - start
+    batches_after = routes.batcher.stats()
+
+    batches = batches_after["batches"] - batches_before["batches"]
+    items = batches_after["items"] - batches_before["items"]
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "seconds": seconds,
+        "requests_per_second": len(latencies) / seconds,
+        **{name + "_ms": 1000 * value for name, value in percentiles(latencies).items()},
+        "mean_ms": 1000 * sum(latencies) / len(latencies),
+        "max_ms": 1000 * max(latencies),
+        "statuses": statuses,
+        "batches": batches,
+        "mean_batch_size": items / batches if batches else 0.0,
+    }
+
+
+async def main():
+    rng = random.Random(args.seed)
+    source, texts = benchmark_texts(args.requests, seed=args.seed)
+    print(f"📝 {len(texts)} {source} texts")
+
+    # The ASGI transport doesn't send lifespan events, so load the model and index here
+    print("🔁 Loading model and index...")
+    await routes.load_in_background()
+    if not routes.is_ready():
+        sys.exit(f"Loading failed: {routes.startup['error']}")
+
+    results = []
+    transport = httpx.ASGITransport(app=fastapi_app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=None) as client:
+        for i in range(args.warmup):
+            await client.post("/predict", json={"text": f"{texts[i % len(texts)]} warmup{i}"})
+        for concurrency in args.concurrency:
+            row = await run_level(client, texts, concurrency, rng)
+            results.append(row)
+            print(f"  concurrency {concurrency}: {row['requests_per_second']:.1f} req/s, p99 {row['p99_ms']:.1f} ms")
+
+    routes.executor.shutdown()
+    routes.feedback_sink.close()
+
+    print(f"\n{'clients':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'batch':>8}  statuses")
+    for row in results:
+        print(f"{row['concurrency']:>8}{row['requests_per_second']:>10.1f}{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}"
+              f"{row['p99_ms']:>10.1f}{row['mean_batch_size']:>8.1f}  {row['statuses']}")
+
+    save_results(args.output, {
+        "texts": source,
+        "offline": args.offline,
+        "requests_per_level": args.requests,
+        "repeat_share": args.repeat_share,
+        "short_share": args.short_share,
+        "results": results,
+        "cache": routes.prediction_cache.stats(),
+    })
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,146 @@
+"""
+Micro-benchmarks for the three stages of /predict, each measured on its own:
+  encode  the sentence encoder at several batch sizes (texts/s, ms per batch)
+  search  FAISS search over synthetic corpora of several sizes, built with models/index_factory.py
+  vote    the vectorised majority vote of models/knn.py at several batch sizes
+  prototype  the cluster-prototype fast path of models/prototypes.py (20 clusters), the same for any corpus size
+
+Every timing is the median of --repeats runs after one warm-up run. Results are saved as JSON together
+with the commit, machine and config.py settings (see common.py), so runs can be compared.
+
+Run from the repository root:
+  python benchmarks/serving_benchmark.py                       # encoder from config.ENCODER_BACKEND
+  python benchmarks/serving_benchmark.py --offline             # deterministic stand-in encoder, no download
+  python benchmarks/serving_benchmark.py --corpus-sizes 10000 100000 --index-type hnsw --k 10
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+parser = argparse.ArgumentParser(description="Encode / search / vote micro-benchmarks.")
+parser.add_argument("--offline", action="store_true", help="Use the 'hashing' stand-in encoder")
+parser.add_argument("--backend", help="Encoder backend (default: config.ENCODER_BACKEND)")
+parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 16, 64])
+parser.add_argument("--corpus-sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+parser.add_argument("--search-batch-sizes", type=int, nargs="+", default=[1, 16])
+parser.add_argument("--vote-batch-sizes", type=int, nargs="+", default=[1, 16, 256])
+parser.add_argument("--index-type", help="Index type for the search benchmark (default: config.INDEX_TYPE)")
+parser.add_argument("--metric", help="l2 or cosine (default: config.INDEX_METRIC)")
+parser.add_argument("--dimension", type=int, default=384, help="Dimension of the synthetic vectors")
+parser.add_argument("--k", type=int, help="Neighbours per query (default: config.K_NEIGHBORS)")
+parser.add_argument("--repeats", type=int, default=5)
+parser.add_argument("--output", default="benchmarks/results/serving_benchmark.json")
+args = parser.parse_args()
+
+# Before config.py is imported, so ENCODER_BACKEND (and the results' environment) reflect it
+if args.offline:
+    os.environ["ENCODER_BACKEND"] = "hashing"
+elif args.backend:
+    os.environ["ENCODER_BACKEND"] = args.backend
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import numpy as np
+from config import K_NEIGHBORS, INDEX_TYPE, INDEX_METRIC
+from encoders import get_encoder
+from models.index_factory import build_index, prepare_vectors
+from models.knn import neighbor_labels, majority_vote
+from models.prototypes import PrototypeClassifier
+from benchmarks.common import benchmark_texts, save_results
+
+k = args.k or K_NEIGHBORS
+index_type = args.index_type or INDEX_TYPE
+metric = args.metric or INDEX_METRIC
+
+
+def median_seconds(fn):
+    fn()
+    runs = []
+    for _ in range(args.repeats):
+        start = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - start)
+    return statistics.median(runs)
+
+
+# ----------------------
+# Encode
+# ----------------------
+print("🔁 Loading encoder...")
+encoder = get_encoder()
+source, texts = benchmark_texts(max(args.batch_sizes))
+print(f"📝 {len(texts)} {source} texts")
+
+encode_results = []
+for batch_size in args.batch_sizes:
+    batch = texts[:batch_size]
+    seconds = median_seconds(lambda: encoder.encode(batch, batch_size=batch_size))
+    encode_results.append({"batch_size": batch_size, "ms_per_batch": 1000 * seconds, "texts_per_second": batch_size / seconds})
+
+# ----------------------
+# Search (synthetic vectors, so any corpus size can be tried)
+# ----------------------
+rng = np.random.default_rng(42)
+search_results = []
+for corpus_size in args.corpus_sizes:
+    corpus = rng.standard_normal((corpus_size, args.dimension)).astype(np.float32)
+    start = time.perf_counter()
+    index = build_index(corpus, index_type, metric)
+    build_seconds = time.perf_counter() - start
+    for batch_size in args.search_batch_sizes:
+        queries = prepare_vectors(rng.standard_normal((batch_size, args.dimension)).astype(np.float32), metric)
+        seconds = median_seconds(lambda: index.search(queries, k))
+        search_results.append({"corpus_size": corpus_size, "batch_size": batch_size, "build_seconds": build_seconds,
+                               "ms_per_batch": 1000 * seconds, "queries_per_second": batch_size / seconds})
+
+# ----------------------
+# Vote
+# ----------------------
+vote_results = []
+labels = rng.integers(0, 20, size=10000).astype(np.int16)
+for batch_size in args.vote_batch_sizes:
+    indices = rng.integers(0, len(labels), size=(batch_size, k))
+    seconds = median_seconds(lambda: majority_vote(neighbor_labels(labels, indices)))
+    vote_results.append({"batch_size": batch_size, "ms_per_batch": 1000 * seconds, "rows_per_second": batch_size / seconds})
+
+# ----------------------
+# Prototypes
+# ----------------------
+prototype_results = []
+prototypes = PrototypeClassifier(prepare_vectors(rng.standard_normal((20, args.dimension)).astype(np.float32), metric),
+                                 np.arange(20, dtype=np.int16), metric)
+for batch_size in args.search_batch_sizes:
+    queries = prepare_vectors(rng.standard_normal((batch_size, args.dimension)).astype(np.float32), metric)
+    seconds = median_seconds(lambda: prototypes.predict(queries))
+    prototype_results.append({"batch_size": batch_size, "ms_per_batch": 1000 * seconds, "queries_per_second": batch_size / seconds})
+
+# ----------------------
+# Report
+# ----------------------
+print(f"\nencode ({type(encoder).__name__})\n{'batch':>8}{'ms/batch':>12}{'texts/s':>12}")
+for row in encode_results:
+    print(f"{row['batch_size']:>8}{row['ms_per_batch']:>12.2f}{row['texts_per_second']:>12.0f}")
+
+print(f"\nsearch ({index_type}, {metric}, d={args.dimension}, k={k})\n{'corpus':>10}{'batch':>8}{'build s':>10}{'ms/batch':>12}{'queries/s':>12}")
+for row in search_results:
+    print(f"{row['corpus_size']:>10}{row['batch_size']:>8}{row['build_seconds']:>10.2f}{row['ms_per_batch']:>12.3f}"
+          f"{row['queries_per_second']:>12.0f}")
+
+print(f"\nvote (k={k})\n{'batch':>8}{'ms/batch':>12}{'rows/s':>12}")
+for row in vote_results:
+    print(f"{row['batch_size']:>8}{row['ms_per_batch']:>12.4f}{row['rows_per_second']:>12.0f}")
+
+print(f"\nprototype (20 clusters, {metric})\n{'batch':>8}{'ms/batch':>12}{'queries/s':>12}")
+for row in prototype_results:
+    print(f"{row['batch_size']:>8}{row['ms_per_batch']:>12.4f}{row['queries_per_second']:>12.0f}")
+
+save_results(args.output, {
+    "texts": source,
+    "repeats": args.repeats,
+    "encode": encode_results,
+    "search": {"index_type": index_type, "metric": metric, "dimension": args.dimension, "k": k, "results": search_results},
+    "vote": {"k": k, "results": vote_results},
+    "prototype": {"clusters": 20, "results": prototype_results},
+})
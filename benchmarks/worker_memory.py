@@ -0,0 +1,117 @@
+"""
+Memory per worker of a running serve.py (Linux: reads /proc/<pid>/smaps_rollup).
+
+RSS counts shared pages in full for every process, so adding up the workers' RSS overstates what they
+use. This reports for the master and each worker:
+  rss       resident memory, shared pages included
+  pss       proportional set size: shared pages divided between the processes sharing them
+  shared    pages still shared with the master (the copy-on-write model, index and labels)
+  private   pages only this process has (its own allocations plus pages it has written to)
+The sum of PSS is what the whole server really uses, and a worker's private memory is roughly what one
+more worker costs. Without sharing (uvicorn --workers N), every worker would hold its own copy, i.e.
+about the master's RSS each.
+
+Send some traffic first (--requests) so the workers have touched what they use when serving.
+
+Run from the repository root while serve.py is running:
+  python benchmarks/worker_memory.py                     # finds the serve.py master
+  python benchmarks/worker_memory.py --pid 1234 --requests 200 --url http://127.0.0.1:10000
+"""
+
+import argparse
+import json
+import os
+import sys
+import urllib.request
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks.common import benchmark_texts, save_results
+
+FIELDS = ["Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty", "Swap"]
+
+
+def find_master():
+    # The oldest Python process running serve.py (the master forks the others)
+    candidates = []
+    for pid in filter(str.isdigit, os.listdir("/proc")):
+        try:
+            with open(f"/proc/{pid}/cmdline", "rb") as f:
+                cmdline = f.read().split(b"\0")
+        except OSError:
+            continue
+        if (os.path.basename(cmdline[0]).startswith(b"python") and any(part.endswith(b"serve.py") for part in cmdline)
+                and int(pid) != os.getpid()):
+            candidates.append(int(pid))
+    return min(candidates) if candidates else None
+
+
+def children(pid):
+    with open(f"/proc/{pid}/task/{pid}/children", "r") as f:
+        return [int(child) for child in f.read().split()]
+
+
+def memory_kb(pid):
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup", "r") as f:
+        for line in f:
+            name, _, rest = line.partition(":")
+            if name in FIELDS:
+                values[name] = int(rest.split()[0])
+    return {
+        "rss": values.get("Rss", 0),
+        "pss": values.get("Pss", 0),
+        "shared": values.get("Shared_Clean", 0) + values.get("Shared_Dirty", 0),
+        "private": values.get("Private_Clean", 0) + values.get("Private_Dirty", 0),
+        "swap": values.get("Swap", 0),
+    }
+
+
+def send_requests(url, count):
+    _, texts = benchmark_texts(count)
+    for i, text in enumerate(texts):
+        body = json.dumps({"text": f"{text} memory{i}"}).encode("utf-8")
+        request = urllib.request.Request(f"{url}/predict", data=body, headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request) as response:
+            response.read()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Memory per worker of serve.py (smaps_rollup).")
+    parser.add_argument("--pid", type=int, help="serve.py master pid (default: found from /proc)")
+    parser.add_argument("--requests", type=int, default=0, help="/predict requests to send before measuring")
+    parser.add_argument("--url", default="http://127.0.0.1:10000")
+    parser.add_argument("--output", default="benchmarks/results/worker_memory.json")
+    args = parser.parse_args()
+
+    master = args.pid or find_master()
+    if master is None:
+        sys.exit("No serve.py process found: start it first or pass --pid.")
+    if args.requests:
+        print(f"📨 Sending {args.requests} requests to {args.url}...")
+        send_requests(args.url, args.requests)
+
+    master_memory = memory_kb(master)
+    workers = {pid: memory_kb(pid) for pid in children(master)}
+    if not workers:
+        sys.exit(f"Process {master} has no workers.")
+
+    print(f"\n{'process':<16}{'RSS MB':>10}{'PSS MB':>10}{'shared MB':>11}{'private MB':>12}")
+    for name, memory in [(f"master {master}", master_memory)] + [(f"worker {pid}", m) for pid, m in workers.items()]:
+        print(f"{name:<16}{memory['rss'] / 1024:>10.1f}{memory['pss'] / 1024:>10.1f}"
+              f"{memory['shared'] / 1024:>11.1f}{memory['private'] / 1024:>12.1f}")
+
+    total_pss = master_memory["pss"] + sum(m["pss"] for m in workers.values())
+    mean_private = sum(m["private"] for m in workers.values()) / len(workers)
+    without_sharing = len(workers) * master_memory["rss"]
+    print(f"\nTotal (sum of PSS):            {total_pss / 1024:.1f} MB for {len(workers)} worker(s)")
+    print(f"Added per worker (private):    {mean_private / 1024:.1f} MB")
+    print(f"Unshared estimate ({len(workers)} x master RSS): {without_sharing / 1024:.1f} MB")
+
+    save_results(args.output, {
+        "requests_sent": args.requests,
+        "master": {"pid": master, **master_memory},
+        "workers": [{"pid": pid, **memory} for pid, memory in workers.items()],
+        "total_pss_kb": total_pss,
+        "mean_worker_private_kb": mean_private,
+        "unshared_estimate_kb": without_sharing,
+    })
@@ -10,12 +10,100 @@ ENVIRONMENT = os.getenv("ENV", "development")
 FAISS_INDEX_PATH = "cluster_index.faiss"
 LABELS_JSON = "id_to_label.json"
 INDEX_MAP_JSON = "index_map.json"
+RESPONSES_JSON = "app/responses.json"
+
+# Serving bundle written by models/5train_model.py (see artifacts.py).
+# The loose files above are only used when no bundle has been built yet.
+BUNDLE_DIR = "serving_bundle"
+# Re-check the bundle checksum whenever it is opened (startup and hot reload). This reads every file,
+# so it is off by default; the counts and dimensions in the manifest are always checked.
+BUNDLE_VERIFY_CHECKSUM = os.getenv("BUNDLE_VERIFY_CHECKSUM", "0") == "1"
 
 # Model settings
 EMBEDDING_MODEL = "all-MiniLM-L6-v2"
 
+# Encoder backend: "sentence-transformers" (PyTorch), "onnx" or "onnx-int8" (ONNX Runtime, CPU).
+# The ONNX backends need the export produced by models/export_onnx.py.
+# "hashing" is a deterministic stand-in without a model, for offline benchmarks (benchmarks/load_test.py).
+ENCODER_BACKEND = os.getenv("ENCODER_BACKEND", "sentence-transformers")
+ONNX_MODEL_DIR = os.path.join("onnx_model", EMBEDDING_MODEL)
+
 # kNN
 K_NEIGHBORS = 6
 
+# kNN index built by models/5train_model.py (see models/index_factory.py).
+# INDEX_TYPE: "flat" (exact), "ivf_flat", "ivf_pq" or "hnsw"; INDEX_METRIC: "l2" or "cosine".
+INDEX_TYPE = os.getenv("INDEX_TYPE", "flat")
+INDEX_METRIC = os.getenv("INDEX_METRIC", "l2")
+INDEX_NLIST = int(os.getenv("INDEX_NLIST", 256))      # IVF: number of inverted lists
+INDEX_PQ_M = int(os.getenv("INDEX_PQ_M", 48))         # IVF-PQ: sub-quantizers (must divide the embedding dimension)
+INDEX_HNSW_M = int(os.getenv("INDEX_HNSW_M", 32))     # HNSW: links per node
+# Search-time settings, applied whenever an index is loaded
+INDEX_NPROBE = int(os.getenv("INDEX_NPROBE", 16))     # IVF: lists scanned per query
+INDEX_EF_SEARCH = int(os.getenv("INDEX_EF_SEARCH", 64))  # HNSW: candidates kept per query
+
+# Cluster-prototype fast path (see models/prototypes.py): inputs whose best cluster beats the second
+# by at least this margin skip the kNN search. Unset: the margin chosen by 5train_model.py
+# (stored in the bundle); "inf": always use kNN.
+PROTOTYPE_MARGIN = float(os.environ["PROTOTYPE_MARGIN"]) if os.getenv("PROTOTYPE_MARGIN") else None
+
+# Cluster names (shown in the interface and stored in the serving bundle)
+CLUSTER_LABELS = {
+    "0": "Struggles and victories with self-care",
+    "1": "Self-harm and strong emotions",
+    "2": "Struggles with medication",
+    "3": "Experiences of anxiety",
+    "4": "Anxieties about being seen or judged",
+    "5": "Frustrations with being invalidated, misrepresented or misunderstood",
+    "6": "System fatigue and loss of hope",
+    "7": "Night drift: Sleep as escape, day as burden",
+    "8": "Cognitive fog and self-erosion",
+    "9": "Disordered thoughts and dissociation",
+    "10": "Cycles of emotional instability and identity confusion",
+    "11": "Existential confusion and obsessive fears",
+    "12": "Still functioning but emotionally exhausted",
+    "13": "Push and pull in relationships and coping by destroying",
+    "14": "Suicidal feelings and wishing not to exist",
+    "15": "Moments that saved me",
+    "20": "What is wrong with me?"
+}
+
 # Input requirements
 MIN_WORD_COUNT = 50
+
+# Micro-batching for /predict: concurrent requests are collected for up to
+# BATCH_WINDOW_MS milliseconds (or until BATCH_MAX_SIZE texts are waiting)
+# and encoded/searched together
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", 16))
+BATCH_WINDOW_MS = float(os.getenv("BATCH_WINDOW_MS", 10))
+
+# Inference executor: encoding and FAISS search run here instead of on the event loop.
+# INFERENCE_MODE is "thread" (shared model) or "process" (one model copy per worker).
+# Keep INFERENCE_WORKERS * INFERENCE_THREADS close to the number of cores.
+INFERENCE_MODE = os.getenv("INFERENCE_MODE", "thread")
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", 1))
+INFERENCE_THREADS = int(os.getenv("INFERENCE_THREADS", max(1, (os.cpu_count() or 1) // INFERENCE_WORKERS)))
+
+# /predict cache (hashes and vectors only, never raw text). Set PREDICTION_CACHE_SIZE=0 to disable.
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", 1024))
+PREDICTION_CACHE_TTL_SECONDS = float(os.getenv("PREDICTION_CACHE_TTL_SECONDS", 3600))
+
+# Seconds a client is asked to wait (Retry-After) while the model is still loading
+STARTUP_RETRY_AFTER_SECONDS = int(os.getenv("STARTUP_RETRY_AFTER_SECONDS", 10))
+
+# Hot reload of the index, labels and responses without a restart (see routes.reload_artifacts): the
+# bundle's CURRENT pointer (or the loose files) is checked every ARTIFACT_POLL_SECONDS (0: never), and
+# POST /admin/reload reloads on demand with the header X-Admin-Token: ADMIN_TOKEN (disabled if unset)
+ARTIFACT_POLL_SECONDS = float(os.getenv("ARTIFACT_POLL_SECONDS", 30))
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+# Feedback log (/feedback and the CLI): records are appended in batches by a background writer,
+# once FEEDBACK_FLUSH_SIZE are waiting or after FEEDBACK_FLUSH_SECONDS, and on shutdown
+FEEDBACK_LOG_PATH = os.getenv("FEEDBACK_LOG_PATH", "feedback_log.csv")
+FEEDBACK_FLUSH_SIZE = int(os.getenv("FEEDBACK_FLUSH_SIZE", 50))
+FEEDBACK_FLUSH_SECONDS = float(os.getenv("FEEDBACK_FLUSH_SECONDS", 5))
+
+# Latency histograms and counters (metrics.py), served at /metrics in the Prometheus text format.
+# METRICS_LOG_JSON also writes one JSON log line per request and per /predict batch.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+METRICS_LOG_JSON = os.getenv("METRICS_LOG_JSON", "0") == "1"
@@ -0,0 +1,172 @@
+# encoders.py
+# Pluggable sentence encoders. Every backend takes a list of texts and returns a
+# float32 numpy array of shape (len(texts), dimension), so routes.py and the
+# preprocessing/training scripts don't need to know which one is in use.
+#
+# Backends (config.ENCODER_BACKEND):
+#   "sentence-transformers" - the original PyTorch model
+#   "onnx"                  - ONNX Runtime export of the same model (models/export_onnx.py)
+#   "onnx-int8"             - the ONNX export with dynamically int8-quantized weights
+#   "hashing"               - deterministic stand-in without a model (offline benchmarks, see benchmarks/)
+
+import json
+import os
+import time
+import zlib
+import numpy as np
+from config import EMBEDDING_MODEL, ENCODER_BACKEND, ONNX_MODEL_DIR
+
+ONNX_FP32_FILE = "model.onnx"
+ONNX_INT8_FILE = "model-int8.onnx"
+ONNX_CONFIG_FILE = "encoder_config.json"
+# Same dimension as all-MiniLM-L6-v2, so the stand-in can search the real index
+HASHING_DIMENSION = 384
+
+
+class SentenceTransformerEncoder:
+    def __init__(self, model_name):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name)
+        self.dimension = self.model.get_sentence_embedding_dimension()
+        self.max_seq_length = self.model.max_seq_length
+        self.tokenizer = self.model.tokenizer
+        self.normalize = any(type(module).__name__ == "Normalize" for module in self.model)
+
+    def encode(self, texts, batch_size=32, show_progress_bar=False, timings=None):
+        # `timings`, if given, receives the seconds spent in "tokenize" and "forward" (see metrics.py)
+        if timings is not None:
+            return self._encode_timed(texts, batch_size, timings)
+        embeddings = self.model.encode(texts, batch_size=batch_size, show_progress_bar=show_progress_bar,
+                                       convert_to_numpy=True)
+        return np.asarray(embeddings, dtype=np.float32)
+
+    def _encode_timed(self, texts, batch_size, timings):
+        # The steps of SentenceTransformer.encode, run one by one so each can be timed
+        import torch
+        from sentence_transformers.util import batch_to_device
+
+        batches = []
+        timings.setdefault("tokenize", 0.0)
+        timings.setdefault("forward", 0.0)
+        for start in range(0, len(texts), batch_size):
+            started = time.perf_counter()
+            features = batch_to_device(self.model.tokenize(list(texts[start:start + batch_size])), self.model.device)
+            tokenized = time.perf_counter()
+            with torch.inference_mode():
+                embeddings = self.model.forward(features)["sentence_embedding"]
+            batches.append(embeddings.float().cpu().numpy())
+            timings["tokenize"] += tokenized - started
+            timings["forward"] += time.perf_counter() - tokenized
+
+        if not batches:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        return np.concatenate(batches).astype(np.float32)
+
+
+class OnnxEncoder:
+    # Reproduces the SentenceTransformer pipeline (tokenize -> transformer -> mean pooling -> normalize)
+    # around an exported transformer graph.
+    def __init__(self, model_dir, model_file=ONNX_FP32_FILE):
+        try:
+            import onnxruntime as ort
+            from transformers import AutoTokenizer
+        except ImportError as e:
+            raise ImportError(f"The ONNX encoder backends need {e.name}, which is not installed: "
+                              f"pip install -r requirements-onnx.txt") from e
+
+        model_path = os.path.join(model_dir, model_file)
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"{model_path} not found. Run models/export_onnx.py first.")
+
+        with open(os.path.join(model_dir, ONNX_CONFIG_FILE), "r", encoding="utf-8") as f:
+            encoder_config = json.load(f)
+        self.dimension = encoder_config["dimension"]
+        self.max_seq_length = encoder_config["max_seq_length"]
+        self.normalize = encoder_config["normalize"]
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        # Respect the inference executor's thread limit (see inference.set_thread_limits)
+        options.intra_op_num_threads = int(os.environ.get("OMP_NUM_THREADS", 0))
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+
+    def encode(self, texts, batch_size=32, show_progress_bar=False, timings=None):
+        # `timings`, if given, receives the seconds spent in "tokenize" and "forward" (see metrics.py)
+        batches = []
+        tokenize_seconds = forward_seconds = 0.0
+        for start in range(0, len(texts), batch_size):
+            started = time.perf_counter()
+            features = self.tokenizer(list(texts[start:start + batch_size]), padding=True, truncation=True,
+                                      max_length=self.max_seq_length, return_tensors="np")
+            tokenized = time.perf_counter()
+            inputs = {name: features[name].astype(np.int64) for name in self.input_names}
+            token_embeddings = self.session.run(None, inputs)[0]
+
+            # Mean pooling over real (non-padding) tokens
+            mask = features["attention_mask"][..., None].astype(np.float32)
+            pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            if self.normalize:
+                pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            batches.append(pooled.astype(np.float32))
+            tokenize_seconds += tokenized - started
+            forward_seconds += time.perf_counter() - tokenized
+
+            if show_progress_bar:
+                print(f"  encoded {min(start + batch_size, len(texts))}/{len(texts)}", end="\r")
+
+        if timings is not None:
+            timings["tokenize"] = timings.get("tokenize", 0.0) + tokenize_seconds
+            timings["forward"] = timings.get("forward", 0.0) + forward_seconds
+        if not batches:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        return np.concatenate(batches)
+
+
+class HashingEncoder:
+    # Feature hashing of words into a fixed-size unit vector: no download, no model, and the same
+    # text always gives the same vector. Its neighbours mean nothing - it only stands in for the
+    # encoder when measuring the rest of the serving path.
+    def __init__(self, dimension=HASHING_DIMENSION):
+        self.dimension = dimension
+        self.max_seq_length = None
+        self.tokenizer = None
+        self.normalize = True
+
+    def encode(self, texts, batch_size=32, show_progress_bar=False, timings=None):
+        start = time.perf_counter()
+        hashes = [np.fromiter((zlib.crc32(word.encode("utf-8")) for word in text.lower().split()), dtype=np.int64)
+                  for text in texts]
+        tokenized = time.perf_counter()
+
+        embeddings = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, word_hashes in enumerate(hashes):
+            # The lowest bit picks the sign, the rest the dimension
+            np.add.at(embeddings[row], (word_hashes >> 1) % self.dimension, np.where(word_hashes & 1, 1.0, -1.0))
+        embeddings /= np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+
+        if timings is not None:
+            timings["tokenize"] = timings.get("tokenize", 0.0) + tokenized - start
+            timings["forward"] = timings.get("forward", 0.0) + time.perf_counter() - tokenized
+        return embeddings
+
+
+def get_encoder(backend=None, model_name=None):
+    backend = backend or ENCODER_BACKEND
+    model_name = model_name or EMBEDDING_MODEL
+
+    if backend == "sentence-transformers":
+        return SentenceTransformerEncoder(model_name)
+    if backend == "onnx":
+        return OnnxEncoder(ONNX_MODEL_DIR, ONNX_FP32_FILE)
+    if backend == "onnx-int8":
+        return OnnxEncoder(ONNX_MODEL_DIR, ONNX_INT8_FILE)
+    if backend == "hashing":
+        return HashingEncoder()
+    raise ValueError(f"Unknown encoder backend: {backend}")
+
+
+def encoder_version(backend=None, model_name=None):
+    # Identifies which vectors an encoder produces (used to invalidate cached embeddings)
+    return f"{model_name or EMBEDDING_MODEL}:{backend or ENCODER_BACKEND}"
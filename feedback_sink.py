@@ -0,0 +1,140 @@
+# feedback_sink.py
+# Write-behind log for user feedback, shared by the /feedback route and the CLI.
+# submit() only puts the record on an in-memory queue; a background thread appends queued
+# records to the CSV in batches, when FEEDBACK_FLUSH_SIZE records are waiting or
+# FEEDBACK_FLUSH_SECONDS have passed, and once more on close() (shutdown / exit).
+# A batch that fails to write is kept and retried with the next flush, up to MAX_WRITE_ATTEMPTS times.
+# Only the rating, the comment and the prediction are stored, never the text that was classified.
+
+import atexit
+import csv
+import datetime
+import os
+import queue
+import threading
+import time
+from logger import logger
+
+FEEDBACK_FIELDS = ["timestamp", "source", "predicted_cluster", "certainty", "rating", "feedback"]
+MAX_WRITE_ATTEMPTS = 5
+
+_STOP = object()
+
+
+class FeedbackSink:
+    def __init__(self, path, flush_size=50, flush_seconds=5.0):
+        self.path = path
+        self.flush_size = flush_size
+        self.flush_seconds = flush_seconds
+        self.queue = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+        self.counts = {"submitted": 0, "written": 0, "flushes": 0, "errors": 0, "dropped": 0}
+
+    def start(self):
+        with self.lock:
+            if self.thread is None:
+                self.prepare_file()
+                self.thread = threading.Thread(target=self._run, name="feedback-writer", daemon=True)
+                self.thread.start()
+                atexit.register(self.close)
+
+    def submit(self, source, rating, feedback, predicted_cluster=None, certainty=None):
+        self.start()
+        self.counts["submitted"] += 1
+        self.queue.put({
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "source": source,
+            "predicted_cluster": "" if predicted_cluster is None else predicted_cluster,
+            "certainty": "" if certainty is None else certainty,
+            "rating": "" if rating is None else rating,
+            "feedback": feedback or "",
+        })
+
+    def close(self):
+        # Writes everything still queued and stops the writer thread
+        with self.lock:
+            thread, self.thread = self.thread, None
+        if thread is not None:
+            self.queue.put(_STOP)
+            thread.join()
+
+    def stats(self):
+        return {**self.counts, "queued": self.queue.qsize()}
+
+    def prepare_file(self):
+        # New file: header. Older log without the header (timestamp,rating,feedback): rewritten once in this schema.
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if os.path.exists(self.path) and os.path.getsize(self.path):
+            with open(self.path, "r", encoding="utf-8", newline="") as f:
+                rows = list(csv.reader(f))
+            if rows[0] == FEEDBACK_FIELDS:
+                return
+            with open(self.path + ".tmp", "w", encoding="utf-8", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(FEEDBACK_FIELDS)
+                for row in rows:
+                    timestamp, rating, feedback = (row + ["", "", ""])[:3]
+                    writer.writerow([timestamp, "web", "", "", rating, ",".join([feedback] + row[3:])])
+            os.replace(self.path + ".tmp", self.path)
+            logger.info(f"🧾 Converted {len(rows)} feedback rows in {self.path} to the new schema.")
+            return
+        with open(self.path, "w", encoding="utf-8", newline="") as f:
+            csv.writer(f).writerow(FEEDBACK_FIELDS)
+
+    def _run(self):
+        batch = []
+        deadline = None
+        stopping = False
+        failures = 0
+        while not stopping:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                record = self.queue.get(timeout=timeout)
+                if record is _STOP:
+                    stopping = True
+                else:
+                    batch.append(record)
+                    if deadline is None:
+                        deadline = time.monotonic() + self.flush_seconds
+            except queue.Empty:
+                pass
+            # Take whatever else is already waiting without blocking
+            while not stopping and len(batch) < self.flush_size:
+                try:
+                    record = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if record is _STOP:
+                    stopping = True
+                else:
+                    batch.append(record)
+            due = deadline is not None and time.monotonic() >= deadline
+            # After a failed write, wait for the deadline rather than retrying on every new record
+            if batch and (stopping or due or (not failures and len(batch) >= self.flush_size)):
+                if self._write(batch):
+                    batch, deadline, failures = [], None, 0
+                    continue
+                failures += 1
+                if stopping or failures >= MAX_WRITE_ATTEMPTS:
+                    self.counts["dropped"] += len(batch)
+                    logger.error(f"Dropping {len(batch)} feedback records after {failures} failed writes.")
+                    batch, deadline, failures = [], None, 0
+                else:
+                    # Kept for the next flush, together with whatever is submitted meanwhile
+                    deadline = time.monotonic() + self.flush_seconds
+
+    def _write(self, batch):
+        # True once the batch is on disk
+        try:
+            with open(self.path, "a", encoding="utf-8", newline="") as f:
+                csv.DictWriter(f, fieldnames=FEEDBACK_FIELDS).writerows(batch)
+            self.counts["written"] += len(batch)
+            self.counts["flushes"] += 1
+            return True
+        except Exception as e:
+            self.counts["errors"] += 1
+            logger.error(f"Writing {len(batch)} feedback records to {self.path} failed: {e}")
+            return False
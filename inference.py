@@ -0,0 +1,94 @@
+# inference.py
+# Dedicated executor for the CPU-bound parts of /predict (embedding and FAISS search),
+# so they never run on the asyncio event loop and block /feedback, /umap or /.
+
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import multiprocessing
+from logger import logger
+
+
+def set_thread_limits(num_threads):
+    # Intra-op threads used by torch (the encoder) and OpenMP (FAISS) in this process
+    os.environ["OMP_NUM_THREADS"] = str(num_threads)
+    os.environ["MKL_NUM_THREADS"] = str(num_threads)
+    try:
+        import torch
+        torch.set_num_threads(num_threads)
+    except ImportError:
+        pass
+    try:
+        import faiss
+        faiss.omp_set_num_threads(num_threads)
+    except ImportError:
+        pass
+
+
+def _init_process_worker(num_threads, initializer, initargs):
+    set_thread_limits(num_threads)
+    if initializer is not None:
+        initializer(*initargs)
+
+
+class InferenceExecutor:
+    def __init__(self, mode="thread", workers=1, threads_per_worker=1, initializer=None, initargs=()):
+        if mode not in ("thread", "process"):
+            raise ValueError(f"Unknown inference mode: {mode}")
+        self.mode = mode
+        self.workers = max(1, int(workers))
+        self.threads_per_worker = max(1, int(threads_per_worker))
+        self.initializer = initializer
+        self.initargs = initargs
+        self.pool = None
+
+    def _process_pool(self):
+        # Each process loads its own copy of the model; "spawn" avoids forking torch/OpenMP state.
+        # Functions sent to the pool must be module-level so they can be pickled by reference.
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_process_worker,
+            initargs=(self.threads_per_worker, self.initializer, self.initargs),
+        )
+
+    def start(self):
+        if self.pool is not None:
+            return
+        if self.mode == "thread":
+            # torch and FAISS thread pools are process-wide, so they are set once here
+            set_thread_limits(self.threads_per_worker)
+            self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="inference")
+        else:
+            self.pool = self._process_pool()
+        logger.info(f"⚙️ Inference executor started: {self.mode} mode, {self.workers} worker(s), "
+                    f"{self.threads_per_worker} thread(s) each.")
+
+    async def run(self, fn, *args):
+        if self.pool is None:
+            self.start()
+        return await asyncio.get_running_loop().run_in_executor(self.pool, fn, *args)
+
+    async def replace_workers(self, warmup):
+        # Process mode: starts a new set of workers (which run the initializer again, e.g. to load new
+        # artifacts), runs `warmup` on them, then hands new calls to them. Calls already running on the
+        # old workers finish before those are shut down. Returns the warmup results (None in thread mode).
+        if self.mode == "thread" or self.pool is None:
+            return None
+        pool = self._process_pool()
+        loop = asyncio.get_running_loop()
+        # One call per worker: a spawn pool starts a process for each call submitted while none is idle
+        try:
+            results = await asyncio.gather(*[loop.run_in_executor(pool, warmup) for _ in range(self.workers)])
+        except Exception:
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+        old, self.pool = self.pool, pool
+        loop.run_in_executor(None, old.shutdown)
+        logger.info(f"⚙️ Inference workers replaced ({self.workers} process(es)).")
+        return results
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=True, cancel_futures=True)
+            self.pool = None
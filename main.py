@@ -1,5 +1,10 @@
+import time
+_import_start = time.perf_counter()
+
 import os
-from routes import router
+import asyncio
+import routes
+from routes import router, executor, feedback_sink
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.wsgi import WSGIMiddleware
@@ -8,6 +13,8 @@ from fastapi.staticfiles import StaticFiles
 from starlette.responses import JSONResponse
 from logger import logger
 
+routes.startup["timings"]["import"] = time.perf_counter() - _import_start
+
 # Create FastAPI app
 logger.info("Starting FastAPI application...")
 fastapi_app = FastAPI()
@@ -29,6 +36,23 @@ logger.info("CORS middleware configured.")
 fastapi_app.include_router(router)
 logger.info("Router attached.")
 
+# Load the model, index and labels in the background so the server binds immediately.
+# /readyz reports when loading has finished.
+@fastapi_app.on_event("startup")
+async def start_loading():
+    fastapi_app.state.loading_task = asyncio.create_task(routes.load_in_background())
+    logger.info("Model and index loading in the background.")
+    # Reloads the index, labels and responses when they change on disk (ARTIFACT_POLL_SECONDS)
+    fastapi_app.state.watch_task = asyncio.create_task(routes.watch_artifacts())
+
+# Stop the inference workers cleanly when uvicorn shuts down, and write any queued feedback
+@fastapi_app.on_event("shutdown")
+async def shutdown_inference():
+    executor.shutdown()
+    logger.info("Inference executor stopped.")
+    feedback_sink.close()
+    logger.info("Feedback log flushed.")
+
 # Route to serve the HTML interface
 @fastapi_app.get("/", response_class=HTMLResponse)
 async def serve_ui():
@@ -0,0 +1,142 @@
+# metrics.py
+# Lightweight latency histograms and counters for the web app, exposed in the Prometheus
+# text format at /metrics and, with METRICS_LOG_JSON, as one JSON log line per request/batch.
+#
+# Stages of /predict (recorded per batch, see routes.predict_batch):
+#   tokenize, forward  - the encoder (forward includes pooling and normalisation)
+#   prototype          - scoring against the cluster prototypes (fast path, models/prototypes.py)
+#   search, vote       - the FAISS search and the majority vote over the neighbours' labels
+# With METRICS_ENABLED=0 every call below returns immediately and nothing is timed.
+
+import json
+import threading
+import time
+from config import METRICS_ENABLED, METRICS_LOG_JSON
+from logger import logger
+
+# Upper bounds (seconds) of the latency buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _label_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self.values = {}  # sorted label tuples -> value
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            lines += [f"{self.name}{_label_text(key)} {value}" for key, value in sorted(self.values.items())]
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self.values = {}  # sorted label tuples -> [count per bucket..., +Inf count, sum]
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            counts = self.values.get(key)
+            if counts is None:
+                counts = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[len(self.buckets)] += 1
+            counts[-1] += value
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for key, counts in sorted(self.values.items()):
+                for bound, count in zip(self.buckets + ("+Inf",), counts):
+                    lines.append(f"{self.name}_bucket{_label_text(key + (('le', bound),))} {count}")
+                lines.append(f"{self.name}_sum{_label_text(key)} {counts[-1]:.6f}")
+                lines.append(f"{self.name}_count{_label_text(key)} {counts[len(self.buckets)]}")
+        return lines
+
+
+class _Timer:
+    # with histogram.time(route="predict"): ...  (observes the elapsed seconds on exit)
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+        self.start = None
+
+    def __enter__(self):
+        if METRICS_ENABLED:
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self.start is not None:
+            self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+request_seconds = Histogram("request_duration_seconds", "Time to answer a request, by route.")
+stage_seconds = Histogram("predict_stage_duration_seconds", "Time spent per /predict batch in each stage.")
+batch_seconds = Histogram("predict_batch_duration_seconds", "Time to encode, search and vote one batch.")
+rejections = Counter("predict_rejections_total", "Requests /predict turned away, by reason.")
+errors = Counter("request_errors_total", "Requests that failed with an internal error, by route.")
+prediction_sources = Counter("predict_results_total", "Answered /predict requests, by where the result came from.")
+artifact_reloads = Counter("artifact_reloads_total", "Hot reloads of the serving artifacts, by result.")
+prediction_paths = Counter("predict_paths_total", "Batch predictions by path: cluster prototypes or kNN search.")
+
+METRICS = [request_seconds, stage_seconds, batch_seconds, rejections, errors, prediction_sources, prediction_paths,
+           artifact_reloads]
+
+
+def record_stages(timings):
+    # timings: stage -> seconds, as filled in by the encoder and ServingState.search_and_vote
+    for stage, seconds in timings.items():
+        stage_seconds.observe(seconds, stage=stage)
+
+
+def log_event(event, **fields):
+    # Structured log line (METRICS_LOG_JSON=1), e.g. {"event": "request", "route": "predict", ...}
+    if METRICS_ENABLED and METRICS_LOG_JSON:
+        logger.info(json.dumps({"event": event, **fields}, separators=(",", ":")))
+
+
+def render(stats=None):
+    """
+    All metrics in the Prometheus text format. `stats` adds the counters kept elsewhere
+    (e.g. the batcher, cache and feedback writer) as {"section": {"name": number, ...}}:
+    each number becomes the gauge `<section>_<name>`.
+    """
+    lines = []
+    for metric in METRICS:
+        lines += metric.render()
+    for section, values in (stats or {}).items():
+        for name, value in values.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            metric_name = f"{section}_{name}"
+            lines += [f"# TYPE {metric_name} gauge", f"{metric_name} {value}"]
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,132 @@
+"""
+Assigns newly scraped posts to the existing clusters without refitting UMAP or HDBSCAN.
+
+Uses the reducer and clusterer saved by `python models/4cluster.py --persist-run N`:
+- only posts in cleaned_posts.json that are not yet in the clustered output are embedded
+- they are projected with the saved UMAP reducer (umap_model.transform)
+- and labelled with hdbscan.approximate_predict, which also gives a membership strength (0-1)
+The new posts are appended to the clustered output JSON of the persisted run.
+
+Drift: if the share of new posts labelled noise (-1), or assigned with low membership strength,
+is well above what the original fit produced, the clusters no longer describe the new posts
+and a full re-run of 4cluster.py is recommended.
+
+Run from the repository root:  python models/4b_assign_new_posts.py [--dry-run]
+"""
+
+import argparse
+import json
+import os
+import sys
+from datetime import datetime, timezone
+import numpy as np
+import joblib
+import hdbscan
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import ENCODER_BACKEND
+from encoders import get_encoder, encoder_version
+from models.cluster_sweep import CLUSTER_MODEL_DIR, LOW_STRENGTH
+
+parser = argparse.ArgumentParser(description="Assign new posts to the persisted UMAP + HDBSCAN clusters.")
+parser.add_argument("--posts", default="data/processed/cleaned_posts.json")
+parser.add_argument("--model-dir", default=CLUSTER_MODEL_DIR)
+parser.add_argument("--min-strength", type=float, default=LOW_STRENGTH,
+                    help="Membership strength below which an assignment counts as low-strength")
+parser.add_argument("--drift-margin", type=float, default=0.10,
+                    help="Flag drift when a share exceeds the original fit's share by more than this")
+parser.add_argument("--dry-run", action="store_true", help="Report assignments and drift without saving")
+args = parser.parse_args()
+
+# ----------------------
+# Load the persisted models and the clustered output
+# ----------------------
+with open(os.path.join(args.model_dir, "manifest.json"), "r", encoding="utf-8") as f:
+    manifest = json.load(f)
+umap_model = joblib.load(os.path.join(args.model_dir, "umap_reducer.joblib"))
+clusterer = joblib.load(os.path.join(args.model_dir, "hdbscan_clusterer.joblib"))
+
+clustered_path = manifest["clustered_path"]
+with open(clustered_path, "r", encoding="utf-8") as f:
+    clustered = json.load(f)
+clustered_ids = {post["id"] for post in clustered}
+
+with open(args.posts, "r", encoding="utf-8") as f:
+    posts = json.load(f)
+new_posts = [post for post in posts if post["id"] not in clustered_ids]
+print(f"🧩 Run {manifest['run']}: {len(clustered)} posts already clustered, {len(new_posts)} new.")
+if not new_posts:
+    sys.exit(0)
+
+# ----------------------
+# Embed, project and assign the new posts only
+# ----------------------
+model = get_encoder()
+print(f"🔍 Encoding {len(new_posts)} new posts ({ENCODER_BACKEND})...")
+embeddings = model.encode([post["text"] for post in new_posts], show_progress_bar=True)
+
+reduced = umap_model.transform(embeddings)
+labels, strengths = hdbscan.approximate_predict(clusterer, reduced)
+
+assigned_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+new_entries = []
+for post, point, label, strength in zip(new_posts, reduced, labels, strengths):
+    new_entries.append({
+        "id": post["id"],
+        "subreddit": post["subreddit"],
+        "category": post["category"],
+        "cluster": int(label),
+        "x": float(point[0]),
+        "y": float(point[1]),
+        "membership_strength": float(strength),
+        "assigned": "incremental",
+        "assigned_at": assigned_at,
+    })
+
+# ----------------------
+# Drift check against the original fit
+# ----------------------
+noise_share = float(np.mean(labels == -1))
+assigned = labels != -1
+low_strength_share = float(np.mean(strengths[assigned] < args.min_strength)) if assigned.any() else 0.0
+drift = {
+    "noise_share": noise_share,
+    "baseline_noise_share": manifest["noise_share"],
+    "low_strength_share": low_strength_share,
+    "baseline_low_strength_share": manifest["low_strength_share"],
+}
+drifted = (noise_share > manifest["noise_share"] + args.drift_margin
+           or low_strength_share > manifest["low_strength_share"] + args.drift_margin)
+
+print(f"  Noise share: {noise_share:.3f} (original fit {manifest['noise_share']:.3f})")
+print(f"  Low-strength share (< {args.min_strength}): {low_strength_share:.3f} "
+      f"(original fit {manifest['low_strength_share']:.3f})")
+if drifted:
+    print("⚠️ Drift: the new posts fit the existing clusters noticeably worse than the original corpus. "
+          "Consider a full re-run of 4cluster.py.")
+else:
+    print("✅ No drift: new posts fit the existing clusters about as well as the original corpus.")
+
+if args.dry_run:
+    sys.exit(0)
+
+# ----------------------
+# Append to the clustered output and log the assignment
+# ----------------------
+tmp_path = clustered_path + ".tmp"
+with open(tmp_path, "w", encoding="utf-8") as f:
+    json.dump(clustered + new_entries, f, ensure_ascii=False, indent=2)
+os.replace(tmp_path, clustered_path)
+
+log_path = os.path.join(args.model_dir, "assignment_log.jsonl")
+with open(log_path, "a", encoding="utf-8") as f:
+    f.write(json.dumps({
+        "assigned_at": assigned_at,
+        "encoder": encoder_version(),
+        "num_posts": len(new_entries),
+        **drift,
+        "drift": drifted,
+    }) + "\n")
+
+print(f"✅ Appended {len(new_entries)} posts to {clustered_path}")
+print(f"🧾 Drift logged to {log_path}")
@@ -1,21 +1,26 @@
 import numpy as np
 import json
 import os
+import sys
+import argparse
+import matplotlib
+matplotlib.use("Agg")
 import matplotlib.pyplot as plt
 import seaborn as sns
-import umap.umap_ as umap
-import hdbscan
 import pandas as pd
 import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from models.cluster_sweep import (embeddings_hash, reduce_cached, fit_hdbscan, run_key, load_sweep_state,
+                                  append_sweep_state, persist_cluster_model, UMAP_CACHE_DIR, SWEEP_STATE_PATH,
+                                  CLUSTER_MODEL_DIR)
 
 # Load embeddings and metadata
 embedding_path = "data/processed/post_embeddings.npy"
 metadata_path = "data/processed/post_metadata.json"
 
-embeddings = np.load(embedding_path)
-with open(metadata_path, "r", encoding="utf-8") as f:
-    metadata = json.load(f)
-
 # Define UMAP parameter grid
 umap_n_neighbors = [10, 15, 30]
 umap_n_components = [2, 5]
@@ -29,103 +34,202 @@ hdbscan_prediction_data = True
 # Conditions to save outputs:
 # (a) noise (-1) count below 4000
 # (b) number of clusters (excluding noise) between 20 and 60 (inclusive)
-runs_meeting_conditions = 0
-run_number = 1
+max_noise_count = 4000
+min_clusters, max_clusters = 20, 60
 
 # Create output directory if not exists
 output_dir = "data/processed"
-os.makedirs(output_dir, exist_ok=True)
-
-# Iterate over all combinations of UMAP and HDBSCAN parameters
-for n_neighbors, n_components, min_dist in itertools.product(umap_n_neighbors, umap_n_components, umap_min_dist):
-    umap_params = {
-        "n_neighbors": n_neighbors,
-        "n_components": n_components,
-        "min_dist": min_dist,
-        "random_state": umap_random_state
-    }
-    for min_cluster_size in hdbscan_min_cluster_size:
-        hdbscan_params = {
-            "min_cluster_size": min_cluster_size,
-            "prediction_data": hdbscan_prediction_data
+
+
+def save_run_outputs(run_number, umap_params, hdbscan_params, umap_embeddings, cluster_labels, num_clusters,
+                     metadata, full_data, embeddings_digest):
+    # File names carry the embeddings hash as well as the run number, so a sweep over a new corpus
+    # doesn't overwrite the outputs of the previous one
+    run_name = f"run_{run_number}_{embeddings_digest[:8]}"
+    # Attach cluster labels and UMAP coordinates to metadata copy
+    run_metadata = []
+    for i, entry in enumerate(metadata):
+        new_entry = entry.copy()
+        new_entry["cluster"] = int(cluster_labels[i])
+        new_entry["x"] = float(umap_embeddings[i][0])
+        new_entry["y"] = float(umap_embeddings[i][1])
+        run_metadata.append(new_entry)
+
+    # Save clustered metadata to JSON
+    json_filename = os.path.join(output_dir, f"clustered_posts_{run_name}_tunedparameters.json")
+    with open(json_filename, "w", encoding="utf-8") as f:
+        json.dump(run_metadata, f, ensure_ascii=False, indent=2)
+
+    # Generate and save UMAP plot
+    plt.figure(figsize=(10, 8))
+    palette = sns.color_palette("hsv", len(set(cluster_labels)))
+    sns.scatterplot(x=umap_embeddings[:, 0], y=umap_embeddings[:, 1],
+                    hue=cluster_labels, palette=palette, legend="full", s=40, alpha=0.7)
+    plt.title(f"UMAP projection (Run {run_number})\nUMAP: {umap_params} | HDBSCAN: {hdbscan_params}\nClusters = {num_clusters}")
+    plt.xlabel("UMAP Dimension 1")
+    plt.ylabel("UMAP Dimension 2")
+    plt.tight_layout()
+    png_filename = os.path.join(output_dir, f"umap_clusters_{run_name}_tunedparameters.png")
+    plt.savefig(png_filename)
+    plt.close()
+
+    # Combine clustering results with original posts for Excel
+    rows = []
+    for i, entry in enumerate(run_metadata):
+        rows.append({
+            "id": full_data[i]["id"],
+            "cluster": entry["cluster"],
+            "subreddit": entry.get("subreddit", ""),
+            "text": full_data[i]["text"],
+            "label": ""
+        })
+    df = pd.DataFrame(rows)
+    xlsx_filename = os.path.join(output_dir, f"clustered_posts_labeled_{run_name}_tunedparameters.xlsx")
+    df.to_excel(xlsx_filename, index=False)
+
+    print(f"  Saved JSON: {json_filename}")
+    print(f"  Saved PNG: {png_filename}")
+    print(f"  Saved Excel: {xlsx_filename}")
+    return [json_filename, png_filename, xlsx_filename]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="UMAP + HDBSCAN hyperparameter sweep (cached, parallel, resumable).")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Processes used for HDBSCAN fits")
+    parser.add_argument("--cache-dir", default=UMAP_CACHE_DIR)
+    parser.add_argument("--state", default=SWEEP_STATE_PATH)
+    parser.add_argument("--restart", action="store_true", help="Ignore previously finished runs")
+    parser.add_argument("--persist-run", type=int,
+                        help="Save the UMAP reducer and HDBSCAN clusterer of this (finished) run for 4b_assign_new_posts.py")
+    parser.add_argument("--model-dir", default=CLUSTER_MODEL_DIR)
+    args = parser.parse_args()
+
+    embeddings = np.load(embedding_path)
+    with open(metadata_path, "r", encoding="utf-8") as f:
+        metadata = json.load(f)
+
+    # Load full cleaned post texts for Excel export
+    with open("data/processed/cleaned_posts.json", "r", encoding="utf-8") as f:
+        full_data = json.load(f)
+
+    os.makedirs(output_dir, exist_ok=True)
+    digest = embeddings_hash(embeddings)
+
+    # Number every run up front (same order as the original nested loops)
+    runs = []
+    umap_grid = itertools.product(umap_n_neighbors, umap_n_components, umap_min_dist)
+    for n_neighbors, n_components, min_dist in umap_grid:
+        umap_params = {
+            "n_neighbors": n_neighbors,
+            "n_components": n_components,
+            "min_dist": min_dist,
+            "random_state": umap_random_state
         }
-        print(f"Run {run_number}:")
-        print(f"  UMAP parameters: {umap_params}")
-        print(f"  HDBSCAN parameters: {hdbscan_params}")
-        
-        # Dimensionality reduction with UMAP
-        umap_model = umap.UMAP(**umap_params)
-        umap_embeddings = umap_model.fit_transform(embeddings)
-        
-        # Clustering with HDBSCAN
-        clusterer = hdbscan.HDBSCAN(**hdbscan_params)
-        cluster_labels = clusterer.fit_predict(umap_embeddings)
-        
-        noise_count = np.sum(cluster_labels == -1)
-        unique_clusters = set(cluster_labels)
-        num_clusters = len([c for c in unique_clusters if c != -1])
+        for min_cluster_size in hdbscan_min_cluster_size:
+            hdbscan_params = {
+                "min_cluster_size": min_cluster_size,
+                "prediction_data": hdbscan_prediction_data
+            }
+            runs.append({
+                "run": len(runs) + 1,
+                "key": run_key(umap_params, hdbscan_params, digest),
+                "umap_params": umap_params,
+                "hdbscan_params": hdbscan_params,
+            })
+
+    # Run keys include the embeddings hash, so this keeps only the runs finished for these embeddings
+    run_keys = {run["key"] for run in runs}
+    completed = {} if args.restart else {key: record for key, record in load_sweep_state(args.state).items()
+                                         if key in run_keys}
+    if completed:
+        print(f"⏩ Resuming: {len(completed)} runs already finished for these embeddings.")
+
+    def record_result(run, umap_path, cluster_labels):
+        noise_count = int(np.sum(cluster_labels == -1))
+        num_clusters = len([c for c in set(cluster_labels.tolist()) if c != -1])
+        conditions_met = noise_count < max_noise_count and min_clusters <= num_clusters <= max_clusters
+
+        print(f"Run {run['run']}:")
+        print(f"  UMAP parameters: {run['umap_params']}")
+        print(f"  HDBSCAN parameters: {run['hdbscan_params']}")
         print(f"  Noise count (-1): {noise_count}, Number of clusters: {num_clusters}")
-        
-        # Check conditions
-        if noise_count < 4000 and 20 <= num_clusters <= 60:
-            print(f"  ✅ Conditions met for run {run_number}. Saving outputs.")
-            runs_meeting_conditions += 1
-            # Attach cluster labels and UMAP coordinates to metadata copy
-            run_metadata = []
-            for i, entry in enumerate(metadata):
-                new_entry = entry.copy()
-                new_entry["cluster"] = int(cluster_labels[i])
-                new_entry["x"] = float(umap_embeddings[i][0])
-                new_entry["y"] = float(umap_embeddings[i][1])
-                run_metadata.append(new_entry)
-            
-            # Save clustered metadata to JSON
-            json_filename = os.path.join(output_dir, f"clustered_posts_run_{run_number}_tunedparameters.json")
-            with open(json_filename, "w", encoding="utf-8") as f:
-                json.dump(run_metadata, f, ensure_ascii=False, indent=2)
-            
-            # Generate and save UMAP plot
-            plt.figure(figsize=(10, 8))
-            palette = sns.color_palette("hsv", len(set(cluster_labels)))
-            sns.scatterplot(x=umap_embeddings[:, 0], y=umap_embeddings[:, 1],
-                            hue=cluster_labels, palette=palette, legend="full", s=40, alpha=0.7)
-            plt.title(f"UMAP projection (Run {run_number})\nUMAP: {umap_params} | HDBSCAN: {hdbscan_params}\nClusters = {num_clusters}")
-            plt.xlabel("UMAP Dimension 1")
-            plt.ylabel("UMAP Dimension 2")
-            plt.tight_layout()
-            png_filename = os.path.join(output_dir, f"umap_clusters_run_{run_number}_tunedparameters.png")
-            plt.savefig(png_filename)
-            plt.close()
-            
-            # Load full cleaned post texts for Excel export
-            with open("data/processed/cleaned_posts.json", "r", encoding="utf-8") as f:
-                full_data = json.load(f)
-            
-            # Combine clustering results with original posts for Excel
-            rows = []
-            for i, entry in enumerate(run_metadata):
-                cluster_id = entry["cluster"]
-                subreddit = entry.get("subreddit", "")
-                text = full_data[i]["text"]
-                post_id = full_data[i]["id"]
-                rows.append({
-                    "id": post_id,
-                    "cluster": cluster_id,
-                    "subreddit": subreddit,
-                    "text": text,
-                    "label": ""
-                })
-            df = pd.DataFrame(rows)
-            xlsx_filename = os.path.join(output_dir, f"clustered_posts_labeled_run_{run_number}_tunedparameters.xlsx")
-            df.to_excel(xlsx_filename, index=False)
-            
-            print(f"  Saved JSON: {json_filename}")
-            print(f"  Saved PNG: {png_filename}")
-            print(f"  Saved Excel: {xlsx_filename}\n{'-'*50}\n")
+
+        outputs = []
+        if conditions_met:
+            print(f"  ✅ Conditions met for run {run['run']}. Saving outputs.")
+            umap_embeddings = np.load(umap_path)
+            outputs = save_run_outputs(run["run"], run["umap_params"], run["hdbscan_params"], umap_embeddings,
+                                       cluster_labels, num_clusters, metadata, full_data, digest)
         else:
-            print(f"  ❌ Conditions not met for run {run_number}.\n{'-'*50}\n")
-        
-        run_number += 1
+            print(f"  ❌ Conditions not met for run {run['run']}.")
+        print(f"{'-'*50}\n")
+
+        record = {**run, "umap_path": umap_path, "noise_count": noise_count, "num_clusters": num_clusters,
+                  "conditions_met": conditions_met, "outputs": outputs}
+        append_sweep_state(record, args.state)
+        completed[run["key"]] = record
+
+    # Compute each UMAP reduction once (UMAP itself is multithreaded) and fan the HDBSCAN
+    # fits for it out to the process pool while the next reduction is being computed
+    pending = {}
+    # "spawn": UMAP/numba threads are already running here, and forking a multithreaded process can deadlock
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+
+        def drain(block):
+            if not pending:
+                return
+            done, _ = wait(pending, timeout=None if block else 0, return_when=FIRST_COMPLETED)
+            for future in done:
+                run, umap_path = pending.pop(future)
+                record_result(run, umap_path, future.result())
+
+        for umap_params, group in itertools.groupby(runs, key=lambda r: json.dumps(r["umap_params"], sort_keys=True)):
+            group = [run for run in group if run["key"] not in completed]
+            if not group:
+                continue
+            umap_params = group[0]["umap_params"]
+            umap_path, cached = reduce_cached(embeddings, umap_params, digest, args.cache_dir)
+            print(f"🗺️ UMAP {umap_params}: {'loaded from cache' if cached else 'computed'} ({umap_path})")
+
+            for run in group:
+                pending[pool.submit(fit_hdbscan, umap_path, run["hdbscan_params"])] = (run, umap_path)
+            drain(block=False)
+
+        while pending:
+            drain(block=True)
+
+    # Summary of every run in this grid
+    print(f"\n{'run':>4} {'n_neighbors':>11} {'n_comp':>6} {'min_dist':>8} {'min_size':>8} {'noise':>7} {'clusters':>8}  saved")
+    for run in runs:
+        record = completed.get(run["key"])
+        if record is None:
+            continue
+        u, h = run["umap_params"], run["hdbscan_params"]
+        print(f"{run['run']:>4} {u['n_neighbors']:>11} {u['n_components']:>6} {u['min_dist']:>8} "
+              f"{h['min_cluster_size']:>8} {record['noise_count']:>7} {record['num_clusters']:>8}  "
+              f"{'✅' if record['conditions_met'] else ''}")
+
+    runs_meeting_conditions = sum(1 for run in runs if completed.get(run["key"], {}).get("conditions_met"))
+    if runs_meeting_conditions == 0:
+        print("No run produced the desired conditions (noise count < 4000 and clusters between 20 and 60).")
 
-if runs_meeting_conditions == 0:
-    print("No run produced the desired conditions (noise count < 4000 and clusters between 20 and 60).")
\ No newline at end of file
+    # Keep the fitted models of the chosen run, so new posts can be assigned without refitting
+    if args.persist_run is not None:
+        chosen = next((completed.get(run["key"]) for run in runs if run["run"] == args.persist_run), None)
+        if chosen is None:
+            sys.exit(f"Run {args.persist_run} has not finished for these embeddings.")
+        clustered_path = next((path for path in chosen["outputs"] if path.endswith(".json")), None)
+        if clustered_path is None:
+            # The run didn't meet the conditions, so its clustered posts weren't saved: save them now, so
+            # 4b_assign_new_posts.py appends to this run's output and not to another model's
+            print(f"💾 Run {args.persist_run} saved no outputs; saving them before persisting its models.")
+            umap_path, _ = reduce_cached(embeddings, chosen["umap_params"], digest, args.cache_dir)
+            cluster_labels = fit_hdbscan(umap_path, chosen["hdbscan_params"])
+            outputs = save_run_outputs(chosen["run"], chosen["umap_params"], chosen["hdbscan_params"], np.load(umap_path),
+                                       cluster_labels, chosen["num_clusters"], metadata, full_data, digest)
+            chosen = {**chosen, "outputs": outputs}
+            append_sweep_state(chosen, args.state)
+            clustered_path = outputs[0]
+        manifest = persist_cluster_model(chosen, embeddings, digest, clustered_path, args.model_dir, args.cache_dir)
+        print(f"\n💾 Saved UMAP reducer and HDBSCAN clusterer of run {args.persist_run} to {args.model_dir} "
+              f"(noise share {manifest['noise_share']:.3f}, low-strength share {manifest['low_strength_share']:.3f})")
@@ -1,90 +1,212 @@
-import pandas as pd
-import numpy as np
-import json
-import faiss
-import os
-from sentence_transformers import SentenceTransformer
-import umap
-import matplotlib.pyplot as plt
-import seaborn as sns
-from sklearn.metrics import classification_report
-from sklearn.model_selection import train_test_split
-from collections import Counter
+"""
+Builds the serving bundle (kNN index + labels, see artifacts.py) from the hand-labelled posts.
 
-# Load the dataset
-df = pd.read_excel(r"C:\Users\louis\OneDrive - University College London (1)\MSc Health Data Science\0 - Personal projects\mental-health-text-model\data\processed\clustered_posts_labeled_v1.xlsx")
-
-# Filter out unclassifiable posts
-df = df[df["primary_allocation"] != 99].reset_index(drop=True)
-
-# Use only primary cluster labels for training
-df["final_label"] = df["primary_allocation"].astype(str)
-
-# Load SBERT model and generate embeddings
-model = SentenceTransformer('all-MiniLM-L6-v2')
-print("🔍 Generating embeddings...")
-embeddings = model.encode(df["text"].tolist(), show_progress_bar=True, convert_to_numpy=True)
-
-# Split data into train and test
-X_train, X_test, y_train, y_test = train_test_split(
-    embeddings,
-    df["final_label"].tolist(),
-    test_size=0.2,
-    random_state=42,
-    stratify=df["final_label"]
-)
+Embeddings are not recomputed: labels are joined by post id to the cached embeddings from
+3vectorise.py (post_embeddings.npy, rows aligned with post_metadata.json) in one vectorised lookup,
+and only labelled posts without a cached vector are encoded (they need a 'text' column).
+The index is built once, on every labelled post; it is evaluated leave-one-out (each post is
+classified by its k nearest other posts), so no second index on a train split is needed.
+Cluster prototypes for the serving fast path (models/prototypes.py) are built on the same posts, with
+the margin above which they answer instead of the kNN search.
 
-# Train FAISS index on training embeddings
-dimension = X_train.shape[1]
-index = faiss.IndexFlatL2(dimension)
-index.add(X_train)
+Labels: .xlsx/.xls, .csv or .parquet with an 'id' column and a label column (primary_allocation).
 
-# Perform kNN (k=3) search for test samples
-k = 6
-_, indices = index.search(X_test, k)
+Run from the repository root:
+  python models/5train_model.py --labels data/processed/clustered_posts_labeled_v1.xlsx
+  python models/5train_model.py --labels labels.csv --no-umap
+"""
 
-# Predict labels using majority vote from nearest neighbors
-y_pred = []
-for idx_set in indices:
-    neighbor_labels = [y_train[i] for i in idx_set]
-    majority = Counter(neighbor_labels).most_common(1)[0][0]
-    y_pred.append(majority)
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+from sklearn.metrics import classification_report
 
-# Classification report
-print("\n📊 Classification Report:")
-print(classification_report(y_test, y_pred))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import BUNDLE_DIR, RESPONSES_JSON, EMBEDDING_MODEL, ENCODER_BACKEND, K_NEIGHBORS, INDEX_METRIC
+from encoders import get_encoder
+from artifacts import write_bundle
+from serving_state import cluster_table
+from models.index_factory import build_index, prepare_vectors, index_description
+from models.knn import neighbor_labels, majority_vote, leave_one_out_neighbors
+from models.evaluation import leave_one_out_sweep, print_sweep
+from models.prototypes import (PrototypeClassifier, TARGET_AGREEMENT, build_prototypes, choose_margin,
+                               fast_path_certainty, leave_one_out_predict, margin_report)
+from models.map_assets import write_map_assets
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+parser = argparse.ArgumentParser(description="Build the kNN serving bundle from labelled posts and cached embeddings.")
+parser.add_argument("--labels", default="data/processed/clustered_posts_labeled_v1.xlsx",
+                    help="Labelled posts (.xlsx, .xls, .csv or .parquet)")
+parser.add_argument("--label-column", default="primary_allocation")
+parser.add_argument("--exclude-label", default="99", help="Label of unclassifiable posts, left out")
+parser.add_argument("--embeddings", default="data/processed/post_embeddings.npy")
+parser.add_argument("--metadata", default="data/processed/post_metadata.json")
+parser.add_argument("--k", type=int, default=K_NEIGHBORS, help="Neighbours for the classification report")
+parser.add_argument("--max-k", type=int, default=30, help="Largest K in the leave-one-out sweep")
+parser.add_argument("--prototypes-per-cluster", type=int, default=1,
+                    help="Fast-path prototypes per cluster: 1 = centroid, more = medoids")
+parser.add_argument("--prototype-agreement", type=float, default=TARGET_AGREEMENT,
+                    help="Agreement with kNN the fast-path margin must reach on the labelled posts")
+parser.add_argument("--no-umap", action="store_true", help="Skip the UMAP map for the web page")
+parser.add_argument("--umap-output", default=os.path.join(REPO_DIR, "app", "umap_data.json"))
+args = parser.parse_args()
+
+
+def read_labels(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".xlsx", ".xls"):
+        return pd.read_excel(path)
+    if extension == ".csv":
+        return pd.read_csv(path)
+    if extension == ".parquet":
+        return pd.read_parquet(path)
+    sys.exit(f"Unsupported labels file {path}: expected .xlsx, .xls, .csv or .parquet")
 
-# Save FAISS index and mappings (from full dataset)
-full_index = faiss.IndexFlatL2(dimension)
-full_index.add(embeddings)
 
-faiss.write_index(full_index, "cluster_index.faiss")
+# Load the dataset
+start = time.perf_counter()
+df = read_labels(args.labels)
+df["id"] = df["id"].astype(str)
+# Spreadsheet exports may give labels as floats ("3.0") or leave them blank: unlabelled rows are dropped
+numeric_labels = pd.to_numeric(df[args.label_column], errors="coerce")
+if numeric_labels.isna().any():
+    print(f"⚠️ {int(numeric_labels.isna().sum())} posts without a numeric {args.label_column} left out")
+df = df[numeric_labels.notna()].copy()
+df["final_label"] = numeric_labels[numeric_labels.notna()].astype(int).astype(str)
+
+# Filter out unclassifiable posts; use only primary cluster labels for training
+df = df[df["final_label"] != str(int(float(args.exclude_label)))].drop_duplicates("id").reset_index(drop=True)
+print(f"🏷️ {len(df)} labelled posts from {args.labels}")
+
+# Join labels to the cached embeddings by id: one get_indexer call, -1 where there is no cached vector
+if os.path.exists(args.embeddings) and os.path.exists(args.metadata):
+    with open(args.metadata, "r", encoding="utf-8") as f:
+        cached_ids = pd.Index([str(post["id"]) for post in json.load(f)])
+    cached = np.load(args.embeddings, mmap_mode="r")
+    # (first occurrence of an id if 3vectorise.py saw it more than once)
+    first = np.flatnonzero(~cached_ids.duplicated())
+    positions = cached_ids[first].get_indexer(df["id"])
+    rows = np.where(positions >= 0, first[positions], -1)
+else:
+    print(f"⚠️ No cached embeddings at {args.embeddings}: every labelled post will be encoded.")
+    cached, rows = None, np.full(len(df), -1)
+
+found = np.flatnonzero(rows >= 0)
+missing = np.flatnonzero(rows < 0)
+dimension = cached.shape[1] if cached is not None else None
+
+# Encode only the labelled posts without a cached vector (backend chosen in config.py)
+missing_vectors = None
+if len(missing):
+    if "text" not in df.columns:
+        sys.exit(f"{len(missing)} labelled posts have no cached embedding and the labels file has no 'text' "
+                 f"column: run 3vectorise.py first.")
+    model = get_encoder()
+    print(f"🔍 Encoding {len(missing)} posts without a cached embedding...")
+    missing_vectors = model.encode(df["text"].iloc[missing].tolist(), show_progress_bar=True)
+    dimension = missing_vectors.shape[1]
+    if cached is not None and cached.shape[1] != dimension:
+        sys.exit(f"Cached embeddings are {cached.shape[1]}-d but {ENCODER_BACKEND} gives {dimension}-d: "
+                 f"re-run 3vectorise.py with the same encoder.")
+
+embeddings = np.empty((len(df), dimension), dtype=np.float32)
+if len(found):
+    embeddings[found] = cached[rows[found]]
+if len(missing):
+    embeddings[missing] = missing_vectors
+print(f"♻️ {len(found)} cached embeddings reused, {len(missing)} encoded "
+      f"({time.perf_counter() - start:.1f}s to assemble the training set)")
+
+labels = df["final_label"].to_numpy()
+label_codes = labels.astype(int)
+
+# One FAISS index on every labelled post (index type from config.py)
+index = build_index(embeddings)
+
+# Leave-one-out evaluation: each post voted on by its k nearest other posts. One search at the
+# largest K serves the classification report and the sweep over K and voting rules (evaluation.py).
+vectors = prepare_vectors(embeddings)
+distances, indices = leave_one_out_neighbors(index, vectors, max(args.k, args.max_k))
+predicted, agreeing = majority_vote(neighbor_labels(label_codes, indices[:, :args.k]))
+y_pred = predicted.astype(str)
 
-id_to_label = dict(zip(df["id"], df["final_label"]))
-id_to_text = dict(zip(df["id"], df["text"]))
-index_map = list(df["id"])
+# Classification report
+print(f"\n📊 Classification Report (leave-one-out, k={args.k}):")
+print(classification_report(labels, y_pred, zero_division=0))
+
+print("\n📈 Leave-one-out sweep over K and voting rules:")
+print_sweep(leave_one_out_sweep(distances, indices, label_codes, INDEX_METRIC), args.k)
+
+# Cluster prototypes for the serving fast path, and the smallest top-two margin at which they agree
+# with the kNN vote often enough (models/prototypes.py). Like the kNN evaluation this is leave-one-out:
+# each post is scored with itself left out of its own cluster's prototypes.
+prototypes, prototype_labels = build_prototypes(vectors, label_codes, args.prototypes_per_cluster, INDEX_METRIC)
+prototype_predicted, margins = leave_one_out_predict(PrototypeClassifier(prototypes, prototype_labels, INDEX_METRIC),
+                                                     vectors, label_codes, args.prototypes_per_cluster <= 1)
+margin = choose_margin(margins, prototype_predicted, predicted, args.prototype_agreement)
+certainty = fast_path_certainty(margins, prototype_predicted, agreeing / args.k, margin)
+report = margin_report(margins, prototype_predicted, predicted, label_codes,
+                       sorted(set(np.quantile(margins[np.isfinite(margins)], [0, 0.25, 0.5, 0.75, 0.9]).tolist()) | {margin} - {float("inf")}))
+
+print(f"\n⚡ Fast path: {len(prototypes)} prototypes for {len(np.unique(label_codes))} clusters")
+print(f"{'margin':>10}{'hit rate':>10}{'agreement':>11}{'accuracy':>10}")
+for row in report:
+    mark = " ← chosen" if row["margin"] == margin else ""
+    print(f"{row['margin']:>10.4f}{row['hit_rate']:>10.1%}{row['agreement']:>11.1%}{row['accuracy']:>10.3f}{mark}")
+print(f"(leave-one-out; kNN alone: accuracy {np.mean(predicted == label_codes):.3f}; agreement is with the kNN vote at k={args.k})")
+if margin == float("inf"):
+    print(f"⚠️ No margin reaches {args.prototype_agreement:.0%} agreement with kNN: the fast path stays off.")
+chosen = next((row for row in report if row["margin"] == margin), {"hit_rate": 0.0, "agreement": None})
+
+# Save FAISS index and mappings as one versioned serving bundle
+with open(RESPONSES_JSON, "r", encoding="utf-8") as f:
+    responses = json.load(f)
+
+manifest = write_bundle(
+    BUNDLE_DIR,
+    index,
+    labels=df["final_label"].tolist(),
+    ids=df["id"].tolist(),
+    clusters=cluster_table(responses),
+    model_name=EMBEDDING_MODEL,
+    extra={"encoder_backend": ENCODER_BACKEND, "k_neighbors": K_NEIGHBORS, **index_description(),
+           "prototypes": {"count": len(prototypes), "per_cluster": args.prototypes_per_cluster,
+                          "margin": None if margin == float("inf") else margin, "certainty": certainty,
+                          "hit_rate": chosen["hit_rate"], "agreement": chosen["agreement"]}},
+    prototypes=(prototypes, prototype_labels),
+)
 
-with open("id_to_label.json", "w") as f:
-    json.dump(id_to_label, f)
+# Post texts are kept outside the bundle (not needed for serving)
+if "text" in df.columns:
+    id_to_text = dict(zip(df["id"], df["text"]))
+    with open("id_to_text.json", "w") as f:
+        json.dump(id_to_text, f)
 
-with open("id_to_text.json", "w") as f:
-    json.dump(id_to_text, f)
+print(f"✅ Serving bundle {manifest['version']} saved to {BUNDLE_DIR}/.")
 
-with open("index_map.json", "w") as f:
-    json.dump(index_map, f)
+if args.no_umap:
+    sys.exit(0)
 
-print("✅ Embedding index and label mappings saved.")
+# Only needed for the map
+import umap
+import matplotlib.pyplot as plt
+import seaborn as sns
 
-# UMAP Visualization of training set
-print("\n🎨 Generating UMAP projection (training set)...")
+# UMAP Visualization of the labelled posts
+print("\n🎨 Generating UMAP projection (labelled posts)...")
 reducer = umap.UMAP(n_neighbors=15, min_dist=0.1, metric='cosine', random_state=42)
-embedding_2d = reducer.fit_transform(X_train)
+embedding_2d = reducer.fit_transform(embeddings)
 
 plt.figure(figsize=(12, 10))
 sns.scatterplot(
     x=embedding_2d[:, 0],
     y=embedding_2d[:, 1],
-    hue=y_train,
+    hue=labels,
     palette="tab20",
     legend='full',
     s=40
@@ -97,15 +219,19 @@ plt.tight_layout()
 umap_df = pd.DataFrame({
     "x": embedding_2d[:, 0],
     "y": embedding_2d[:, 1],
-    "cluster": y_train
+    "cluster": labels
 })
 
-# Save JSON file to the app directory (relative to /models)
-output_path = r"C:\Users\louis\OneDrive - University College London (1)\MSc Health Data Science\0 - Personal projects\mental-health-text-model\app\umap_data.json"
+# Save JSON file to the app directory
+output_path = args.umap_output
 umap_df.to_json(output_path, orient="records")
 
+# Compact, precompressed map payloads served by /umap (full map and a level-of-detail sample)
+map_sizes = write_map_assets(embedding_2d[:, 0], embedding_2d[:, 1], labels, os.path.dirname(output_path))
+
 # Save plot graphic for internal use
 plt.savefig("umap_training_projection_by_primary_cluster.png", dpi=300)
 print("📸 UMAP plot saved as 'umap_training_projection_by_primary_cluster.png'")
 print(f"🧭 JSON data saved to {output_path}")
-plt.close()
\ No newline at end of file
+print("🗺️ Map payloads saved: " + ", ".join(f"{name} ({size / 1e3:.1f} kB)" for name, size in map_sizes.items()))
+plt.close()
@@ -1,53 +1,28 @@
-import json
-import faiss
-import numpy as np
-from sentence_transformers import SentenceTransformer
-from collections import Counter
 import os
-from datetime import datetime
+import sys
 
-# Load components
-print("Loading model and index...")
-model = SentenceTransformer('all-MiniLM-L6-v2')
-index = faiss.read_index("cluster_index.faiss")
-
-with open("id_to_label.json", "r") as f:
-    id_to_label = json.load(f)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from encoders import get_encoder
+from serving_state import load_serving_state
+from config import FEEDBACK_LOG_PATH
+from feedback_sink import FeedbackSink
 
-with open("index_map.json", "r") as f:
-    index_map = json.load(f)
-
-# Ensure mapping is in correct order
-index_to_label = [id_to_label[i] for i in index_map]
+# Load components (serving bundle, or the loose index and label files)
+print("Loading model and index...")
+model = get_encoder()
+state = load_serving_state()
 
 def predict_cluster(text, k=6):
-    embedding = model.encode([text], convert_to_numpy=True)
-    distances, indices = index.search(embedding, k)
-    neighbor_labels = [index_to_label[i] for i in indices[0]]
-    majority, count = Counter(neighbor_labels).most_common(1)[0]
-    certainty = count / k  # proportion of neighbors that agreed
+    embedding = model.encode([text])
+    majority, certainty = state.search_and_vote(embedding, k)[0]  # certainty: proportion of neighbors that agreed
     return majority, certainty
 
-# Save feedback to a local JSON log
-FEEDBACK_PATH = "user_feedback_log.json"
+# Save feedback to the same log as the web app (appended in batches in the background, flushed on exit).
+# Like the web app, the log holds the prediction and the rating, not the text that was classified.
+feedback_sink = FeedbackSink(FEEDBACK_LOG_PATH)
 
 def save_feedback(text, cluster, certainty, rating, comment):
-    entry = {
-        "timestamp": datetime.now().isoformat(),
-        "input_text": text,
-        "predicted_cluster": cluster,
-        "certainty": certainty,
-        "rating": rating,
-        "user_comment": comment
-    }
-    if os.path.exists(FEEDBACK_PATH):
-        with open(FEEDBACK_PATH, "r") as f:
-            logs = json.load(f)
-    else:
-        logs = []
-    logs.append(entry)
-    with open(FEEDBACK_PATH, "w") as f:
-        json.dump(logs, f, indent=2)
+    feedback_sink.submit(source="cli", rating=rating, feedback=comment, predicted_cluster=cluster, certainty=certainty)
 
 # Example CLI usage (to be replaced by web interface)
 if __name__ == "__main__":
@@ -72,4 +47,5 @@ if __name__ == "__main__":
         next_action = input("\n🔁 Would you like to (e)dit what you wrote, (s)tart again, or (q)uit? ").strip().lower()
         if next_action == "q":
             print("👋 Goodbye!")
+            feedback_sink.close()
             break
\ No newline at end of file
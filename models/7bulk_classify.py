@@ -0,0 +1,245 @@
+"""
+Classifies a whole file of posts offline with the serving bundle: the batch version of
+predict_cluster in 6load_model_and_return_prediction.py.
+
+- Streams the input (.jsonl, one object per line, or .csv with a header), so memory stays bounded
+  whatever the file size: only --chunk-size rows per worker are in flight at a time.
+- Same rule as the web app: posts with fewer than MIN_WORD_COUNT words are not classified
+  (their output row has an "error" instead of a cluster).
+- Each chunk is encoded in batches and classified like /predict (ServingState.search_and_vote: the
+  cluster prototype fast path, then one FAISS search and vote for the rest), so a post gets the same
+  cluster and certainty as in the app; the output row also holds the post ids of its k nearest neighbours.
+- --workers N: chunks are shared across N spawned processes, each with its own encoder and the
+  memory-mapped index. Output rows stay in input order.
+- Checkpoint / resume: after each chunk is written, <output>.checkpoint.json records how many input
+  rows are done and the output size at that point. --resume skips those rows and cuts off anything
+  written after the last checkpoint, so an interrupted job continues where it stopped.
+
+Run from the repository root:
+  python models/7bulk_classify.py new_posts.jsonl classified.jsonl
+  python models/7bulk_classify.py partner.csv classified.csv --text-field body --workers 4 --resume
+"""
+
+import argparse
+import collections
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import K_NEIGHBORS, MIN_WORD_COUNT
+
+OUTPUT_FIELDS = ["row", "id", "cluster", "certainty", "neighbor_ids", "error"]
+
+_encoder = None
+_state = None
+
+
+def _init_worker(num_threads):
+    # Loads the encoder and serving bundle once per process (thread limits first, see inference.py)
+    global _encoder, _state
+    from inference import set_thread_limits
+    from encoders import get_encoder
+    from serving_state import load_serving_state
+    if num_threads:
+        set_thread_limits(num_threads)
+    _encoder = get_encoder()
+    _state = load_serving_state()
+
+
+def classify_chunk(task):
+    # task: (texts, k, batch size) -> [(cluster, certainty, neighbour index rows) or None if too short, ...]
+    texts, k, batch_size = task
+    valid = [i for i, text in enumerate(texts) if len(text.split()) >= MIN_WORD_COUNT]
+    results = [None] * len(texts)
+    if valid:
+        embeddings = _encoder.encode([texts[i] for i in valid], batch_size=batch_size)
+        # Cluster and certainty as /predict gives them; the search is only for the neighbour ids
+        predictions = _state.search_and_vote(embeddings, k)
+        indices = _state.search(embeddings, k)
+        for i, (cluster, certainty), rows in zip(valid, predictions, indices.tolist()):
+            results[i] = (cluster, certainty, rows)
+    return results
+
+
+def input_format(path, requested=None):
+    extension = requested or os.path.splitext(path)[1].lower().lstrip(".")
+    if extension in ("jsonl", "ndjson"):
+        return "jsonl"
+    if extension == "csv":
+        return "csv"
+    sys.exit(f"Unsupported file {path}: expected .jsonl or .csv (or pass --format)")
+
+
+def read_records(path, fmt, text_field, id_field):
+    # Yields (row number, post id, text); row numbers count records from 0
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if fmt == "csv":
+            csv.field_size_limit(sys.maxsize)
+            records = csv.DictReader(f)
+        else:
+            records = (json.loads(line) for line in f if line.strip())
+        for row, record in enumerate(records):
+            text = record.get(text_field)
+            # A missing or blank id (or a short CSV row, read as None) falls back to the row number
+            post_id = record.get(id_field)
+            yield row, str(row if post_id in (None, "") else post_id), text if isinstance(text, str) else ""
+
+
+def chunks(records, size, skip):
+    chunk = []
+    for record in records:
+        if record[0] < skip:
+            continue
+        chunk.append(record)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class OutputWriter:
+    # Appends result rows as JSONL or CSV (neighbour ids joined by ";")
+    def __init__(self, path, fmt, offset):
+        self.fmt = fmt
+        self.file = open(path, "r+" if os.path.exists(path) else "w", encoding="utf-8", newline="")
+        # Anything after the last checkpoint is from an interrupted chunk, which will be redone
+        self.file.seek(offset)
+        self.file.truncate()
+        self.csv = csv.DictWriter(self.file, fieldnames=OUTPUT_FIELDS) if fmt == "csv" else None
+        if self.csv is not None and offset == 0:
+            self.csv.writeheader()
+
+    def write(self, row):
+        if self.csv is not None:
+            self.csv.writerow({**row, "neighbor_ids": ";".join(row["neighbor_ids"] or [])})
+        else:
+            self.file.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+    def flush(self):
+        # Returns the output size once everything written so far is on disk
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+
+def input_fingerprint(path):
+    stat = os.stat(path)
+    return {"path": os.path.abspath(path), "size": stat.st_size, "mtime": stat.st_mtime}
+
+
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_checkpoint(path, checkpoint):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Classify a JSONL/CSV file of posts with the serving bundle.")
+    parser.add_argument("input", help="Posts to classify (.jsonl or .csv)")
+    parser.add_argument("output", help="Results (.jsonl or .csv)")
+    parser.add_argument("--format", choices=["jsonl", "csv"], help="Input format (default: from the extension)")
+    parser.add_argument("--text-field", default="text")
+    parser.add_argument("--id-field", default="id", help="Post id column (default: the row number)")
+    parser.add_argument("--k", type=int, default=K_NEIGHBORS)
+    parser.add_argument("--workers", type=int, default=1, help="Classifying processes (1 = in this process)")
+    parser.add_argument("--chunk-size", type=int, default=1024, help="Rows per chunk (one search, one checkpoint)")
+    parser.add_argument("--batch-size", type=int, default=64, help="Texts per encoder batch")
+    parser.add_argument("--resume", action="store_true", help="Continue from <output>.checkpoint.json")
+    args = parser.parse_args()
+
+    fmt = input_format(args.input, args.format)
+    output_format = input_format(args.output)
+    checkpoint_path = args.output + ".checkpoint.json"
+    fingerprint = input_fingerprint(args.input)
+
+    checkpoint = load_checkpoint(checkpoint_path)
+    if checkpoint is not None and not args.resume:
+        sys.exit(f"{checkpoint_path} exists: pass --resume to continue that job, or delete it to start again.")
+    if checkpoint is not None and checkpoint["input"] != fingerprint:
+        sys.exit(f"{args.input} has changed since the checkpoint was written: delete {checkpoint_path} to start again.")
+    checkpoint = checkpoint or {"input": fingerprint, "rows_done": 0, "output_bytes": 0, "classified": 0, "too_short": 0}
+    if checkpoint["rows_done"]:
+        print(f"⏩ Resuming after {checkpoint['rows_done']} rows.")
+
+    # Post id of every index row, to report neighbours by id
+    from serving_state import load_row_ids
+    row_ids = [str(post_id) for post_id in load_row_ids()]
+
+    workers = max(1, args.workers)
+    if workers > 1:
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        # "spawn" avoids forking torch/OpenMP state (same as inference.py)
+        pool = multiprocessing.get_context("spawn").Pool(workers, initializer=_init_worker, initargs=(threads,))
+    else:
+        pool = None
+        _init_worker(None)
+
+    def submit(task):
+        # Returns a function that gives the chunk's results (waiting for the worker if there is one)
+        if pool is not None:
+            return pool.apply_async(classify_chunk, (task,)).get
+        results = classify_chunk(task)
+        return lambda: results
+
+    writer = OutputWriter(args.output, output_format, checkpoint["output_bytes"])
+    start = time.perf_counter()
+    rows_this_run = 0
+    # At most two chunks per worker in flight, written in input order
+    pending = collections.deque()
+    records = chunks(read_records(args.input, fmt, args.text_field, args.id_field), args.chunk_size, checkpoint["rows_done"])
+
+    def write_next():
+        global rows_this_run
+        chunk, result = pending.popleft()
+        for (row, post_id, _), prediction in zip(chunk, result()):
+            if prediction is None:
+                checkpoint["too_short"] += 1
+                writer.write({"row": row, "id": post_id, "cluster": None, "certainty": None, "neighbor_ids": None,
+                              "error": f"Input must be at least {MIN_WORD_COUNT} words."})
+            else:
+                cluster, certainty, neighbours = prediction
+                checkpoint["classified"] += 1
+                # Rounded like the /predict response
+                writer.write({"row": row, "id": post_id, "cluster": cluster, "certainty": round(certainty, 2),
+                              "neighbor_ids": [row_ids[i] for i in neighbours if i >= 0], "error": None})
+        checkpoint["rows_done"] = chunk[-1][0] + 1
+        checkpoint["output_bytes"] = writer.flush()
+        save_checkpoint(checkpoint_path, checkpoint)
+        rows_this_run += len(chunk)
+        seconds = time.perf_counter() - start
+        print(f"  {checkpoint['rows_done']} rows done ({rows_this_run / seconds:.0f} rows/s)", end="\r")
+
+    try:
+        for chunk in records:
+            pending.append((chunk, submit(([text for _, _, text in chunk], args.k, args.batch_size))))
+            if len(pending) >= 2 * workers:
+                write_next()
+        while pending:
+            write_next()
+    finally:
+        writer.close()
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+    print(f"\n✅ {checkpoint['classified']} posts classified, {checkpoint['too_short']} shorter than "
+          f"{MIN_WORD_COUNT} words; results in {args.output}")
+    # No checkpoint is written if there was nothing to classify (e.g. an empty input)
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
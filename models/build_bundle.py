@@ -0,0 +1,41 @@
+"""
+Packs the loose serving files (cluster_index.faiss, id_to_label.json, index_map.json,
+app/responses.json) into a serving bundle (see artifacts.py), without retraining.
+5train_model.py writes a bundle directly; this is for artifacts trained before it did.
+
+Run from the repository root:  python models/build_bundle.py
+"""
+
+import json
+import os
+import sys
+import faiss
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import BUNDLE_DIR, FAISS_INDEX_PATH, LABELS_JSON, INDEX_MAP_JSON, RESPONSES_JSON, EMBEDDING_MODEL
+from artifacts import write_bundle
+from serving_state import cluster_table
+
+index = faiss.read_index(FAISS_INDEX_PATH)
+
+with open(LABELS_JSON, "r") as f:
+    id_to_label = json.load(f)
+
+with open(INDEX_MAP_JSON, "r") as f:
+    index_map = json.load(f)
+
+with open(RESPONSES_JSON, "r", encoding="utf-8") as f:
+    responses = json.load(f)
+
+manifest = write_bundle(
+    BUNDLE_DIR,
+    index,
+    labels=[id_to_label[i] for i in index_map],
+    ids=index_map,
+    clusters=cluster_table(responses),
+    model_name=EMBEDDING_MODEL,
+    extra={"index_kind": "flat", "index_metric": "l2"},
+)
+
+print(f"✅ Serving bundle {manifest['version']} written to {BUNDLE_DIR}/ "
+      f"({manifest['num_vectors']} vectors, {manifest['num_clusters']} clusters).")
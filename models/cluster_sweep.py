@@ -0,0 +1,130 @@
+# cluster_sweep.py
+# Building blocks for the UMAP + HDBSCAN hyperparameter sweep in 4cluster.py:
+# - each distinct UMAP configuration is computed once and cached on disk, keyed by its
+#   parameters and a hash of the embeddings
+# - HDBSCAN fits run in worker processes and only receive the path of the cached reduction
+# - finished runs are appended to a state file, so an interrupted sweep resumes where it stopped
+# - the chosen run's fitted UMAP reducer and HDBSCAN clusterer can be persisted, so new posts
+#   can be assigned to the existing clusters without refitting (4b_assign_new_posts.py)
+
+import hashlib
+import json
+import os
+import numpy as np
+
+UMAP_CACHE_DIR = "data/processed/umap_cache"
+SWEEP_STATE_PATH = "data/processed/cluster_sweep_state.jsonl"
+CLUSTER_MODEL_DIR = "data/processed/cluster_model"
+
+# Membership strength below which an assignment counts as weak (used for drift checks)
+LOW_STRENGTH = 0.5
+
+
+def embeddings_hash(embeddings):
+    digest = hashlib.sha256()
+    digest.update(str(embeddings.shape).encode("utf-8"))
+    digest.update(np.ascontiguousarray(embeddings).tobytes())
+    return digest.hexdigest()[:16]
+
+
+def params_key(params, embeddings_digest):
+    payload = json.dumps(params, sort_keys=True) + embeddings_digest
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def umap_cache_path(umap_params, embeddings_digest, cache_dir=UMAP_CACHE_DIR):
+    return os.path.join(cache_dir, f"umap_{params_key(umap_params, embeddings_digest)}.npy")
+
+
+def reducer_path(umap_path):
+    return umap_path[:-4] + ".joblib"
+
+
+def reduce_cached(embeddings, umap_params, embeddings_digest, cache_dir=UMAP_CACHE_DIR, require_reducer=False):
+    # Returns (path of the cached reduction, whether it was already cached).
+    # The fitted reducer is cached next to it, for UMAP.transform() on new posts.
+    path = umap_cache_path(umap_params, embeddings_digest, cache_dir)
+    if os.path.exists(path) and (not require_reducer or os.path.exists(reducer_path(path))):
+        return path, True
+
+    import joblib
+    import umap.umap_ as umap
+    umap_model = umap.UMAP(**umap_params)
+    reduced = umap_model.fit_transform(embeddings).astype(np.float32)
+
+    # Write to temporary names first so an interrupted save never looks like a finished one
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_reducer = reducer_path(path) + ".tmp"
+    joblib.dump(umap_model, tmp_reducer)
+    os.replace(tmp_reducer, reducer_path(path))
+    tmp_path = path[:-4] + ".tmp.npy"
+    np.save(tmp_path, reduced)
+    os.replace(tmp_path, path)
+    return path, False
+
+
+def fit_hdbscan(umap_path, hdbscan_params):
+    # Runs in a worker process. Returns the cluster label of every post.
+    import hdbscan
+    reduced = np.load(umap_path, mmap_mode="r")
+    # One core per fit: the sweep parallelises across fits instead
+    clusterer = hdbscan.HDBSCAN(core_dist_n_jobs=1, **hdbscan_params)
+    return clusterer.fit_predict(np.asarray(reduced)).astype(np.int32)
+
+
+def persist_cluster_model(record, embeddings, embeddings_digest, clustered_path, model_dir=CLUSTER_MODEL_DIR,
+                          cache_dir=UMAP_CACHE_DIR):
+    # Saves the reducer and a refitted HDBSCAN clusterer (with prediction data) for one sweep run.
+    # clustered_path must be that run's clustered output: 4b_assign_new_posts.py appends to it.
+    if not clustered_path or not os.path.exists(clustered_path):
+        raise FileNotFoundError(f"Clustered output of run {record['run']} not found ({clustered_path}): "
+                                f"save the run's outputs before persisting its models")
+    import joblib
+    import hdbscan
+
+    umap_path, _ = reduce_cached(embeddings, record["umap_params"], embeddings_digest, cache_dir, require_reducer=True)
+    reduced = np.load(umap_path)
+    clusterer = hdbscan.HDBSCAN(**{**record["hdbscan_params"], "prediction_data": True}).fit(reduced)
+
+    os.makedirs(model_dir, exist_ok=True)
+    joblib.dump(joblib.load(reducer_path(umap_path)), os.path.join(model_dir, "umap_reducer.joblib"))
+    joblib.dump(clusterer, os.path.join(model_dir, "hdbscan_clusterer.joblib"))
+
+    labels = clusterer.labels_
+    manifest = {
+        "run": record["run"],
+        "umap_params": record["umap_params"],
+        "hdbscan_params": record["hdbscan_params"],
+        "embeddings_hash": embeddings_digest,
+        "num_posts": int(len(labels)),
+        "noise_share": float(np.mean(labels == -1)),
+        "low_strength_share": float(np.mean(clusterer.probabilities_[labels != -1] < LOW_STRENGTH)),
+        "clustered_path": clustered_path,
+    }
+    with open(os.path.join(model_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def run_key(umap_params, hdbscan_params, embeddings_digest):
+    return params_key({"umap": umap_params, "hdbscan": hdbscan_params}, embeddings_digest)
+
+
+def load_sweep_state(path=SWEEP_STATE_PATH):
+    # run key -> record of every run that has already finished
+    completed = {}
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    completed[record["key"]] = record
+    return completed
+
+
+def append_sweep_state(record, path=SWEEP_STATE_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
@@ -0,0 +1,152 @@
+"""
+Leave-one-out evaluation of the kNN classifier for every K from 1 to max-K, from a single search.
+
+One FAISS search of max-K + 1 neighbours over the labelled posts (dropping each post itself, see
+knn.leave_one_out_neighbors) gives every post's max-K nearest other posts. Votes are then added up
+one neighbour column at a time with np.bincount, so K = 1, 2, ..., max-K each cost one pass over
+the posts, without a Python loop over posts or a new search.
+
+Voting rules:
+  majority  one vote per neighbour; ties go to the label of the nearer neighbour (as in knn.majority_vote)
+  distance  each neighbour's vote is weighted by 1 / distance, so closer posts count more
+
+Reported for each rule and K: accuracy, macro-F1, mean certainty (winning share of the votes, what
+/predict returns) and the expected calibration error (ECE) of that certainty.
+
+5train_model.py runs the sweep after building the index. To sweep the current serving bundle:
+  python models/evaluation.py [--max-k 30] [--output data/processed/k_sweep.json]
+"""
+
+import argparse
+import json
+import os
+import sys
+import numpy as np
+
+VOTING_RULES = ("majority", "distance")
+CALIBRATION_BINS = 10
+
+
+def neighbor_weights(distances, indices, voting, metric="l2"):
+    # Vote weight of every neighbour; 0 for missing neighbours (FAISS index -1)
+    if voting == "majority":
+        weights = np.ones(distances.shape, dtype=np.float64)
+    elif voting == "distance":
+        # FAISS returns squared L2 distances, or inner products for cosine
+        distance = np.sqrt(np.maximum(distances, 0)) if metric == "l2" else 1 - distances
+        weights = 1 / (np.maximum(distance, 0) + 1e-6)
+    else:
+        raise ValueError(f"Unknown voting rule: {voting} (expected one of {VOTING_RULES})")
+    return np.where(indices >= 0, weights, 0.0)
+
+
+def sweep_votes(neighbor_codes, weights, num_classes):
+    """
+    Yields (k, predicted class, certainty) for k = 1 .. max-K. neighbor_codes: (n, max-K) class codes
+    of each row's neighbours in distance order (-1 for none). Ties go to the class whose nearest
+    occurrence is nearer.
+    """
+    n, max_k = neighbor_codes.shape
+    rows = np.arange(n) * num_classes
+    votes = np.zeros(n * num_classes, dtype=np.float64)
+    first_rank = np.full(n * num_classes, max_k, dtype=np.float64)
+    total = np.zeros(n, dtype=np.float64)
+    # Far below any real difference between vote totals, so it only separates exact ties
+    tie_break = 1e-9 / max_k
+    for column in range(max_k):
+        codes = neighbor_codes[:, column]
+        present = codes >= 0
+        slots = rows[present] + codes[present]
+        votes += np.bincount(slots, weights=weights[present, column], minlength=n * num_classes)
+        # Each row has one neighbour per column, so the slots here are unique
+        first_rank[slots] = np.minimum(first_rank[slots], column)
+        total += weights[:, column]
+
+        scores = (votes - tie_break * first_rank).reshape(n, num_classes)
+        predicted = scores.argmax(axis=1)
+        winning = votes.reshape(n, num_classes)[np.arange(n), predicted]
+        yield column + 1, predicted, np.divide(winning, total, out=np.zeros(n), where=total > 0)
+
+
+def macro_f1(true, predicted, num_classes):
+    # Mean F1 over the classes that occur in either the true or the predicted labels
+    true_count = np.bincount(true, minlength=num_classes)
+    predicted_count = np.bincount(predicted, minlength=num_classes)
+    true_positive = np.bincount(true[true == predicted], minlength=num_classes)
+    support = true_count + predicted_count
+    present = support > 0
+    return float(np.mean(2 * true_positive[present] / support[present]))
+
+
+def expected_calibration_error(correct, certainty, bins=CALIBRATION_BINS):
+    # Weighted mean gap between accuracy and mean certainty within equal-width certainty bins
+    which = np.minimum((certainty * bins).astype(int), bins - 1)
+    count = np.bincount(which, minlength=bins)
+    accuracy = np.bincount(which, weights=correct, minlength=bins)
+    confidence = np.bincount(which, weights=certainty, minlength=bins)
+    filled = count > 0
+    return float(np.sum(np.abs(accuracy[filled] - confidence[filled])) / len(correct))
+
+
+def leave_one_out_sweep(distances, indices, labels, metric="l2", voting_rules=VOTING_RULES):
+    """
+    distances, indices: (n, max-K) leave-one-out neighbours of the n labelled rows (knn.leave_one_out_neighbors).
+    labels: the label of each row (index row order). Returns one dict per voting rule and K.
+    """
+    classes, true = np.unique(np.asarray(labels), return_inverse=True)
+    found = indices >= 0
+    neighbor_codes = np.where(found, true[np.where(found, indices, 0)], -1)
+
+    results = []
+    for voting in voting_rules:
+        weights = neighbor_weights(distances, indices, voting, metric)
+        for k, predicted, certainty in sweep_votes(neighbor_codes, weights, len(classes)):
+            correct = (predicted == true).astype(np.float64)
+            results.append({
+                "voting": voting,
+                "k": k,
+                "accuracy": float(correct.mean()),
+                "macro_f1": macro_f1(true, predicted, len(classes)),
+                "mean_certainty": float(certainty.mean()),
+                "ece": expected_calibration_error(correct, certainty),
+            })
+    return results
+
+
+def best_result(results, key="macro_f1"):
+    return max(results, key=lambda row: (row[key], row["accuracy"]))
+
+
+def print_sweep(results, current_k=None):
+    best = best_result(results)
+    print(f"{'voting':<10}{'k':>4}{'accuracy':>10}{'macro-F1':>10}{'certainty':>11}{'ECE':>8}")
+    for row in results:
+        mark = " ⭐" if row is best else " ← config" if row["k"] == current_k and row["voting"] == "majority" else ""
+        print(f"{row['voting']:<10}{row['k']:>4}{row['accuracy']:>10.3f}{row['macro_f1']:>10.3f}"
+              f"{row['mean_certainty']:>11.3f}{row['ece']:>8.3f}{mark}")
+    print(f"Best macro-F1: {best['voting']} voting with k={best['k']} ({best['macro_f1']:.3f})")
+
+
+if __name__ == "__main__":
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from config import K_NEIGHBORS
+    from serving_state import load_serving_state
+    from models.index_factory import prepare_vectors
+    from models.knn import leave_one_out_neighbors
+
+    parser = argparse.ArgumentParser(description="Leave-one-out K / voting sweep on the serving bundle.")
+    parser.add_argument("--max-k", type=int, default=30)
+    parser.add_argument("--output", help="Also save the results as JSON")
+    args = parser.parse_args()
+
+    state = load_serving_state()
+    vectors = prepare_vectors(state.index.reconstruct_n(0, state.index.ntotal), state.metric)
+    distances, indices = leave_one_out_neighbors(state.index, vectors, args.max_k)
+    results = leave_one_out_sweep(distances, indices, state.labels, state.metric)
+    print(f"📊 Leave-one-out sweep over {len(vectors)} indexed posts (artifacts {state.version}):")
+    print_sweep(results, K_NEIGHBORS)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"artifact_version": state.version, "results": results}, f, indent=2)
+        print(f"🧾 Results saved to {args.output}")
@@ -0,0 +1,143 @@
+"""
+Exports the SentenceTransformer encoder to ONNX (fp32 and dynamically int8-quantized) for the
+"onnx" and "onnx-int8" backends in encoders.py, then checks whether the faster backends are safe to use:
+- cosine agreement between each backend's embeddings and the original fp32 PyTorch embeddings
+- kNN label agreement: how often the majority-vote cluster from the FAISS index stays the same
+- encoding speed of each backend on the same texts
+
+Run from the repository root:  python models/export_onnx.py [--sample 500]
+Needs the optional ONNX packages: pip install -r requirements-onnx.txt
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+import torch
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import EMBEDDING_MODEL, ONNX_MODEL_DIR, K_NEIGHBORS
+from encoders import (SentenceTransformerEncoder, OnnxEncoder, ONNX_FP32_FILE, ONNX_INT8_FILE, ONNX_CONFIG_FILE)
+from serving_state import load_serving_state, load_row_ids
+from models.knn import neighbor_labels, majority_vote
+
+parser = argparse.ArgumentParser(description="Export the encoder to ONNX and compare it against PyTorch.")
+parser.add_argument("--output-dir", default=ONNX_MODEL_DIR)
+parser.add_argument("--sample", type=int, default=500, help="Number of labelled posts used for the comparison")
+parser.add_argument("--texts", default="id_to_text.json", help="Labelled post texts (id -> text)")
+parser.add_argument("--skip-export", action="store_true", help="Only re-run the comparison")
+args = parser.parse_args()
+
+os.makedirs(args.output_dir, exist_ok=True)
+reference = SentenceTransformerEncoder(EMBEDDING_MODEL)
+
+# ----------------------
+# Export
+# ----------------------
+if not args.skip_export:
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    transformer = reference.model[0].auto_model.eval()
+    tokenizer = reference.model.tokenizer
+    dummy = tokenizer(["a short example sentence"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in dummy]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["token_embeddings"] = {0: "batch", 1: "sequence"}
+
+    fp32_path = os.path.join(args.output_dir, ONNX_FP32_FILE)
+    int8_path = os.path.join(args.output_dir, ONNX_INT8_FILE)
+
+    print(f"📦 Exporting {EMBEDDING_MODEL} to {fp32_path}...")
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            tuple(dummy[name] for name in input_names),
+            fp32_path,
+            input_names=input_names,
+            output_names=["token_embeddings"],
+            dynamic_axes=dynamic_axes,
+            opset_version=14,
+        )
+
+    print(f"🗜️ Quantizing weights to int8: {int8_path}...")
+    quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+
+    # Everything OnnxEncoder needs to reproduce the SentenceTransformer pipeline
+    tokenizer.save_pretrained(args.output_dir)
+    module_names = [type(module).__name__ for module in reference.model]
+    with open(os.path.join(args.output_dir, ONNX_CONFIG_FILE), "w", encoding="utf-8") as f:
+        json.dump({
+            "model_name": EMBEDDING_MODEL,
+            "dimension": reference.dimension,
+            "max_seq_length": reference.max_seq_length,
+            "pooling": "mean",
+            "normalize": "Normalize" in module_names,
+        }, f, indent=2)
+
+    for path in (fp32_path, int8_path):
+        print(f"  {path}: {os.path.getsize(path) / 1e6:.1f} MB")
+
+# ----------------------
+# Agreement report
+# ----------------------
+with open(args.texts, "r", encoding="utf-8") as f:
+    id_to_text = json.load(f)
+
+state = load_serving_state()
+index_map = load_row_ids()
+
+rng = np.random.default_rng(42)
+sample_ids = [index_map[i] for i in rng.choice(len(index_map), size=min(args.sample, len(index_map)), replace=False)]
+texts = [id_to_text[i] for i in sample_ids]
+
+
+def knn_labels(embeddings):
+    # The sampled posts are in the index themselves, so drop the first neighbour (the post itself)
+    _, indices = state.index.search(embeddings, K_NEIGHBORS + 1)
+    labels, _ = majority_vote(neighbor_labels(state.labels, indices[:, 1:]))
+    return labels.tolist()
+
+
+def timed_encode(encoder):
+    start = time.perf_counter()
+    embeddings = encoder.encode(texts, batch_size=32)
+    return embeddings, time.perf_counter() - start
+
+
+print(f"\n🔍 Comparing backends on {len(texts)} labelled posts...")
+reference_embeddings, reference_seconds = timed_encode(reference)
+reference_labels = knn_labels(reference_embeddings)
+
+report = {
+    "model": EMBEDDING_MODEL,
+    "sample_size": len(texts),
+    "k": K_NEIGHBORS,
+    "backends": {"sentence-transformers": {"ms_per_post": 1000 * reference_seconds / len(texts)}},
+}
+
+for backend, model_file in (("onnx", ONNX_FP32_FILE), ("onnx-int8", ONNX_INT8_FILE)):
+    embeddings, seconds = timed_encode(OnnxEncoder(args.output_dir, model_file))
+    cosine = np.sum(embeddings * reference_embeddings, axis=1) / (
+        np.linalg.norm(embeddings, axis=1) * np.linalg.norm(reference_embeddings, axis=1))
+    labels = knn_labels(embeddings)
+    report["backends"][backend] = {
+        "ms_per_post": 1000 * seconds / len(texts),
+        "speedup": reference_seconds / seconds,
+        "cosine_mean": float(cosine.mean()),
+        "cosine_p01": float(np.percentile(cosine, 1)),
+        "cosine_min": float(cosine.min()),
+        "knn_label_agreement": float(np.mean([a == b for a, b in zip(labels, reference_labels)])),
+    }
+
+print(f"\n{'backend':<22}{'ms/post':>10}{'speedup':>10}{'cos mean':>10}{'cos p01':>10}{'cos min':>10}{'kNN agree':>11}")
+for backend, row in report["backends"].items():
+    print(f"{backend:<22}{row['ms_per_post']:>10.2f}{row.get('speedup', 1.0):>10.2f}"
+          f"{row.get('cosine_mean', 1.0):>10.4f}{row.get('cosine_p01', 1.0):>10.4f}"
+          f"{row.get('cosine_min', 1.0):>10.4f}{row.get('knn_label_agreement', 1.0):>11.3f}")
+
+report_path = os.path.join(args.output_dir, "agreement_report.json")
+with open(report_path, "w", encoding="utf-8") as f:
+    json.dump(report, f, indent=2)
+print(f"\n🧾 Report saved to {report_path}")
@@ -0,0 +1,73 @@
+# index_factory.py
+# Builds the kNN index chosen in config.py and applies its search-time settings.
+#
+# Index types (config.INDEX_TYPE):
+#   "flat"      exact search, scans every vector (the original IndexFlatL2)
+#   "ivf_flat"  inverted file: only the INDEX_NPROBE nearest of INDEX_NLIST lists are scanned
+#   "ivf_pq"    inverted file with product-quantized vectors (much smaller, approximate distances)
+#   "hnsw"      graph index, searched with INDEX_EF_SEARCH candidates
+# With INDEX_METRIC = "cosine" vectors are L2-normalised and compared by inner product.
+
+import numpy as np
+import faiss
+from config import (INDEX_TYPE, INDEX_METRIC, INDEX_NLIST, INDEX_PQ_M, INDEX_HNSW_M, INDEX_NPROBE,
+                    INDEX_EF_SEARCH)
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+INDEX_METRICS = ("l2", "cosine")
+
+
+def factory_string(index_type, num_vectors, nlist=INDEX_NLIST, pq_m=INDEX_PQ_M, hnsw_m=INDEX_HNSW_M):
+    if index_type == "flat":
+        return "Flat"
+    if index_type in ("ivf_flat", "ivf_pq"):
+        # FAISS wants roughly 39+ training points per list
+        nlist = max(1, min(nlist, num_vectors // 39))
+        return f"IVF{nlist},Flat" if index_type == "ivf_flat" else f"IVF{nlist},PQ{pq_m}"
+    if index_type == "hnsw":
+        return f"HNSW{hnsw_m}"
+    raise ValueError(f"Unknown index type: {index_type} (expected one of {INDEX_TYPES})")
+
+
+def prepare_vectors(embeddings, metric=INDEX_METRIC):
+    # float32, C-contiguous and, for cosine, unit length (applies to queries as well as the corpus)
+    vectors = np.ascontiguousarray(embeddings, dtype=np.float32)
+    if metric == "cosine":
+        vectors = vectors.copy()
+        faiss.normalize_L2(vectors)
+    return vectors
+
+
+def build_index(embeddings, index_type=INDEX_TYPE, metric=INDEX_METRIC, **params):
+    if metric not in INDEX_METRICS:
+        raise ValueError(f"Unknown index metric: {metric} (expected one of {INDEX_METRICS})")
+    vectors = prepare_vectors(embeddings, metric)
+    faiss_metric = faiss.METRIC_INNER_PRODUCT if metric == "cosine" else faiss.METRIC_L2
+
+    index = faiss.index_factory(vectors.shape[1], factory_string(index_type, len(vectors), **params), faiss_metric)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf = faiss.downcast_index(ivf)
+    if hasattr(ivf, "do_polysemous_training"):
+        # The factory enables polysemous training for PQ, which is slow and only helps polysemous search
+        ivf.do_polysemous_training = False
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    apply_search_params(index)
+    return index
+
+
+def apply_search_params(index, nprobe=INDEX_NPROBE, ef_search=INDEX_EF_SEARCH):
+    # Search-time knobs are not stored in the index file, so they are set again after every load
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = min(nprobe, ivf.nlist)
+    if hasattr(index, "hnsw"):
+        index.hnsw.efSearch = ef_search
+    return index
+
+
+def index_description(index_type=INDEX_TYPE, metric=INDEX_METRIC):
+    # Stored in the serving bundle manifest so the server knows how to prepare queries
+    return {"index_kind": index_type, "index_metric": metric}
@@ -0,0 +1,36 @@
+# knn.py
+# Vectorised kNN label voting, shared by the web app, the CLI and training.
+
+import numpy as np
+
+# Label used for "no neighbour" (FAISS returns index -1 when k exceeds the number of vectors)
+MISSING_LABEL = np.iinfo(np.int16).min
+
+
+def neighbor_labels(labels, indices):
+    # labels: int array in index row order; indices: (n, k) FAISS result -> (n, k) label array
+    found = indices >= 0
+    return np.where(found, np.asarray(labels)[np.where(found, indices, 0)], MISSING_LABEL)
+
+
+def majority_vote(neighbor_label_rows):
+    # Returns (label, count) per row. Ties go to the label of the nearer neighbour,
+    # the same rule as Counter(...).most_common(1) over the neighbours in distance order.
+    rows = np.asarray(neighbor_label_rows)
+    agree = (rows[:, :, None] == rows[:, None, :]).sum(axis=2)
+    agree[rows == MISSING_LABEL] = 0
+    best = agree.argmax(axis=1)
+    picked = np.arange(len(rows))
+    return rows[picked, best], agree[picked, best]
+
+
+def leave_one_out_neighbors(index, vectors, k):
+    # Neighbours of every indexed vector in an index built on all of them, leaving out the vector
+    # itself: one search of k + 1 neighbours instead of a second index built without a test split.
+    # `vectors` must be prepared the same way as the index (see index_factory.prepare_vectors).
+    distances, indices = index.search(vectors, k + 1)
+    is_self = indices == np.arange(len(vectors))[:, None]
+    # Stable sort puts the non-self neighbours first, in distance order; if the query itself wasn't
+    # returned (approximate index, duplicate vectors) the farthest neighbour is dropped instead
+    keep = np.argsort(is_self, axis=1, kind="stable")[:, :k]
+    return np.take_along_axis(distances, keep, axis=1), np.take_along_axis(indices, keep, axis=1)
@@ -0,0 +1,101 @@
+"""
+Compact, precompressed payloads for the UMAP map on the web page (served by /umap in routes.py).
+
+Instead of one JSON object per point, the payload is columnar:
+  {"version": "...", "count": n, "clusters": ["1", "13", ...],
+   "x": <base64 float16>, "y": <base64 float16>, "c": <base64 uint16 index into "clusters">}
+(little-endian arrays). It is gzip-compressed once when built, not per request.
+
+Two levels of detail are written next to umap_data.json:
+  umap_map.json.gz       every point
+  umap_map_lod.json.gz   a stratified sample of at most LOD_POINTS points (every cluster kept), drawn first
+
+5train_model.py builds them after the UMAP projection. To rebuild them from an existing umap_data.json:
+  python models/map_assets.py [--source app/umap_data.json]
+"""
+
+import argparse
+import base64
+import gzip
+import hashlib
+import json
+import os
+import numpy as np
+
+MAP_FULL_FILE = "umap_map.json.gz"
+MAP_LOD_FILE = "umap_map_lod.json.gz"
+LOD_POINTS = 1000
+
+
+def _b64(array):
+    return base64.b64encode(np.ascontiguousarray(array).tobytes()).decode("ascii")
+
+
+def map_payload(x, y, clusters):
+    x = np.asarray(x, dtype="<f2")
+    y = np.asarray(y, dtype="<f2")
+    labels = np.asarray([str(c) for c in clusters])
+    names, codes = np.unique(labels, return_inverse=True)
+    payload = {"count": int(len(x)), "clusters": names.tolist(), "x": _b64(x), "y": _b64(y),
+               "c": _b64(codes.astype("<u2"))}
+    payload["version"] = hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+    return payload
+
+
+def lod_sample(clusters, max_points=LOD_POINTS, seed=42):
+    # Rows of a sample with each cluster's share of the points (at least one point per cluster), in original order
+    labels = np.asarray([str(c) for c in clusters])
+    if len(labels) <= max_points:
+        return np.arange(len(labels))
+    rng = np.random.default_rng(seed)
+    rows = []
+    for label in np.unique(labels):
+        members = np.flatnonzero(labels == label)
+        take = max(1, int(round(max_points * len(members) / len(labels))))
+        rows.append(rng.choice(members, size=min(take, len(members)), replace=False))
+    return np.sort(np.concatenate(rows))
+
+
+def encode_payload(payload):
+    # mtime=0 keeps the compressed bytes identical for identical payloads
+    return gzip.compress(json.dumps(payload, separators=(",", ":")).encode("utf-8"), compresslevel=9, mtime=0)
+
+
+def build_map_payloads(x, y, clusters, max_points=LOD_POINTS):
+    # (full payload, level-of-detail payload), each gzip-compressed
+    x, y, clusters = np.asarray(x), np.asarray(y), np.asarray([str(c) for c in clusters])
+    rows = lod_sample(clusters, max_points)
+    return encode_payload(map_payload(x, y, clusters)), encode_payload(map_payload(x[rows], y[rows], clusters[rows]))
+
+
+def payloads_from_records(records, max_points=LOD_POINTS):
+    # From the umap_data.json format: [{"x": ..., "y": ..., "cluster": ...}, ...]
+    return build_map_payloads([r["x"] for r in records], [r["y"] for r in records],
+                              [r["cluster"] for r in records], max_points)
+
+
+def write_map_assets(x, y, clusters, out_dir, max_points=LOD_POINTS):
+    full, lod = build_map_payloads(x, y, clusters, max_points)
+    os.makedirs(out_dir, exist_ok=True)
+    for name, data in ((MAP_FULL_FILE, full), (MAP_LOD_FILE, lod)):
+        path = os.path.join(out_dir, name)
+        with open(path + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(path + ".tmp", path)
+    return {MAP_FULL_FILE: len(full), MAP_LOD_FILE: len(lod)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the compressed UMAP map payloads from umap_data.json.")
+    parser.add_argument("--source", default=os.path.join("app", "umap_data.json"))
+    parser.add_argument("--lod-points", type=int, default=LOD_POINTS)
+    args = parser.parse_args()
+
+    with open(args.source, "r", encoding="utf-8") as f:
+        records = json.load(f)
+    out_dir = os.path.dirname(args.source)
+    sizes = write_map_assets([r["x"] for r in records], [r["y"] for r in records], [r["cluster"] for r in records],
+                             out_dir, args.lod_points)
+    print(f"🗺️ {len(records)} points: {args.source} is {os.path.getsize(args.source) / 1e3:.1f} kB")
+    for name, size in sizes.items():
+        print(f"  {os.path.join(out_dir, name)}: {size / 1e3:.1f} kB")
@@ -0,0 +1,160 @@
+# prototypes.py
+# Cluster prototypes for a fast path in front of the kNN search.
+#
+# Each cluster is summarised by its centroid, or by a few medoids (members nearest to the centres
+# of a small k-means inside the cluster), so the whole prototype matrix is about 20 rows.
+# An input is scored against every prototype (a cluster's score is its best prototype's); when
+# the margin between the best and second-best cluster is at least the threshold the best cluster
+# is the answer, otherwise the input goes to the full kNN search and vote. The cost of the fast
+# path does not depend on the number of indexed posts.
+#
+# Scores are the cosine similarity (INDEX_METRIC = "cosine") or minus the L2 distance, both on
+# vectors prepared like the index (index_factory.prepare_vectors), so margins are in those units.
+
+import numpy as np
+import faiss
+
+# Agreement with the kNN vote that the margin chosen at training time has to reach
+TARGET_AGREEMENT = 0.98
+MARGIN_QUANTILES = np.linspace(0, 1, 101)
+
+
+def build_prototypes(vectors, labels, per_cluster=1, metric="l2", seed=42):
+    """
+    vectors: prepared vectors (n, d); labels: int cluster label per row.
+    Returns (prototypes (m, d) float32, prototype labels (m,) int16), grouped by label.
+    """
+    labels = np.asarray(labels).astype(np.int64)
+    prototypes, prototype_labels = [], []
+    for label in np.unique(labels):
+        members = np.ascontiguousarray(vectors[labels == label], dtype=np.float32)
+        if len(members) == 1:
+            centres = members
+        elif per_cluster <= 1:
+            centres = members.mean(axis=0, keepdims=True)
+            if metric == "cosine":
+                faiss.normalize_L2(centres)
+        else:
+            kmeans = faiss.Kmeans(members.shape[1], min(per_cluster, len(members)), niter=20, seed=seed)
+            kmeans.train(members)
+            # The member nearest each k-means centre, so every prototype is a real post
+            centres = members[np.unique(_nearest_members(members, kmeans.centroids))]
+        prototypes.append(centres)
+        prototype_labels += [label] * len(centres)
+    return np.vstack(prototypes).astype(np.float32), np.array(prototype_labels, dtype=np.int16)
+
+
+def _nearest_members(members, centres):
+    index = faiss.IndexFlatL2(members.shape[1])
+    index.add(members)
+    _, nearest = index.search(np.ascontiguousarray(centres, dtype=np.float32), 1)
+    return nearest.ravel()
+
+
+class PrototypeClassifier:
+    def __init__(self, prototypes, prototype_labels, metric="l2", margin=None, certainty=None):
+        # margin: fast path threshold (None or inf: never take it); certainty: cluster id -> certainty
+        # reported for fast-path answers (the mean kNN certainty of such posts at training time)
+        self.prototypes = np.ascontiguousarray(prototypes, dtype=np.float32)
+        labels = np.asarray(prototype_labels)
+        self.prototype_labels = labels
+        self.clusters, starts = np.unique(labels, return_index=True)
+        self.starts = np.sort(starts)
+        self.metric = metric
+        self.margin = float("inf") if margin is None else float(margin)
+        self.certainty = {str(cluster): value for cluster, value in (certainty or {}).items()}
+        self.squared_norms = (self.prototypes ** 2).sum(axis=1)
+
+    def similarity(self, vectors):
+        # (n, prototypes) score of every prototype
+        dot = vectors @ self.prototypes.T
+        if self.metric == "cosine":
+            return dot
+        squared = (vectors ** 2).sum(axis=1, keepdims=True) - 2 * dot + self.squared_norms
+        return -np.sqrt(np.maximum(squared, 0))
+
+    def scores(self, vectors, similarity=None):
+        # (n, clusters) score of every cluster: the best of its prototypes
+        similarity = self.similarity(vectors) if similarity is None else similarity
+        return np.maximum.reduceat(similarity, self.starts, axis=1)
+
+    def predict(self, vectors, similarity=None):
+        # Returns (best cluster, margin over the second best) per row
+        scores = self.scores(vectors, similarity)
+        if scores.shape[1] == 1:
+            return np.repeat(self.clusters, len(scores)), np.full(len(scores), np.inf)
+        top_two = -np.partition(-scores, 1, axis=1)[:, :2]
+        return self.clusters[scores.argmax(axis=1)], top_two[:, 0] - top_two[:, 1]
+
+    def fast_certainty(self, cluster):
+        return self.certainty.get(str(cluster), self.certainty.get("all", 1.0))
+
+
+def leave_one_out_predict(classifier, vectors, labels, centroids=True):
+    """
+    predict() for the posts the prototypes were built from, with each post left out of its own
+    cluster's prototypes (like knn.leave_one_out_neighbors for the kNN vote), so margins, hit rate
+    and agreement measured on them aren't flattered by the post having shaped its own prototype.
+    centroids=True: one mean per cluster, recomputed without the post (a cluster of one gets -inf);
+    otherwise medoids: a prototype that is the post itself is skipped.
+    """
+    similarity = classifier.similarity(vectors)
+    labels = np.asarray(labels)
+    own_cluster = np.searchsorted(classifier.clusters, labels)
+    if centroids:
+        sums = np.zeros((len(classifier.clusters), vectors.shape[1]))
+        np.add.at(sums, own_cluster, vectors)
+        counts = np.bincount(own_cluster, minlength=len(classifier.clusters))[own_cluster]
+        rest = (sums[own_cluster] - vectors) / np.maximum(counts - 1, 1)[:, None]
+        if classifier.metric == "cosine":
+            own = (vectors * rest).sum(axis=1) / np.maximum(np.linalg.norm(rest, axis=1), 1e-12)
+        else:
+            own = -np.linalg.norm(vectors - rest, axis=1)
+        rows = np.arange(len(vectors))
+        similarity[rows, classifier.starts[own_cluster]] = np.where(counts > 1, own, -np.inf)
+    else:
+        # Medoids are copies of member vectors, so the post itself is an exact match of its own cluster
+        prototype_rows = {(int(label), row.tobytes()): j
+                          for j, (label, row) in enumerate(zip(classifier.prototype_labels, classifier.prototypes))}
+        for i, (label, row) in enumerate(zip(labels, np.ascontiguousarray(vectors, dtype=np.float32))):
+            j = prototype_rows.get((int(label), row.tobytes()))
+            if j is not None:
+                similarity[i, j] = -np.inf
+    return classifier.predict(vectors, similarity)
+
+
+def margin_report(margins, prototype_labels, knn_labels, true_labels, thresholds):
+    # Hit rate, agreement with kNN on the fast path and accuracy of the tiered classifier per threshold
+    rows = []
+    for threshold in thresholds:
+        fast = margins >= threshold
+        tiered = np.where(fast, prototype_labels, knn_labels)
+        rows.append({
+            "margin": float(threshold),
+            "hit_rate": float(fast.mean()),
+            "agreement": float((prototype_labels[fast] == knn_labels[fast]).mean()) if fast.any() else 1.0,
+            "accuracy": float((tiered == true_labels).mean()),
+        })
+    return rows
+
+
+def choose_margin(margins, prototype_labels, knn_labels, target=TARGET_AGREEMENT):
+    # Smallest margin (from the quantiles of the training margins) at which the fast path agrees with
+    # kNN on at least `target` of the posts it answers; inf if none does
+    for threshold in np.unique(np.quantile(margins[np.isfinite(margins)], MARGIN_QUANTILES)):
+        fast = margins >= threshold
+        if fast.any() and (prototype_labels[fast] == knn_labels[fast]).mean() >= target:
+            return float(threshold)
+    return float("inf")
+
+
+def fast_path_certainty(margins, prototype_labels, knn_certainty, margin):
+    # Certainty to report for fast-path answers, per cluster: the mean share of agreeing neighbours
+    # the kNN vote gave the training posts that take the fast path ("all": over every cluster)
+    fast = margins >= margin
+    if not fast.any():
+        return {}
+    certainty = {"all": round(float(knn_certainty[fast].mean()), 4)}
+    for cluster in np.unique(prototype_labels[fast]):
+        certainty[str(cluster)] = round(float(knn_certainty[fast & (prototype_labels == cluster)].mean()), 4)
+    return certainty
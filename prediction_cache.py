@@ -0,0 +1,108 @@
+# prediction_cache.py
+# Bounded LRU + TTL cache for /predict, so resubmitted or lightly edited text
+# (edit-and-retry in the interface) doesn't pay for another encode.
+#
+# Entries are keyed by a SHA-256 of the cleaned input text. Only the hash, the
+# embedding vector and the kNN result are held - never the raw text.
+
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from preprocessing.text_cleaning import clean_text_sbert
+
+
+def text_key(text):
+    # Same normalisation as the training corpus, so trivial edits (case, spacing, URLs) hit the cache
+    return hashlib.sha256(clean_text_sbert(text).encode("utf-8")).hexdigest()
+
+
+def file_fingerprint(*paths):
+    # Identifies a set of loaded artifacts by path, size and modification time
+    digest = hashlib.sha256()
+    for path in paths:
+        stat = os.stat(path)
+        digest.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns};".encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+class PredictionCache:
+    def __init__(self, max_entries, ttl_seconds):
+        self.max_entries = int(max_entries)
+        self.ttl = float(ttl_seconds)
+        self.entries = OrderedDict()  # key -> [created_at, embedding, result]
+        self.model_version = None
+        self.artifact_version = None
+
+        self.hits = 0
+        self.embedding_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def bind(self, model_version, artifact_version):
+        # A new encoder makes every stored vector stale. A new index or label map only
+        # makes the kNN results stale - the embeddings can still be searched again.
+        if model_version != self.model_version:
+            if self.entries:
+                self.invalidations += 1
+            self.entries.clear()
+        elif artifact_version != self.artifact_version:
+            if self.entries:
+                self.invalidations += 1
+            for entry in self.entries.values():
+                entry[2] = None
+        self.model_version = model_version
+        self.artifact_version = artifact_version
+
+    def lookup(self, key):
+        # Returns (embedding, result); either may be None
+        if not self.enabled:
+            return None, None
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None, None
+        if self.ttl > 0 and time.monotonic() - entry[0] > self.ttl:
+            del self.entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return None, None
+
+        self.entries.move_to_end(key)
+        if entry[2] is None:
+            self.embedding_hits += 1
+        else:
+            self.hits += 1
+        return entry[1], entry[2]
+
+    def store(self, key, embedding, result):
+        if not self.enabled:
+            return
+        self.entries[key] = [time.monotonic(), embedding, result]
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        lookups = self.hits + self.embedding_hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "embedding_hits": self.embedding_hits,
+            "misses": self.misses,
+            "hit_ratio": round((self.hits + self.embedding_hits) / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "model_version": self.model_version,
+            "artifact_version": self.artifact_version,
+        }
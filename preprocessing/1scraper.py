@@ -4,97 +4,117 @@ Posts are sought by most recent. There used to be a way of searching further bac
 Instead, the script compiles the most recent mental health posts from the specified forums.
 It can be run periodically to enlarge the dataset. Daily, or every few hours? Depends on what rates Reddit sets.
 The script will only download posts that haven't previously been accessed, by making reference to their ID's, which are saved in a .txt file in the data folder.
+Each run's new posts are saved as their own shard in data/raw/store (see raw_store.py); existing posts are never re-read or rewritten.
+The subreddit/category listings are fetched concurrently (scrape_engine.py), within Reddit's rate limit, and retried with backoff on errors.
+Run with --fake to try it against a local stand-in for Reddit (fake_reddit.py) instead of the real API.
 """
 
-import praw
-import json
+import argparse
 import os
-import time
+import sys
 from datetime import datetime, timezone
 
-# Reddit app credentials:
-reddit = praw.Reddit(
-    client_id="dVGQfNLECbg765wP6m9nkw",
-    client_secret="_1DtxzYyS5zmp_9bGKzanUnMNCHd6A",
-    user_agent="MentalHealthNLP"
-)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from preprocessing.scrape_engine import ScrapeEngine, TokenBucket
+from preprocessing.raw_store import open_raw_store
+
+parser = argparse.ArgumentParser(description="Scrape new posts from the mental health subreddits.")
+parser.add_argument("--workers", type=int, default=6, help="Listings fetched at the same time")
+parser.add_argument("--requests-per-second", type=float, default=1.0,
+                    help="Starting request rate; re-tuned from Reddit's rate-limit headers while running")
+parser.add_argument("--max-retries", type=int, default=4)
+parser.add_argument("--fake", action="store_true", help="Use the local Reddit stand-in instead of the API")
+args = parser.parse_args()
+
+
+def make_reddit():
+    # Called once per worker thread: PRAW's Reddit object is not thread-safe
+    import praw
+    # Reddit app credentials:
+    return praw.Reddit(
+        client_id="dVGQfNLECbg765wP6m9nkw",
+        client_secret="_1DtxzYyS5zmp_9bGKzanUnMNCHd6A",
+        user_agent="MentalHealthNLP"
+    )
+
+
+client_factory = make_reddit
+if args.fake:
+    from preprocessing.fake_reddit import FakeReddit, FakeAuth
+    fake_auth = FakeAuth()
+    client_factory = lambda: FakeReddit(auth=fake_auth)
 
 # Subreddits to scrape
 subreddits = ["mentalhealth", "depression", "anxiety", "OCD", "ptsd", "lonely","mentalillness", "CPTSD", "BPD", "addiction", "EatingDisorders", "Psychosis", "neurodiversity", "AnxiousAttachment", "AvoidantAttachment", "emotionalneglect"]
 max_posts_per_subreddit = 1000
 posts_per_category = max_posts_per_subreddit // 3
-categories = {
-    "hot": lambda sub: sub.hot(limit=posts_per_category),
-    "new": lambda sub: sub.new(limit=posts_per_category),
-    "top": lambda sub: sub.top(limit=posts_per_category),
-}
-
-# Load previously seen post IDs
-seen_ids_path = "data/raw/seen_ids.txt"
-seen_ids = set()
-if os.path.exists(seen_ids_path):
-    with open(seen_ids_path, "r") as f:
-        seen_ids = set(f.read().splitlines())
-
-# Load existing data (if any)
-output_path = "data/raw/reddit_posts.json"
-all_posts = []
-if os.path.exists(output_path):
-    with open(output_path, "r", encoding="utf-8") as f:
-        all_posts = json.load(f)
+categories = ["hot", "new", "top"]
+
+# Append-only store of every scraped post (one shard per scrape run); the old
+# data/raw/reddit_posts.json and seen_ids.txt are migrated into it on first use
+store = open_raw_store()
+seen_ids = store.seen_ids
+run_ids = set()
 
 # Determine scrape run number
-existing_scrape_runs = [post.get("scrape_run", 0) for post in all_posts]
-current_scrape_run = max(existing_scrape_runs, default=0) + 1
+current_scrape_run = store.next_run()
 
 # Start scraping
 new_posts = []
+jobs = [(subreddit_name, category_name, posts_per_category)
+        for subreddit_name in subreddits for category_name in categories]
+print(f"🔎 Scraping {len(jobs)} listings ({len(subreddits)} subreddits x {len(categories)} categories) "
+      f"with {args.workers} workers...")
+
+
+def report(job, posts, error):
+    subreddit_name, category_name, _ = job
+    if error is not None:
+        print(f"  ⚠️ r/{subreddit_name} '{category_name}': gave up after {len(posts)} posts due to error: {error}")
+    else:
+        print(f"  📂 r/{subreddit_name} '{category_name}': {len(posts)} posts")
+
+
+engine = ScrapeEngine(client_factory, TokenBucket(rate=args.requests_per_second, capacity=args.workers),
+                      workers=args.workers, max_retries=args.max_retries)
+results = engine.run(jobs, on_done=report)
+
+# Filter and de-duplicate in the original subreddit/category order
+for (subreddit_name, category_name, _), (posts, _) in zip(jobs, results):
+    for post in posts:
+        if (
+            post.id in seen_ids
+            or post.id in run_ids
+            or post.stickied
+            or len(post.selftext.strip()) < 50
+        ):
+            continue
+
+        run_ids.add(post.id)
+        new_post = {
+            "scrape_run": current_scrape_run,
+            "subreddit": subreddit_name,
+            "id": post.id,
+            "title": post.title,
+            "body": post.selftext,
+            "created_utc": datetime.fromtimestamp(post.created_utc, tz=timezone.utc).isoformat(),
+            "url": post.url,
+            "score": post.score,
+            "category": category_name,
+        }
+        new_posts.append(new_post)
+
+print(f"\n📡 {engine.stats['pages']} listing pages requested, {engine.stats['retries']} retries, "
+      f"{engine.stats['failed_jobs']} listings incomplete.")
 
-for subreddit_name in subreddits:
-    subreddit = reddit.subreddit(subreddit_name)
-    print(f"\n🔎 Scraping r/{subreddit_name}...")
-
-    for category_name, fetch_function in categories.items():
-        print(f"  📂 Fetching {posts_per_category} from '{category_name}'...")
-        time.sleep(2)
-        try:
-            for post in fetch_function(subreddit):
-                if (
-                    post.id in seen_ids
-                    or post.stickied
-                    or len(post.selftext.strip()) < 50
-                ):
-                    continue
-
-                seen_ids.add(post.id)
-                new_post = {
-                    "scrape_run": current_scrape_run,
-                    "subreddit": subreddit_name,
-                    "id": post.id,
-                    "title": post.title,
-                    "body": post.selftext,
-                    "created_utc": datetime.fromtimestamp(post.created_utc, tz=timezone.utc).isoformat(),
-                    "url": post.url,
-                    "score": post.score,
-                    "category": category_name,
-                }
-                all_posts.append(new_post)
-                new_posts.append(new_post)
-        except Exception as e:
-            print(f"    ⚠️ Skipped '{category_name}' due to error: {e}")
-        time.sleep(2)
-
-# Save updated dataset
-os.makedirs(os.path.dirname(output_path), exist_ok=True)
-
-with open(output_path, "w", encoding="utf-8") as f:
-    json.dump(all_posts, f, ensure_ascii=False, indent=2)
-
-# Save updated seen_ids
-with open(seen_ids_path, "w", encoding="utf-8") as f:
-    f.write("\n".join(seen_ids))
+# Save this run's posts as a new shard
+if new_posts:
+    info = store.append_run(new_posts, scraped_utc=datetime.now(timezone.utc).isoformat(timespec="seconds"))
+    output_path = os.path.join(store.root, info["shard"])
+else:
+    output_path = store.root
 
 print(f"\n✅ Done! {len(new_posts)} new posts collected.")
 print("Note: though the script is written to scrape up to 333 from 'hot', 'new' and 'top' in four forums - meaning a total of ~4,000 posts (333 * 3 * 4), the actual number returned may be lower for a number of reasons, including that posts under 50 characters are excluded, and that some subreddits may not have much recent content. Despite precautions, the script may also hit a temporary rate limit or Reddit API issue.")
-print(f"📦 Total dataset size: {len(all_posts)} posts")
+print(f"📦 Total dataset size: {store.count()} posts in {len(store.runs)} shards")
 print(f"📁 Saved to: {output_path}")
\ No newline at end of file
@@ -0,0 +1,97 @@
+"""
+Finds near-duplicate posts (reposts and cross-posts under different ids) between 2prepare_dataset.py
+and 3vectorise.py, so they are neither encoded twice nor form artificial dense spots for HDBSCAN.
+
+MinHash/LSH on word shingles of the cleaned text (see dedup.py) finds the candidate pairs without
+comparing every pair of posts. With --confirm-embeddings a pair also needs a cosine similarity of at
+least --embedding-threshold between its embeddings (reused from the embedding store where possible).
+
+Outputs:
+  data/processed/duplicate_groups.json   [{"keep": id, "duplicates": [ids], "subreddits": [...]}, ...]
+  data/processed/cleaned_posts.json      the deduplicated corpus (the earliest post of each group is kept)
+3vectorise.py skips the duplicates too, so the embeddings stay aligned with cleaned_posts.json.
+
+Run from the repository root:  python preprocessing/2b_deduplicate.py [--threshold 0.8] [--confirm-embeddings]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from preprocessing.raw_store import ShardStore, CLEANED_STORE_DIR
+from preprocessing.dedup import duplicate_groups, DUPLICATE_GROUPS_PATH
+
+parser = argparse.ArgumentParser(description="Near-duplicate detection with MinHash/LSH.")
+parser.add_argument("--threshold", type=float, default=0.8, help="Estimated Jaccard similarity of word shingles")
+parser.add_argument("--num-perm", type=int, default=128, help="MinHash signature length")
+parser.add_argument("--shingle-size", type=int, default=3, help="Words per shingle")
+parser.add_argument("--confirm-embeddings", action="store_true", help="Also require similar embeddings")
+parser.add_argument("--embedding-threshold", type=float, default=0.95, help="Cosine similarity for --confirm-embeddings")
+parser.add_argument("--output", default="data/processed/cleaned_posts.json")
+args = parser.parse_args()
+
+cleaned_store = ShardStore(CLEANED_STORE_DIR)
+if not cleaned_store.exists():
+    sys.exit(f"No cleaned posts in {CLEANED_STORE_DIR}: run 2prepare_dataset.py first.")
+
+posts = [(post["id"], post["subreddit"], post["text"]) for post in cleaned_store.iter_posts()]
+ids = [post[0] for post in posts]
+texts = [post[2] for post in posts]
+
+
+def confirm_with_embeddings(pairs):
+    # Cosine similarity of each candidate pair; only the posts in a pair are looked up or encoded
+    from encoders import get_encoder, encoder_version
+    from preprocessing.embedding_store import EmbeddingStore, has_store, text_hash
+
+    version = encoder_version()
+    encoder = None
+    if not has_store(version):
+        encoder = get_encoder()
+    store = EmbeddingStore(version) if encoder is None else EmbeddingStore(version, encoder.dimension)
+
+    involved = np.unique(pairs)
+    involved_ids = [ids[i] for i in involved]
+    hashes = [text_hash(texts[i]) for i in involved]
+    rows = store.lookup(involved_ids, hashes)
+    missing = np.flatnonzero(rows < 0)
+    if len(missing):
+        encoder = encoder or get_encoder()
+        vectors = encoder.encode([texts[involved[i]] for i in missing])
+        rows[missing] = store.append([involved_ids[i] for i in missing], [hashes[i] for i in missing], vectors)
+
+    vectors = np.asarray(store.vectors()[rows], dtype=np.float32)
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    position = {int(i): n for n, i in enumerate(involved)}
+    left = vectors[[position[int(i)] for i in pairs[:, 0]]]
+    right = vectors[[position[int(i)] for i in pairs[:, 1]]]
+    return np.sum(left * right, axis=1) >= args.embedding_threshold
+
+
+print(f"🔍 Looking for near-duplicates among {len(posts)} posts (Jaccard >= {args.threshold})...")
+start = time.perf_counter()
+groups, num_candidates = duplicate_groups(texts, args.threshold, args.num_perm, args.shingle_size,
+                                          confirm=confirm_with_embeddings if args.confirm_embeddings else None)
+seconds = time.perf_counter() - start
+
+duplicate_records = [{
+    "keep": ids[group[0]],
+    "duplicates": [ids[i] for i in group[1:]],
+    "subreddits": sorted({posts[i][1] for i in group}),
+} for group in groups]
+
+with open(DUPLICATE_GROUPS_PATH, "w", encoding="utf-8") as f:
+    json.dump(duplicate_records, f, ensure_ascii=False, indent=2)
+
+duplicate_ids = {post_id for group in duplicate_records for post_id in group["duplicates"]}
+saved = cleaned_store.write_json(args.output, duplicate_ids)
+
+cross_forum = sum(1 for group in duplicate_records if len(group["subreddits"]) > 1)
+print(f"  {num_candidates} LSH candidate pairs checked in {seconds:.1f}s")
+print(f"✅ {len(groups)} duplicate groups ({cross_forum} across subreddits); {len(duplicate_ids)} duplicates removed.")
+print(f"🧾 Groups saved to {DUPLICATE_GROUPS_PATH}")
+print(f"📁 Deduplicated corpus of {saved} posts saved to {args.output}")
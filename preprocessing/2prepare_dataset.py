@@ -1,64 +1,47 @@
-import json
+import argparse
 import os
-import re
+import sys
+from multiprocessing import Pool
 
-def clean_text_sbert(text):
-    # Lowercase
-    text = text.lower()
-    
-    # Remove URLs
-    text = re.sub(r"http\S+", "", text)
-    
-    # Normalize whitespace
-    text = re.sub(r"\s+", " ", text)
-    
-    # Remove common Redditisms
-    reddit_terms = ["tw", "vent", "rant", "update", "throwra", "ama", "crosspost", "cross-post"]
-    for term in reddit_terms:
-        text = re.sub(rf"\b{term}\b", "", text)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from preprocessing.text_cleaning import clean_posts
+from preprocessing.raw_store import open_raw_store, ShardStore, CLEANED_STORE_DIR
+from preprocessing.dedup import load_duplicate_ids
 
-    # Remove mental health labels that could bias clustering - this part seemed to remove too much information, resulting in large amorphous clusters
-    #keyword_patterns = [
-    #    r"\bocd\b", r"\bptsd\b", r"\bcptsd\b", r"\bbpd\b",
-    #    r"\baddict(?:ed|ion)?\b", r"\beating disorder\b", r"\banorexia\b", r"\bbulimia\b",
-    #    r"\badhd\b", r"\bautism\b", r"\bautistic\b", r"\bpsychosis\b", r"\bpsychotic\b",
-    #    r"\bdepression\b",  # keep "depressed", "depressing", etc.
-    #    r"\bemotional neglect\b",
-    #    r"\banxious attachment\b", r"\bavoidant attachment\b"
-    #]
-    #for pattern in keyword_patterns:
-    #    text = re.sub(pattern, "", text)
-
-    # Final whitespace cleanup
-    text = text.strip()
-    text = re.sub(r"\s+", " ", text)
-
-    return text
-
-# Load original dataset
-input_path = "data/raw/reddit_posts.json"
+# Raw posts are streamed shard by shard from the store written by 1scraper.py; each cleaned shard is
+# kept in data/processed/cleaned_store, so only shards added since the last run are cleaned
 output_path = "data/processed/cleaned_posts.json"
 
-with open(input_path, "r", encoding="utf-8") as f:
-    raw_data = json.load(f)
-
-# Clean text
-cleaned_data = []
-
-for post in raw_data:
-    combined_text = post["title"].strip() + " " + post["body"].strip()
-    cleaned_post = {
-        "id": post["id"],
-        "subreddit": post["subreddit"],
-        "category": post["category"],
-        "text": clean_text_sbert(combined_text)
-    }
-    cleaned_data.append(cleaned_post)
-
-# Save cleaned dataset
-os.makedirs(os.path.dirname(output_path), exist_ok=True)
-
-with open(output_path, "w", encoding="utf-8") as f:
-    json.dump(cleaned_data, f, ensure_ascii=False, indent=2)
-
-print(f"✅ SBERT-friendly cleaning complete. Saved {len(cleaned_data)} posts to {output_path}")
\ No newline at end of file
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Clean scraped posts for SBERT.")
+    parser.add_argument("--workers", type=int, default=1, help="Processes used for cleaning (1 = no pool)")
+    parser.add_argument("--all", action="store_true", help="Re-clean every shard, e.g. after changing the cleaning")
+    args = parser.parse_args()
+
+    raw_store = open_raw_store()
+    cleaned_store = ShardStore(CLEANED_STORE_DIR)
+    if not raw_store.runs:
+        sys.exit(f"No scraped posts in {raw_store.root}: run 1scraper.py first.")
+
+    # Clean text
+    pool = Pool(args.workers) if args.workers > 1 else None
+    newly_cleaned = 0
+    try:
+        for info, posts in raw_store.iter_shards():
+            done = cleaned_store.run_info(info["run"])
+            if not args.all and done is not None and done["posts"] == info["posts"]:
+                continue
+            cleaned_store.write_shard(info["run"], clean_posts(posts, pool))
+            newly_cleaned += info["posts"]
+            print(f"  🧹 Cleaned shard {info['shard']} ({info['posts']} posts)")
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    # Combined file for the later pipeline steps (written line by line from the cleaned shards), leaving
+    # out duplicates already found by 2b_deduplicate.py (re-run it to check the new posts)
+    saved = cleaned_store.write_json(output_path, load_duplicate_ids())
+
+    print(f"✅ SBERT-friendly cleaning complete. Cleaned {newly_cleaned} new posts; "
+          f"saved {saved} posts to {output_path}")
@@ -1,35 +1,134 @@
+import argparse
 import json
 import os
+import sys
 import numpy as np
-from sentence_transformers import SentenceTransformer
 
-# Load cleaned dataset
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import EMBEDDING_MODEL, ENCODER_BACKEND
+from encoders import get_encoder, encoder_version
+from preprocessing.raw_store import ShardStore, CLEANED_STORE_DIR
+from preprocessing.embedding_store import EmbeddingStore, has_store, text_hash
+from preprocessing.dedup import load_duplicate_ids
+from preprocessing.encoding_engine import EncodingEngine
+
+# Load cleaned dataset: streamed shard by shard from the cleaned store written by 2prepare_dataset.py
+# (falls back to the combined cleaned_posts.json). Near-duplicates found by 2b_deduplicate.py are skipped.
 input_path = "data/processed/cleaned_posts.json"
 output_embedding_path = "data/processed/post_embeddings.npy"
 output_meta_path = "data/processed/post_metadata.json"
+# Scratch file the encoding engine writes new embeddings into before they are added to the store
+pending_path = "data/processed/pending_embeddings.npy"
+# The outputs are written here first and moved into place once complete, so an interrupted run
+# leaves the previous post_embeddings.npy / post_metadata.json untouched
+partial_embedding_path = output_embedding_path + ".partial"
+partial_meta_path = output_meta_path + ".partial"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Embed the cleaned posts with SBERT.")
+    parser.add_argument("--workers", type=int, default=1, help="Encoding processes (1 = encode in this process)")
+    parser.add_argument("--batch-size", type=int, default=64, help="Most texts per batch")
+    parser.add_argument("--max-batch-tokens", type=int, default=16384, help="Most tokens per batch, padding included")
+    parser.add_argument("--chunk-long", action="store_true",
+                        help="Embed posts past the model's max sequence length as the mean of overlapping chunks")
+    parser.add_argument("--chunk-overlap", type=int, default=32, help="Tokens shared by consecutive chunks")
+    args = parser.parse_args()
+
+    cleaned_store = ShardStore(CLEANED_STORE_DIR)
+    if cleaned_store.exists():
+        duplicate_ids = load_duplicate_ids()
+        shards = [(post for post in posts if post["id"] not in duplicate_ids) for _, posts in cleaned_store.iter_shards()]
+        num_posts = sum(1 for _ in cleaned_store.iter_posts(duplicate_ids))
+    else:
+        with open(input_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        shards = [data]
+        num_posts = len(data)
+
+    # Load SBERT model (backend chosen in config.py) only if there is something to encode
+    model_name = f"sentence-transformers/{EMBEDDING_MODEL}"
+    engine = None
 
-with open(input_path, "r", encoding="utf-8") as f:
-    data = json.load(f)
+    def load_engine():
+        global engine
+        if engine is None:
+            engine = EncodingEngine(get_encoder(), workers=args.workers, batch_size=args.batch_size,
+                                    max_batch_tokens=args.max_batch_tokens, chunk_long=args.chunk_long,
+                                    chunk_overlap=args.chunk_overlap)
+        return engine
 
-texts = [post["text"] for post in data]
+    # Embeddings already computed for the same post text with the same encoder are reused from the store.
+    # Chunk-pooled embeddings of long posts differ from truncated ones, so they are stored separately.
+    version = encoder_version() + (":chunked" if args.chunk_long else "")
+    store = EmbeddingStore(version) if has_store(version) else EmbeddingStore(version, load_engine().dimension)
+    print(f"🔍 Embedding {num_posts} posts using {model_name} ({ENCODER_BACKEND}); {len(store)} embeddings in {store.dir}")
 
-# Load SBERT model (explicitly named)
-model_name = "sentence-transformers/all-MiniLM-L6-v2"
-model = SentenceTransformer(model_name)
+    # Output rows follow the order of post_metadata.json, written straight into the (partial) .npy file used for clustering
+    os.makedirs(os.path.dirname(output_embedding_path), exist_ok=True)
+    embeddings = np.lib.format.open_memmap(partial_embedding_path, mode="w+", dtype=np.float32,
+                                           shape=(num_posts, store.dimension))
 
-# Generate embeddings
-print(f"🔍 Encoding {len(texts)} posts using {model_name}...")
-embeddings = model.encode(texts, show_progress_bar=True)
+    # Save metadata for tracking
+    metadata = []
+    reused = encoded = 0
+    encoding_stats = []
+    try:
+        for posts in shards:
+            posts = list(posts)
+            ids = [post["id"] for post in posts]
+            hashes = [text_hash(post["text"]) for post in posts]
+            rows = store.lookup(ids, hashes)
 
-# Save embeddings as .npy for clustering
-os.makedirs(os.path.dirname(output_embedding_path), exist_ok=True)
-np.save(output_embedding_path, embeddings)
+            missing = np.flatnonzero(rows < 0)
+            if len(missing):
+                # New embeddings go into a preallocated memory-mapped file (written by the engine's
+                # workers), then into the store
+                pending = np.lib.format.open_memmap(pending_path, mode="w+", dtype=np.float32,
+                                                    shape=(len(missing), store.dimension))
+                del pending
+                encoding_stats.append(load_engine().encode([posts[i]["text"] for i in missing], pending_path))
+                vectors = np.load(pending_path, mmap_mode="r")
+                rows[missing] = store.append([ids[i] for i in missing], [hashes[i] for i in missing], vectors)
+                del vectors
+            reused += len(posts) - len(missing)
+            encoded += len(missing)
 
-# Save metadata for tracking
-metadata = [{"id": post["id"], "subreddit": post["subreddit"], "category": post["category"]} for post in data]
+            start = len(metadata)
+            embeddings[start:start + len(posts)] = store.vectors()[rows]
+            metadata.extend({"id": post["id"], "subreddit": post["subreddit"], "category": post["category"]} for post in posts)
+    except BaseException:
+        # Keep the previous outputs; the partial file is as large as the full output
+        del embeddings
+        os.remove(partial_embedding_path)
+        raise
+    finally:
+        if engine is not None:
+            engine.close()
+        if os.path.exists(pending_path):
+            os.remove(pending_path)
+    embeddings.flush()
+    del embeddings
 
-with open(output_meta_path, "w", encoding="utf-8") as f:
-    json.dump(metadata, f, ensure_ascii=False, indent=2)
+    with open(partial_meta_path, "w", encoding="utf-8") as f:
+        json.dump(metadata, f, ensure_ascii=False, indent=2)
+    os.replace(partial_embedding_path, output_embedding_path)
+    os.replace(partial_meta_path, output_meta_path)
 
-print(f"✅ Embeddings saved to: {output_embedding_path}")
-print(f"🧾 Metadata saved to: {output_meta_path}")
\ No newline at end of file
+    print(f"♻️ Reused {reused} stored embeddings, encoded {encoded} new or changed posts.")
+    if encoding_stats:
+        tokens = sum(s["tokens"] for s in encoding_stats)
+        padded = sum(s["padded_tokens"] for s in encoding_stats)
+        seconds = sum(s["seconds"] for s in encoding_stats)
+        corpus_order = (sum(s["corpus_order_tokens"] for s in encoding_stats)
+                        / sum(s["corpus_order_padded_tokens"] for s in encoding_stats))
+        print(f"⚡ {tokens / seconds:.0f} tokens/s with {args.workers} worker(s); padding efficiency "
+              f"{tokens / padded:.1%} (in corpus order with batches of 32: {corpus_order:.1%})")
+        truncated = sum(s["truncated_texts"] for s in encoding_stats)
+        chunked = sum(s["chunked_texts"] for s in encoding_stats)
+        if truncated:
+            print(f"✂️ {truncated} posts were longer than the model's max sequence length and truncated "
+                  f"(--chunk-long embeds them in full).")
+        if chunked:
+            print(f"🧩 {chunked} long posts embedded as the mean of {sum(s['chunks'] for s in encoding_stats)} chunks.")
+    print(f"✅ Embeddings saved to: {output_embedding_path}")
+    print(f"🧾 Metadata saved to: {output_meta_path}")
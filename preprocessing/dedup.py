@@ -0,0 +1,136 @@
+"""
+Near-duplicate detection with MinHash and locality-sensitive hashing (LSH).
+
+- each post becomes a set of word shingles (runs of `shingle_size` words), hashed to 32 bits
+- a MinHash signature of `num_perm` values estimates the Jaccard similarity between two such sets
+- LSH splits each signature into bands; posts sharing any band bucket become candidate pairs,
+  so only likely duplicates are compared (no all-pairs comparison)
+- candidates whose estimated Jaccard similarity reaches the threshold are joined into groups
+  with union-find; optionally, a pair must also have close embeddings
+
+Used by 2b_deduplicate.py.
+"""
+
+import itertools
+import json
+import os
+import zlib
+from collections import defaultdict
+import numpy as np
+
+MERSENNE_PRIME = (1 << 31) - 1
+DUPLICATE_GROUPS_PATH = "data/processed/duplicate_groups.json"
+
+
+def shingle_hashes(text, shingle_size=3):
+    words = text.split()
+    if len(words) <= shingle_size:
+        shingles = {" ".join(words)} if words else set()
+    else:
+        shingles = {" ".join(words[i:i + shingle_size]) for i in range(len(words) - shingle_size + 1)}
+    return np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+
+
+class MinHasher:
+    def __init__(self, num_perm=128, shingle_size=3, seed=42):
+        rng = np.random.default_rng(seed)
+        # Universal hash functions h(x) = (a*x + b) mod p; a, b < 2^31 and x < 2^31 keep a*x + b inside uint64
+        self.a = rng.integers(1, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+
+    def signature(self, text):
+        # None for a text without any words (it can't be compared)
+        hashes = shingle_hashes(text, self.shingle_size)
+        if not len(hashes):
+            return None
+        hashes %= MERSENNE_PRIME
+        return ((self.a[:, None] * hashes[None, :] + self.b[:, None]) % MERSENNE_PRIME).min(axis=1).astype(np.uint32)
+
+    def signatures(self, texts):
+        # (signatures of the texts that have words, their positions in `texts`)
+        signatures, positions = [], []
+        for i, text in enumerate(texts):
+            signature = self.signature(text)
+            if signature is not None:
+                signatures.append(signature)
+                positions.append(i)
+        if not signatures:
+            return np.zeros((0, self.num_perm), dtype=np.uint32), np.zeros(0, dtype=np.int64)
+        return np.stack(signatures), np.array(positions, dtype=np.int64)
+
+
+def lsh_bands(num_perm, threshold):
+    # Bands x rows = num_perm, chosen so the LSH threshold (1/bands)^(1/rows) is closest to `threshold`
+    options = [(b, num_perm // b) for b in range(1, num_perm + 1) if num_perm % b == 0]
+    return min(options, key=lambda option: abs((1 / option[0]) ** (1 / option[1]) - threshold))
+
+
+def candidate_pairs(signatures, threshold):
+    # Pairs of rows that share at least one LSH band bucket
+    bands, rows = lsh_bands(signatures.shape[1], threshold)
+    pairs = set()
+    for band in range(bands):
+        buckets = defaultdict(list)
+        band_values = np.ascontiguousarray(signatures[:, band * rows:(band + 1) * rows])
+        for i, row in enumerate(band_values):
+            buckets[row.tobytes()].append(i)
+        for members in buckets.values():
+            # Every pair in the bucket: the pairs are filtered by similarity before the union, so
+            # linking only to the first member would miss duplicates that collided with a non-duplicate
+            pairs.update(itertools.combinations(members, 2))
+    return pairs
+
+
+def estimated_jaccard(signatures, pairs):
+    # pairs: (n, 2) array of row pairs
+    return np.mean(signatures[pairs[:, 0]] == signatures[pairs[:, 1]], axis=1)
+
+
+class UnionFind:
+    def __init__(self, n):
+        self.parent = list(range(n))
+
+    def find(self, x):
+        while self.parent[x] != x:
+            self.parent[x] = self.parent[self.parent[x]]
+            x = self.parent[x]
+        return x
+
+    def union(self, x, y):
+        # The smaller index stays the root, so each group is represented by its earliest post
+        x, y = self.find(x), self.find(y)
+        if x != y:
+            self.parent[max(x, y)] = min(x, y)
+
+
+def duplicate_groups(texts, threshold=0.8, num_perm=128, shingle_size=3, confirm=None):
+    """
+    Groups of near-duplicate texts as lists of positions, earliest first (groups of one are left out).
+    `confirm(pairs)`, if given, receives an array of candidate position pairs and returns a boolean
+    array of the pairs to keep (e.g. an embedding-similarity check).
+    Also returns the number of candidate pairs that LSH produced.
+    """
+    hasher = MinHasher(num_perm, shingle_size)
+    signatures, positions = hasher.signatures(texts)
+    pairs = np.array(sorted(candidate_pairs(signatures, threshold)), dtype=np.int64).reshape(-1, 2)
+    matched = positions[pairs[estimated_jaccard(signatures, pairs) >= threshold]]
+    if confirm is not None and len(matched):
+        matched = matched[confirm(matched)]
+
+    union_find = UnionFind(len(texts))
+    for x, y in matched:
+        union_find.union(int(x), int(y))
+    groups = defaultdict(list)
+    for i in np.unique(matched):
+        groups[union_find.find(int(i))].append(int(i))
+    return [sorted(members) for _, members in sorted(groups.items())], len(pairs)
+
+
+def load_duplicate_ids(path=DUPLICATE_GROUPS_PATH):
+    # Ids of every post that duplicates an earlier one (left out of the corpus from 3vectorise.py on)
+    if not os.path.exists(path):
+        return set()
+    with open(path, "r", encoding="utf-8") as f:
+        return {post_id for group in json.load(f) for post_id in group["duplicates"]}
@@ -0,0 +1,103 @@
+"""
+Persistent embedding store, so 3vectorise.py only encodes posts it has not encoded before.
+
+Embeddings are keyed by (post id, hash of the cleaned text) and kept per encoder (model + backend),
+so an edited post or a different model is simply a miss. Each encoder has its own directory:
+  data/processed/embedding_store/<encoder>/meta.json     model and embedding dimension
+  data/processed/embedding_store/<encoder>/vectors.f32   float32 rows, only ever appended to (memory-mapped for reads)
+  data/processed/embedding_store/<encoder>/keys.jsonl    {"id", "text_hash"} of each row, in row order
+
+Vectors are flushed before their keys are written, so a run interrupted mid-append leaves at most
+some unreferenced rows at the end of vectors.f32, which are ignored (and overwritten) next time.
+"""
+
+import hashlib
+import json
+import os
+import re
+import numpy as np
+
+EMBEDDING_STORE_DIR = "data/processed/embedding_store"
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def store_dir(model_version, root=EMBEDDING_STORE_DIR):
+    return os.path.join(root, re.sub(r"[^A-Za-z0-9._-]+", "_", model_version))
+
+
+def has_store(model_version, root=EMBEDDING_STORE_DIR):
+    return os.path.exists(os.path.join(store_dir(model_version, root), "meta.json"))
+
+
+class EmbeddingStore:
+    def __init__(self, model_version, dimension=None, root=EMBEDDING_STORE_DIR):
+        # dimension may be left out for an existing store (it is read from meta.json)
+        self.dir = store_dir(model_version, root)
+        self.vectors_path = os.path.join(self.dir, "vectors.f32")
+        self.keys_path = os.path.join(self.dir, "keys.jsonl")
+
+        meta_path = os.path.join(self.dir, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if dimension is not None and meta["dimension"] != dimension:
+                raise ValueError(f"{self.dir} holds {meta['dimension']}-d embeddings, not {dimension}-d")
+            dimension = meta["dimension"]
+        elif dimension is None:
+            raise ValueError(f"No embedding store in {self.dir}: the embedding dimension is needed to create one")
+        else:
+            os.makedirs(self.dir, exist_ok=True)
+            with open(meta_path, "w", encoding="utf-8") as f:
+                json.dump({"model": model_version, "dimension": dimension}, f, indent=2)
+        self.dimension = dimension
+
+        # (id, text hash) -> row
+        self.rows = {}
+        self.num_rows = 0
+        if os.path.exists(self.keys_path):
+            with open(self.keys_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        key = json.loads(line)
+                        self.rows[(key["id"], key["text_hash"])] = self.num_rows
+                        self.num_rows += 1
+        # Drop any rows written without their keys (interrupted append)
+        size = self.num_rows * 4 * dimension
+        if os.path.exists(self.vectors_path) and os.path.getsize(self.vectors_path) != size:
+            with open(self.vectors_path, "r+b") as f:
+                f.truncate(size)
+
+    def __len__(self):
+        return self.num_rows
+
+    def lookup(self, ids, hashes):
+        # Row of each (id, hash) pair, -1 where it has not been encoded yet
+        return np.array([self.rows.get(key, -1) for key in zip(ids, hashes)], dtype=np.int64)
+
+    def append(self, ids, hashes, vectors):
+        # Stores the vectors of keys not already in the store; returns the row of every key given
+        keys = list(zip(ids, hashes))
+        first_seen = {}
+        for i, key in enumerate(keys):
+            if key not in self.rows:
+                first_seen.setdefault(key, i)
+        new = list(first_seen.values())
+        with open(self.vectors_path, "ab") as f:
+            np.ascontiguousarray(np.asarray(vectors)[new], dtype=np.float32).tofile(f)
+            f.flush()
+            os.fsync(f.fileno())
+        with open(self.keys_path, "a", encoding="utf-8") as f:
+            for i in new:
+                f.write(json.dumps({"id": keys[i][0], "text_hash": keys[i][1]}) + "\n")
+                self.rows[keys[i]] = self.num_rows
+                self.num_rows += 1
+        return np.array([self.rows[key] for key in keys], dtype=np.int64)
+
+    def vectors(self):
+        # Read-only memory map of every stored row
+        if not self.num_rows:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        return np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(self.num_rows, self.dimension))
@@ -0,0 +1,205 @@
+"""
+Corpus encoding for 3vectorise.py (and anything else that embeds many posts at once).
+
+- Length bucketing: texts are sorted by token count (longest first) and batched by a token budget,
+  so each batch is padded only to lengths close to its own, instead of to the longest post among
+  32 neighbours in corpus order.
+- Process pool: with workers > 1 each process loads its own encoder (spawned, with cores / workers
+  threads) and writes its rows straight into the preallocated, memory-mapped .npy output.
+- Chunk-and-pool (optional): posts longer than the encoder's max sequence length are split into
+  overlapping token windows; their embeddings are averaged (weighted by tokens) instead of the
+  text past the limit being silently truncated.
+
+encode() returns statistics, among them tokens per second and padding efficiency
+(real tokens / tokens computed including padding), with the corpus-order figure for comparison.
+"""
+
+import multiprocessing
+import os
+import time
+import numpy as np
+from encoders import get_encoder
+from inference import set_thread_limits
+
+BASELINE_BATCH_SIZE = 32  # SentenceTransformer.encode's default, used for the corpus-order comparison
+
+_worker_encoder = None
+
+
+def _init_worker(backend, num_threads):
+    global _worker_encoder
+    set_thread_limits(num_threads)
+    _worker_encoder = get_encoder(backend)
+
+
+def _encode_batch(task):
+    # Encodes one batch; rows of whole posts go straight into the output file, chunk embeddings
+    # (chunked[i] is True) are returned for pooling: (batch number, [(position in batch, vector), ...])
+    number, out_path, rows, texts, chunked = task
+    vectors = _worker_encoder.encode(texts, batch_size=len(texts))
+    whole = [i for i, is_chunk in enumerate(chunked) if not is_chunk]
+    if whole:
+        out = np.load(out_path, mmap_mode="r+")
+        out[[rows[i] for i in whole]] = vectors[whole]
+        out.flush()
+        del out
+    return number, [(i, vectors[i]) for i, is_chunk in enumerate(chunked) if is_chunk]
+
+
+def token_counts(encoder, texts):
+    # Tokens per text including special tokens, before truncation (words + 2 without a tokenizer)
+    if encoder.tokenizer is None:
+        return np.array([len(text.split()) + 2 for text in texts], dtype=np.int64)
+    input_ids = encoder.tokenizer(list(texts), add_special_tokens=True, truncation=False, verbose=False)["input_ids"]
+    return np.array([len(ids) for ids in input_ids], dtype=np.int64)
+
+
+def chunk_text(encoder, text, overlap):
+    # Windows of at most max_seq_length tokens, each overlapping the previous one by `overlap`
+    # tokens: [(chunk text, tokens including special tokens), ...]
+    if encoder.tokenizer is None:
+        pieces, special = text.split(), 2
+    else:
+        pieces = encoder.tokenizer(text, add_special_tokens=False, truncation=False, verbose=False)["input_ids"]
+        special = encoder.tokenizer.num_special_tokens_to_add()
+    window = encoder.max_seq_length - special
+    step = max(1, window - overlap)
+    chunks = []
+    for start in range(0, max(1, len(pieces) - overlap), step):
+        piece = pieces[start:start + window]
+        chunk = " ".join(piece) if encoder.tokenizer is None else encoder.tokenizer.decode(piece)
+        chunks.append((chunk, len(piece) + special))
+    return chunks
+
+
+def padded_tokens(lengths, batches):
+    return int(sum(len(batch) * lengths[batch].max() for batch in batches if len(batch)))
+
+
+class EncodingEngine:
+    def __init__(self, encoder=None, backend=None, workers=1, batch_size=64, max_batch_tokens=16384,
+                 chunk_long=False, chunk_overlap=32):
+        # `encoder` is used for tokenizing (and for encoding when workers == 1); it is loaded if not given
+        self.encoder = encoder or get_encoder(backend)
+        self.backend = backend
+        self.workers = max(1, int(workers))
+        self.batch_size = batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.chunk_long = chunk_long
+        self.chunk_overlap = chunk_overlap
+        self.pool = None
+
+    @property
+    def dimension(self):
+        return self.encoder.dimension
+
+    def _start_pool(self):
+        if self.pool is None and self.workers > 1:
+            threads = max(1, (os.cpu_count() or 1) // self.workers)
+            # "spawn" avoids forking torch/OpenMP state (same as inference.py)
+            self.pool = multiprocessing.get_context("spawn").Pool(
+                self.workers, initializer=_init_worker, initargs=(self.backend, threads))
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def _items(self, texts, lengths):
+        # (output row, text, tokens, is chunk) for everything to encode
+        limit = self.encoder.max_seq_length
+        items = []
+        for row, (text, length) in enumerate(zip(texts, lengths)):
+            if self.chunk_long and limit and length > limit:
+                items += [(row, chunk, tokens, True) for chunk, tokens in chunk_text(self.encoder, text, self.chunk_overlap)]
+            else:
+                items.append((row, text, min(length, limit) if limit else length, False))
+        return items
+
+    def _batches(self, item_lengths):
+        # Longest first, each batch limited to batch_size texts and max_batch_tokens padded tokens
+        order = np.argsort(-item_lengths, kind="stable")
+        batches, current = [], []
+        for i in order:
+            # The first item of a batch is its longest, so it sets the padded length
+            longest = item_lengths[current[0]] if current else item_lengths[i]
+            if current and (len(current) >= self.batch_size or (len(current) + 1) * longest > self.max_batch_tokens):
+                batches.append(np.array(current))
+                current = []
+            current.append(i)
+        if current:
+            batches.append(np.array(current))
+        return batches
+
+    def encode(self, texts, out_path, show_progress=True):
+        """
+        Encodes `texts` into rows 0..len(texts)-1 of the .npy file `out_path`, which must already exist
+        with shape (len(texts), dimension) (e.g. np.lib.format.open_memmap). Returns the statistics.
+        """
+        start = time.perf_counter()
+        lengths = token_counts(self.encoder, texts)
+        items = self._items(texts, lengths)
+        item_lengths = np.array([item[2] for item in items], dtype=np.int64)
+        batches = self._batches(item_lengths)
+
+        limit = self.encoder.max_seq_length
+        truncated = int(np.sum(lengths > limit)) if limit and not self.chunk_long else 0
+        # What the same texts would cost in corpus order with fixed batches (truncated to the limit)
+        clipped = np.minimum(lengths, limit) if limit else lengths
+        baseline = [np.arange(i, min(i + BASELINE_BATCH_SIZE, len(texts))) for i in range(0, len(texts), BASELINE_BATCH_SIZE)]
+
+        tasks = [(number, out_path, [items[i][0] for i in batch], [items[i][1] for i in batch],
+                  [items[i][3] for i in batch]) for number, batch in enumerate(batches)]
+        if self.workers > 1:
+            self._start_pool()
+            results = self.pool.imap_unordered(_encode_batch, tasks)
+        else:
+            global _worker_encoder
+            _worker_encoder = self.encoder
+            results = map(_encode_batch, tasks)
+
+        # Token-weighted mean of each long post's chunk embeddings
+        pooled = {}
+        done = 0
+        for finished, (number, chunk_vectors) in enumerate(results, 1):
+            for position, vector in chunk_vectors:
+                row, _, weight, _ = items[batches[number][position]]
+                total, weights = pooled.get(row, (0.0, 0.0))
+                pooled[row] = (total + weight * np.asarray(vector, dtype=np.float64), weights + weight)
+            done += len(batches[number])
+            if show_progress and (finished % 20 == 0 or finished == len(batches)):
+                print(f"  encoded {done}/{len(items)}", end="\r")
+        if show_progress and items:
+            print()
+
+        if pooled:
+            out = np.load(out_path, mmap_mode="r+")
+            for row, (total, weights) in pooled.items():
+                vector = total / weights
+                if self.encoder.normalize:
+                    vector /= max(np.linalg.norm(vector), 1e-12)
+                out[row] = vector.astype(np.float32)
+            out.flush()
+            del out
+
+        seconds = time.perf_counter() - start
+        real_tokens = int(item_lengths.sum())
+        padded = padded_tokens(item_lengths, batches)
+        baseline_padded = padded_tokens(clipped, baseline)
+        return {
+            "texts": len(texts),
+            "chunked_texts": len(pooled),
+            "chunks": sum(1 for item in items if item[3]),
+            "truncated_texts": truncated,
+            "batches": len(batches),
+            "tokens": real_tokens,
+            "padded_tokens": padded,
+            "padding_efficiency": real_tokens / padded if padded else 1.0,
+            "corpus_order_tokens": int(clipped.sum()),
+            "corpus_order_padded_tokens": baseline_padded,
+            "corpus_order_padding_efficiency": float(clipped.sum()) / baseline_padded if baseline_padded else 1.0,
+            "seconds": seconds,
+            "tokens_per_second": real_tokens / seconds if seconds else 0.0,
+            "workers": self.workers,
+        }
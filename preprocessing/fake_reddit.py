@@ -0,0 +1,95 @@
+"""
+A local stand-in for the parts of PRAW that 1scraper.py uses, so the scraping engine can be run and
+timed without credentials or network access:  python preprocessing/1scraper.py --fake
+
+Each listing page takes `latency` seconds and fails with probability `failure_rate`, and
+`auth.limits` counts down like Reddit's rate-limit headers.
+"""
+
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+PAGE_SIZE = 100
+
+
+class FakeAuth:
+    def __init__(self, requests_per_window=1000, window_seconds=600):
+        self.requests_per_window = requests_per_window
+        self.window_seconds = window_seconds
+        self.window_start = time.time()
+        self.used = 0
+        self.lock = threading.Lock()
+
+    def request(self):
+        with self.lock:
+            if time.time() - self.window_start >= self.window_seconds:
+                self.window_start, self.used = time.time(), 0
+            self.used += 1
+            if self.used > self.requests_per_window:
+                raise RuntimeError("received 429 HTTP response")
+
+    @property
+    def limits(self):
+        return {
+            "remaining": float(self.requests_per_window - self.used),
+            "reset_timestamp": self.window_start + self.window_seconds,
+            "used": self.used,
+        }
+
+
+class FakeSubreddit:
+    def __init__(self, reddit, name):
+        self.reddit = reddit
+        self.name = name
+
+    def _listing(self, category, limit, params=None):
+        rng = random.Random(f"{self.name}/{category}")
+        posts = []
+        for i in range(self.reddit.posts_per_listing):
+            post_id = f"{self.name[:3].lower()}{category[0]}{i:04d}"
+            posts.append(SimpleNamespace(
+                id=post_id,
+                name=f"t3_{post_id}",
+                title=f"Post {i} in r/{self.name}",
+                selftext=" ".join(rng.choice(("feeling", "anxious", "today", "sleep", "work", "friends", "help"))
+                                  for _ in range(rng.randint(5, 80))),
+                stickied=i == 0,
+                created_utc=1700000000 + i,
+                url=f"https://www.reddit.com/r/{self.name}/comments/{post_id}/",
+                score=rng.randint(0, 500),
+            ))
+        after = (params or {}).get("after")
+        start = next((i + 1 for i, post in enumerate(posts) if post.name == after), 0)
+        return self._pages(posts[start:start + (limit or len(posts))])
+
+    def _pages(self, posts):
+        for i, post in enumerate(posts):
+            if i % PAGE_SIZE == 0:
+                self.reddit.auth.request()
+                time.sleep(self.reddit.latency)
+                if random.random() < self.reddit.failure_rate:
+                    raise ConnectionError("fake network error")
+            yield post
+
+    def hot(self, limit=None, params=None):
+        return self._listing("hot", limit, params)
+
+    def new(self, limit=None, params=None):
+        return self._listing("new", limit, params)
+
+    def top(self, limit=None, params=None):
+        return self._listing("top", limit, params)
+
+
+class FakeReddit:
+    def __init__(self, auth=None, posts_per_listing=250, latency=0.3, failure_rate=0.05):
+        # Share one FakeAuth between clients to model one rate-limit window per account
+        self.auth = auth or FakeAuth()
+        self.posts_per_listing = posts_per_listing
+        self.latency = latency
+        self.failure_rate = failure_rate
+
+    def subreddit(self, name):
+        return FakeSubreddit(self, name)
@@ -0,0 +1,178 @@
+"""
+Append-only, sharded post storage.
+
+A store is a directory with one JSONL shard per scrape run and a small manifest:
+  data/raw/store/manifest.json          {"runs": [{"run": 1, "shard": "run_0001.jsonl", "posts": 812, ...}, ...]}
+  data/raw/store/run_0001.jsonl         one post per line
+  data/raw/store/seen_ids.txt           every post id ever scraped, one per line, only ever appended to
+
+A scrape run writes only its own shard and appends only its new ids, so its cost grows with the
+number of new posts rather than with the corpus. Readers stream the shards one at a time.
+The cleaned posts from 2prepare_dataset.py are kept in a store of the same layout.
+"""
+
+import json
+import os
+from datetime import datetime, timezone
+
+RAW_STORE_DIR = "data/raw/store"
+CLEANED_STORE_DIR = "data/processed/cleaned_store"
+LEGACY_POSTS_PATH = "data/raw/reddit_posts.json"
+LEGACY_SEEN_IDS_PATH = "data/raw/seen_ids.txt"
+
+
+def shard_name(run):
+    return f"run_{run:04d}.jsonl"
+
+
+class ShardStore:
+    def __init__(self, root):
+        self.root = root
+        self.manifest_path = os.path.join(root, "manifest.json")
+        self.manifest = {"runs": []}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                self.manifest = json.load(f)
+
+    def exists(self):
+        return os.path.exists(self.manifest_path)
+
+    @property
+    def runs(self):
+        return self.manifest["runs"]
+
+    def run_info(self, run):
+        return next((info for info in self.runs if info["run"] == run), None)
+
+    def next_run(self):
+        return max((info["run"] for info in self.runs), default=0) + 1
+
+    def count(self):
+        return sum(info["posts"] for info in self.runs)
+
+    def _save_manifest(self):
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def write_shard(self, run, records, **extra):
+        # The shard is complete on disk before the manifest mentions it, so a crash never leaves
+        # a half-written shard in the store (an unlisted shard is simply overwritten next time)
+        os.makedirs(self.root, exist_ok=True)
+        path = os.path.join(self.root, shard_name(run))
+        count = 0
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                count += 1
+        os.replace(path + ".tmp", path)
+
+        info = {"run": run, "shard": shard_name(run), "posts": count,
+                "written_utc": datetime.now(timezone.utc).isoformat(timespec="seconds"), **extra}
+        self.manifest["runs"] = [r for r in self.runs if r["run"] != run] + [info]
+        self.manifest["runs"].sort(key=lambda r: r["run"])
+        self._save_manifest()
+        return info
+
+    def read_shard(self, run):
+        with open(os.path.join(self.root, shard_name(run)), "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    def iter_shards(self):
+        # (manifest entry, posts of that shard) in run order
+        for info in self.runs:
+            yield info, self.read_shard(info["run"])
+
+    def iter_posts(self, skip_ids=frozenset()):
+        for _, posts in self.iter_shards():
+            for post in posts:
+                if post["id"] not in skip_ids:
+                    yield post
+
+    def write_json(self, path, skip_ids=frozenset()):
+        # Every record (except skip_ids) as one JSON list, written line by line; returns the count
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        count = 0
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            f.write("[\n")
+            for post in self.iter_posts(skip_ids):
+                f.write((",\n" if count else "") + json.dumps(post, ensure_ascii=False))
+                count += 1
+            f.write("\n]\n")
+        os.replace(path + ".tmp", path)
+        return count
+
+
+class RawPostStore(ShardStore):
+    def __init__(self, root=RAW_STORE_DIR):
+        super().__init__(root)
+        self.seen_ids_path = os.path.join(root, "seen_ids.txt")
+        self._seen_ids = None
+
+    @property
+    def seen_ids(self):
+        # Loaded once into a set for O(1) membership checks
+        if self._seen_ids is None:
+            self._seen_ids = set()
+            if os.path.exists(self.seen_ids_path):
+                with open(self.seen_ids_path, "r", encoding="utf-8") as f:
+                    self._seen_ids = set(f.read().splitlines())
+            # A run whose ids were not appended (interrupted after its shard was written) is recovered here
+            recorded_through = self.manifest.get("seen_ids_through_run", 0)
+            missing = [info["run"] for info in self.runs if info["run"] > recorded_through]
+            if missing:
+                self._append_seen_ids(post["id"] for run in missing for post in self.read_shard(run))
+        return self._seen_ids
+
+    def _append_seen_ids(self, ids):
+        ids = [i for i in dict.fromkeys(ids) if i not in self._seen_ids]
+        os.makedirs(self.root, exist_ok=True)
+        with open(self.seen_ids_path, "a", encoding="utf-8") as f:
+            for post_id in ids:
+                f.write(post_id + "\n")
+        self._seen_ids.update(ids)
+        self.manifest["seen_ids_through_run"] = max((info["run"] for info in self.runs), default=0)
+        self._save_manifest()
+
+    def append_run(self, posts, **extra):
+        # Stores one scrape run's new posts as a new shard; returns its manifest entry
+        seen_ids = self.seen_ids
+        run = self.next_run()
+        info = self.write_shard(run, posts, **extra)
+        self._append_seen_ids(post["id"] for post in posts if post["id"] not in seen_ids)
+        return info
+
+
+def migrate_legacy(store, posts_path=LEGACY_POSTS_PATH, seen_ids_path=LEGACY_SEEN_IDS_PATH):
+    # One-off conversion of reddit_posts.json / seen_ids.txt into a store (one shard per scrape_run).
+    # seen_ids.txt is migrated on its own too, so posts scraped before are not scraped again.
+    if store.exists() or not (os.path.exists(posts_path) or os.path.exists(seen_ids_path)):
+        return False
+    posts = []
+    if os.path.exists(posts_path):
+        with open(posts_path, "r", encoding="utf-8") as f:
+            posts = json.load(f)
+    by_run = {}
+    for post in posts:
+        by_run.setdefault(post.get("scrape_run", 0), []).append(post)
+    for run in sorted(by_run):
+        store.write_shard(run, by_run[run], migrated_from=posts_path)
+
+    seen = []
+    if os.path.exists(seen_ids_path):
+        with open(seen_ids_path, "r", encoding="utf-8") as f:
+            seen = [line for line in f.read().splitlines() if line]
+    store._seen_ids = set()
+    store._append_seen_ids(seen + [post["id"] for post in posts])
+    return True
+
+
+def open_raw_store(root=RAW_STORE_DIR):
+    store = RawPostStore(root)
+    if migrate_legacy(store):
+        print(f"📦 Migrated {LEGACY_POSTS_PATH} ({len(store.runs)} shards) and {LEGACY_SEEN_IDS_PATH} "
+              f"({len(store.seen_ids)} ids) into {root}")
+    return store
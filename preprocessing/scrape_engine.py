@@ -0,0 +1,130 @@
+"""
+Concurrent, rate-limit-aware fetching of subreddit listings for 1scraper.py.
+
+- every (subreddit, category) listing is a job; jobs run concurrently in a thread pool
+- each worker thread has its own client (PRAW's Reddit object is not thread-safe), made by a client factory,
+  so the engine also runs against a local stand-in such as fake_reddit.FakeReddit
+- all threads share one token bucket, which spends a token per listing page (100 posts) and is re-tuned
+  from the API's rate-limit headers (client.auth.limits: requests remaining and when the window resets)
+- a failed page is retried with exponential backoff, resuming the listing after the last post received
+  instead of skipping the rest of the category
+"""
+
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Reddit listings return at most 100 posts per request
+PAGE_SIZE = 100
+
+
+class TokenBucket:
+    # Allows `rate` requests per second on average, with bursts of up to `capacity`
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def update_from_limits(self, limits, headroom=0.9):
+        # Spread the requests left in the current window evenly over the time until it resets
+        remaining = limits.get("remaining") if limits else None
+        reset_timestamp = limits.get("reset_timestamp") if limits else None
+        if remaining is None or reset_timestamp is None:
+            return
+        seconds_left = max(reset_timestamp - time.time(), 1.0)
+        with self.lock:
+            self._refill()
+            self.rate = max(headroom * remaining / seconds_left, 0.01)
+            # Never hold more tokens than the window has requests left
+            self.tokens = min(self.tokens, max(remaining - 1, 0))
+
+
+class ScrapeEngine:
+    def __init__(self, client_factory, limiter, workers=4, max_retries=4, backoff_seconds=2.0):
+        self.client_factory = client_factory
+        self.limiter = limiter
+        self.workers = workers
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.local = threading.local()
+        self.stats = {"pages": 0, "retries": 0, "failed_jobs": 0}
+        self.stats_lock = threading.Lock()
+
+    def _client(self):
+        if not hasattr(self.local, "client"):
+            self.local.client = self.client_factory()
+        return self.local.client
+
+    def _count(self, name):
+        with self.stats_lock:
+            self.stats[name] += 1
+
+    def _fetch_listing(self, subreddit_name, category, limit):
+        # Returns (posts, error). Posts already received are kept even if the listing fails for good.
+        client = self._client()
+        posts = []
+        attempt = 0
+        while len(posts) < limit:
+            params = {"after": posts[-1].name} if posts else {}
+            requested = limit - len(posts)
+            listing = getattr(client.subreddit(subreddit_name), category)(limit=requested, params=params)
+            try:
+                iterator = iter(listing)
+                received = 0
+                while received < requested:
+                    # The listing requests a new page every PAGE_SIZE posts
+                    if received % PAGE_SIZE == 0:
+                        self.limiter.acquire()
+                        self._count("pages")
+                    try:
+                        post = next(iterator)
+                    except StopIteration:
+                        return posts, None
+                    posts.append(post)
+                    received += 1
+                    if received % PAGE_SIZE == 0:
+                        self.limiter.update_from_limits(getattr(client.auth, "limits", None))
+            except Exception as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    return posts, e
+                self._count("retries")
+                # Exponential backoff with jitter, so workers that failed together don't retry together
+                delay = self.backoff_seconds * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+                print(f"    ↻ r/{subreddit_name} '{category}' failed ({e}); retry {attempt}/{self.max_retries} "
+                      f"in {delay:.1f}s")
+                time.sleep(delay)
+                self.limiter.update_from_limits(getattr(client.auth, "limits", None))
+        return posts, None
+
+    def run(self, jobs, on_done=None):
+        # jobs: list of (subreddit, category, limit). Returns (posts, error) per job, in job order.
+        def run_job(job):
+            result = self._fetch_listing(*job)
+            if result[1] is not None:
+                self._count("failed_jobs")
+            if on_done is not None:
+                on_done(job, *result)
+            return result
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            return list(pool.map(run_job, jobs))
@@ -0,0 +1,60 @@
+# Text normalisation shared by the preprocessing pipeline and the web app
+# (e.g. the /predict cache keys inputs by their cleaned form).
+#
+# The patterns are compiled once, and the Reddit terms are removed in a single pass of one
+# alternation instead of one re.sub per term. The output is identical to the original
+# step-by-step version (benchmarks/cleaning_benchmark.py checks this on the corpus).
+
+import re
+
+# Common Redditisms
+REDDIT_TERMS = ["tw", "vent", "rant", "update", "throwra", "ama", "crosspost", "cross-post"]
+
+URL_PATTERN = re.compile(r"http\S+")
+REDDIT_TERMS_PATTERN = re.compile(r"\b(?:" + "|".join(re.escape(term) for term in REDDIT_TERMS) + r")\b")
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+# Remove mental health labels that could bias clustering - this part seemed to remove too much information, resulting in large amorphous clusters
+#keyword_patterns = [
+#    r"\bocd\b", r"\bptsd\b", r"\bcptsd\b", r"\bbpd\b",
+#    r"\baddict(?:ed|ion)?\b", r"\beating disorder\b", r"\banorexia\b", r"\bbulimia\b",
+#    r"\badhd\b", r"\bautism\b", r"\bautistic\b", r"\bpsychosis\b", r"\bpsychotic\b",
+#    r"\bdepression\b",  # keep "depressed", "depressing", etc.
+#    r"\bemotional neglect\b",
+#    r"\banxious attachment\b", r"\bavoidant attachment\b"
+#]
+
+
+def clean_text_sbert(text):
+    # Lowercase
+    text = text.lower()
+
+    # Remove URLs (before the terms, so a term inside a URL can't split it)
+    text = URL_PATTERN.sub("", text)
+
+    # Remove common Redditisms (whole words only, so removing one never creates or breaks another match)
+    text = REDDIT_TERMS_PATTERN.sub("", text)
+
+    # Normalize whitespace (once, at the end: the terms never contain whitespace)
+    text = text.strip()
+    text = WHITESPACE_PATTERN.sub(" ", text)
+
+    return text
+
+
+def clean_post(post):
+    # One raw scraped post -> the cleaned record used by the rest of the pipeline
+    combined_text = post["title"].strip() + " " + post["body"].strip()
+    return {
+        "id": post["id"],
+        "subreddit": post["subreddit"],
+        "category": post["category"],
+        "text": clean_text_sbert(combined_text)
+    }
+
+
+def clean_posts(posts, pool=None, chunksize=256):
+    # Streams cleaned records in input order; with a multiprocessing pool the posts are cleaned across cores
+    if pool is None:
+        return map(clean_post, posts)
+    return pool.imap(clean_post, posts, chunksize=chunksize)
@@ -1,61 +1,225 @@
 from fastapi import APIRouter, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, PlainTextResponse
 import os
-import datetime
+import asyncio
+import time
 from pydantic import BaseModel
-from sentence_transformers import SentenceTransformer
-import faiss
-import numpy as np
 import json
-from collections import Counter
-from config import FAISS_INDEX_PATH, K_NEIGHBORS
+import gzip
+import hmac
+from config import (K_NEIGHBORS, BATCH_MAX_SIZE, BATCH_WINDOW_MS, INFERENCE_MODE, INFERENCE_WORKERS,
+                    INFERENCE_THREADS, PREDICTION_CACHE_SIZE, PREDICTION_CACHE_TTL_SECONDS, STARTUP_RETRY_AFTER_SECONDS,
+                    CLUSTER_LABELS, FEEDBACK_LOG_PATH, FEEDBACK_FLUSH_SIZE, FEEDBACK_FLUSH_SECONDS,
+                    MIN_WORD_COUNT, METRICS_ENABLED, ARTIFACT_POLL_SECONDS, ADMIN_TOKEN)
 from logger import logger
+from batcher import MicroBatcher
+from inference import InferenceExecutor
+from prediction_cache import PredictionCache, text_key
+from encoders import get_encoder, encoder_version
+from serving_state import load_serving_state, artifact_version, validate_state
+from feedback_sink import FeedbackSink
+from models.map_assets import MAP_FULL_FILE, MAP_LOD_FILE, payloads_from_records
+import metrics
 
 router = APIRouter()
 
 # ----------------------
 # Load model and data
 # ----------------------
-logger.info("🔁 Loading model and index...")
-model = SentenceTransformer('all-MiniLM-L6-v2')
-index = faiss.read_index(FAISS_INDEX_PATH)
+# Loading happens in a background task after uvicorn has bound its port (see main.py),
+# so /healthz answers straight away and /predict returns 503 until everything is loaded.
+model = None
+state = None
+startup = {"status": "loading", "timings": {}, "error": None}
 
-with open("id_to_label.json", "r") as f:
-    id_to_label = json.load(f)
+def load_artifacts(load_encoder=True):
+    global model, state
+    logger.info("🔁 Loading model and index...")
+    timings = startup["timings"]
 
-with open("index_map.json", "r") as f:
-    index_map = json.load(f)
+    # In process mode only the inference workers need the encoder
+    encoder = None
+    if load_encoder:
+        start = time.perf_counter()
+        encoder = get_encoder()
+        timings["model_load"] = time.perf_counter() - start
 
-index_to_label = [id_to_label[i] for i in index_map]
+    serving_state = load_serving_state(timings)
+    model, state = encoder, serving_state
 
-with open("app/responses.json", "r", encoding="utf-8") as f:
-    PROMPT_LOOKUP = json.load(f)
+def preload():
+    # Loads everything synchronously before the app starts (serve.py loads once, then forks the workers)
+    load_artifacts(load_encoder=True)
+    prediction_cache.bind(encoder_version(), state.version)
+    startup["status"] = "ready"
+
+async def load_in_background():
+    if is_ready():
+        # Already loaded by preload() in the process this worker was forked from
+        return
+    try:
+        await asyncio.to_thread(load_artifacts, INFERENCE_MODE != "process")
+        prediction_cache.bind(encoder_version(), state.version)
+        if INFERENCE_MODE == "process":
+            executor.start()
+        startup["status"] = "ready"
+        logger.info("⏱️ Startup timings: " + ", ".join(
+            f"{stage} {seconds:.2f}s" for stage, seconds in startup["timings"].items()))
+    except Exception as e:
+        startup["status"] = "failed"
+        startup["error"] = str(e)
+        logger.error(f"Loading model and index failed: {e}")
+
+def is_ready():
+    return startup["status"] == "ready"
+
+# ----------------------
+# Hot reload
+# ----------------------
+# New artifacts (a retrained bundle, relabelled posts, edited responses) are loaded and validated off
+# the event loop while the current state keeps answering, then swapped in with one assignment.
+# A batch already running keeps the state it started with: every prediction carries the version of
+# the state that made it. In process mode the inference workers are replaced as well.
+reload_lock = asyncio.Lock()
+reload_status = {"reloads": 0, "failures": 0, "last_reload_seconds": None, "rejected_version": None, "last_error": None}
+
+def loaded_version():
+    # Runs on an inference worker: the version of the artifacts it loaded
+    return state.version
+
+async def reload_artifacts(force=False):
+    # Returns (status, details): "reloaded", "unchanged" or "failed" (the current state is kept)
+    global state
+    async with reload_lock:
+        previous = state
+        start = time.perf_counter()
+        on_disk = None
+        try:
+            on_disk = await asyncio.to_thread(artifact_version)
+            if not force and on_disk in (previous.version, reload_status["rejected_version"]):
+                return "unchanged", {"artifact_version": previous.version}
+            new_state = await asyncio.to_thread(load_serving_state)
+            await asyncio.to_thread(validate_state, new_state, previous)
+            if INFERENCE_MODE == "process":
+                worker_versions = await executor.replace_workers(loaded_version)
+                if set(worker_versions) != {new_state.version}:
+                    logger.warning(f"Inference workers loaded {sorted(set(worker_versions))}, expected {new_state.version}.")
+            state = new_state
+        except Exception as e:
+            reload_status["failures"] += 1
+            reload_status["rejected_version"] = on_disk
+            reload_status["last_error"] = str(e)
+            metrics.artifact_reloads.inc(result="failed")
+            logger.error(f"Reloading artifacts failed, still serving {previous.version}: {e}")
+            return "failed", {"artifact_version": previous.version, "error": str(e)}
+
+        # Cached kNN results belong to the old artifacts; cached embeddings are still valid
+        prediction_cache.bind(encoder_version(), state.version)
+        seconds = time.perf_counter() - start
+        reload_status["reloads"] += 1
+        reload_status["last_reload_seconds"] = round(seconds, 3)
+        reload_status["rejected_version"] = reload_status["last_error"] = None
+        metrics.artifact_reloads.inc(result="reloaded")
+        logger.info(f"🔄 Artifacts reloaded: {previous.version} -> {state.version} ({seconds:.2f}s).")
+        return "reloaded", {"artifact_version": state.version, "previous_version": previous.version,
+                            "seconds": round(seconds, 3)}
+
+async def watch_artifacts():
+    # Checks the artifacts on disk every ARTIFACT_POLL_SECONDS and reloads when their version changes
+    if ARTIFACT_POLL_SECONDS <= 0:
+        return
+    while True:
+        await asyncio.sleep(ARTIFACT_POLL_SECONDS)
+        if is_ready():
+            await reload_artifacts()
+
+def artifact_stats():
+    return {"artifact_version": state.version if state is not None else None, **reload_status}
 
 # ----------------------
 # Helper: Response Lookup
 # ----------------------
 def get_cluster_response(cluster_id):
-    return PROMPT_LOOKUP.get(str(cluster_id), "This cluster hasn't been fully annotated yet. Thank you for contributing to its training.")
-
-CLUSTER_LABELS = {
-    "0": "Struggles and victories with self-care",
-    "1": "Self-harm and strong emotions",
-    "2": "Struggles with medication",
-    "3": "Experiences of anxiety",
-    "4": "Anxieties about being seen or judged",
-    "5": "Frustrations with being invalidated, misrepresented or misunderstood",
-    "6": "System fatigue and loss of hope",
-    "7": "Night drift: Sleep as escape, day as burden",
-    "8": "Cognitive fog and self-erosion",
-    "9": "Disordered thoughts and dissociation",
-    "10": "Cycles of emotional instability and identity confusion",
-    "11": "Existential confusion and obsessive fears",
-    "12": "Still functioning but emotionally exhausted",
-    "13": "Push and pull in relationships and coping by destroying",
-    "14": "Suicidal feelings and wishing not to exist",
-    "15": "Moments that saved me",
-    "20": "What is wrong with me?"
-}
+    return state.clusters.get(str(cluster_id), {}).get("response") or "This cluster hasn't been fully annotated yet. Thank you for contributing to its training."
+
+# ----------------------
+# Batched inference
+# ----------------------
+# Both functions run on the executor (possibly in another process), so they return their stage
+# timings (tokenize/forward/prototype/search/vote, see metrics.py; None when metrics are off) and
+# the path of every prediction (cluster prototypes or kNN search) to be recorded here.
+def search_and_vote(embeddings, timings=None, paths=None):
+    # (label, certainty, artifact version) per row, from one state even if a reload swaps it meanwhile
+    current = state
+    return [(label, round(certainty, 2), current.version)
+            for label, certainty in current.search_and_vote(embeddings, K_NEIGHBORS, timings, paths)]
+
+def search_batch(embeddings):
+    timings = {} if METRICS_ENABLED else None
+    paths = []
+    return search_and_vote(embeddings, timings, paths), timings, paths
+
+def predict_batch(texts):
+    # One encode() call for every text in the batch; returns (embedding, (label, certainty)) per text
+    timings = {} if METRICS_ENABLED else None
+    embeddings = model.encode(texts, batch_size=len(texts), timings=timings)
+    paths = []
+    return list(zip(embeddings, search_and_vote(embeddings, timings, paths))), timings, paths
+
+# Predictions answered by the cluster-prototype fast path vs the full kNN search
+path_counts = {"prototype": 0, "knn": 0}
+
+def path_stats():
+    total = path_counts["prototype"] + path_counts["knn"]
+    return {**path_counts, "fast_path_hit_rate": round(path_counts["prototype"] / total, 4) if total else 0.0}
+
+def record_batch(size, timings, seconds, paths):
+    for path in paths:
+        path_counts[path] += 1
+        metrics.prediction_paths.inc(path=path)
+    if timings is None:
+        return
+    metrics.batch_seconds.observe(seconds)
+    metrics.record_stages(timings)
+    metrics.log_event("predict_batch", size=size, seconds=round(seconds, 6),
+                      stages={stage: round(value, 6) for stage, value in timings.items()})
+
+# Encoding and search run on the inference executor, never on the event loop.
+# In process mode each worker loads its own model and index when it starts.
+executor = InferenceExecutor(INFERENCE_MODE, INFERENCE_WORKERS, INFERENCE_THREADS, initializer=load_artifacts)
+
+async def run_predict_batch(texts):
+    start = time.perf_counter()
+    results, timings, paths = await executor.run(predict_batch, texts)
+    record_batch(len(texts), timings, time.perf_counter() - start, paths)
+    return results
+
+batcher = MicroBatcher(run_predict_batch, BATCH_MAX_SIZE, BATCH_WINDOW_MS, max_concurrent=INFERENCE_WORKERS)
+
+# Cached results are tied to the loaded encoder and to the index/label files they were computed against
+# (bound once loading has finished)
+prediction_cache = PredictionCache(PREDICTION_CACHE_SIZE, PREDICTION_CACHE_TTL_SECONDS)
+
+async def cached_predict(text):
+    # Returns the result and where it came from ("cache", "embedding_cache" or "batch")
+    key = text_key(text)
+    embedding, result = prediction_cache.lookup(key)
+    if result is not None:
+        logger.info("♻️ Cache hit.")
+        return result, "cache"
+
+    if embedding is not None:
+        # Same text as before but the index or labels changed: search again without re-encoding
+        start = time.perf_counter()
+        results, timings, paths = await executor.run(search_batch, embedding[None, :])
+        record_batch(1, timings, time.perf_counter() - start, paths)
+        result, source = results[0], "embedding_cache"
+    else:
+        (embedding, result), source = await batcher.submit(text), "batch"
+
+    # A result from the state a reload has just replaced is returned, but only its embedding is kept
+    prediction_cache.store(key, embedding, result if result[2] == prediction_cache.artifact_version else None)
+    return result, source
 
 # ----------------------
 # Request Schema
@@ -67,61 +231,182 @@ class UserInput(BaseModel):
 # Prediction Endpoint
 # ----------------------
 @router.post("/predict")
-@router.post("/predict")
 async def predict(user_input: UserInput):
+    with metrics.request_seconds.time(route="predict") as timer:
+        content, status = await answer_prediction(user_input)
+    if timer.start is not None:
+        metrics.log_event("request", route="predict", status=status,
+                          seconds=round(time.perf_counter() - timer.start, 6))
+    return content
+
+async def answer_prediction(user_input):
+    # Returns (response, status for the metrics and logs)
+    if not is_ready():
+        metrics.rejections.inc(reason="not_ready")
+        logger.warning("⏳ Rejected: model and index still loading.")
+        return JSONResponse(
+            content={"error": "The model is still loading. Please try again in a moment."},
+            status_code=503,
+            headers={"Retry-After": str(STARTUP_RETRY_AFTER_SECONDS)},
+        ), "not_ready"
+
     try:
         logger.info("🔍 Received text input.")
 
         text = user_input.text.strip()
         logger.info(f"Input word count: {len(text.split())}")
 
-        if len(text.split()) < 50:
-            logger.warning("❌ Rejected: fewer than 50 words.")
-            return {"error": "Input must be at least 50 words."}
+        if len(text.split()) < MIN_WORD_COUNT:
+            metrics.rejections.inc(reason="too_short")
+            logger.warning(f"❌ Rejected: fewer than {MIN_WORD_COUNT} words.")
+            return {"error": f"Input must be at least {MIN_WORD_COUNT} words."}, "too_short"
 
-        embedding = model.encode([text], convert_to_numpy=True)
-        logger.info("✅ Embedding created.")
-
-        _, indices = index.search(embedding, K_NEIGHBORS)
-        logger.info("🔁 Nearest neighbor search complete.")
-
-        neighbor_labels = [index_to_label[i] for i in indices[0]]
-        majority_label, count = Counter(neighbor_labels).most_common(1)[0]
-        certainty = round(count / K_NEIGHBORS, 2)
+        (majority_label, certainty, version), source = await cached_predict(text)
+        metrics.prediction_sources.inc(source=source)
+        logger.info("✅ Embedding created and nearest neighbor search complete.")
 
         logger.info(f"🏷️ Predicted cluster: {majority_label} (certainty: {certainty})")
 
         return {
             "cluster": majority_label,
             "certainty": certainty,
-            "response": get_cluster_response(majority_label)
-        }
+            "response": get_cluster_response(majority_label),
+            "artifact_version": version,
+        }, source
 
     except Exception as e:
+        metrics.errors.inc(route="predict")
         logger.error(f"Prediction failed: {e}")
-        return {"error": "Prediction failed due to an internal error."}
+        return {"error": "Prediction failed due to an internal error."}, "error"
 
-# Function for collecting feedback
+# Function for collecting feedback: queued here, written to the CSV in batches by a background thread
+
+feedback_sink = FeedbackSink(FEEDBACK_LOG_PATH, FEEDBACK_FLUSH_SIZE, FEEDBACK_FLUSH_SECONDS)
 
 @router.post("/feedback")
 async def receive_feedback(request: Request):
-    data = await request.json()
-    rating = data.get("rating")
-    feedback = data.get("feedback")
-    timestamp = datetime.datetime.utcnow().isoformat()
+    with metrics.request_seconds.time(route="feedback"):
+        try:
+            data = await request.json()
+            feedback_sink.submit(
+                source="web",
+                rating=data.get("rating"),
+                feedback=data.get("feedback"),
+                predicted_cluster=data.get("cluster"),
+                certainty=data.get("certainty"),
+            )
+        except Exception:
+            metrics.errors.inc(route="feedback")
+            raise
+        return {"message": "Thank you for your feedback"}
+
+# Function for getting UMAP embeddings into html for graphical representation of feature space.
+# Serves the precompressed columnar payloads built by models/map_assets.py (?lod=1 for the small
+# initial-view sample), kept in memory and read again when the files change (retraining or
+# relabelling rewrites them while the app runs); built from umap_data.json if they are missing.
 
-    with open("feedback_log.csv", "a", encoding="utf-8") as f:
-        f.write(f"{timestamp},{rating},{feedback.replace(',', ';')}\n")
+map_payloads = {}
 
-    return {"message": "Thank you for your feedback"}
+def map_source_files():
+    full_path, lod_path = os.path.join("app", MAP_FULL_FILE), os.path.join("app", MAP_LOD_FILE)
+    if os.path.exists(full_path) and os.path.exists(lod_path):
+        return {"full": full_path, "lod": lod_path}
+    return {"records": os.path.join("app", "umap_data.json")}
 
-# Function for getting UMAP embeddings into html for graphical representation of feature space
+def load_map_payloads():
+    sources = map_source_files()
+    fingerprint = [(path, stat.st_mtime_ns, stat.st_size) for path, stat in ((path, os.stat(path)) for path in sources.values())]
+    if map_payloads.get("fingerprint") != fingerprint:
+        payloads = {"fingerprint": fingerprint}
+        if "records" in sources:
+            with open(sources["records"], "r", encoding="utf-8") as f:
+                payloads["full"], payloads["lod"] = payloads_from_records(json.load(f))
+        else:
+            for key, path in sources.items():
+                with open(path, "rb") as f:
+                    payloads[key] = f.read()
+        for key in ("full", "lod"):
+            payloads[key + "_etag"] = '"' + json.loads(gzip.decompress(payloads[key]))["version"] + f'-{key}"'
+        map_payloads.clear()
+        map_payloads.update(payloads)
+    return map_payloads
 
 @router.get("/umap")
-async def get_umap_data():
+async def get_umap_data(request: Request, lod: bool = False):
+    with metrics.request_seconds.time(route="umap"):
+        return umap_response(request, lod)
+
+def umap_response(request, lod):
     try:
-        with open(os.path.join("app", "umap_data.json"), "r", encoding="utf-8") as f:
-            data = json.load(f)
-        return JSONResponse(content=data)
+        payloads = load_map_payloads()
+        key = "lod" if lod else "full"
+        headers = {
+            "ETag": payloads[key + "_etag"],
+            "Cache-Control": "public, max-age=3600, must-revalidate",
+            "Vary": "Accept-Encoding",
+        }
+        if request.headers.get("if-none-match") == headers["ETag"]:
+            return Response(status_code=304, headers=headers)
+        if "gzip" in request.headers.get("accept-encoding", ""):
+            headers["Content-Encoding"] = "gzip"
+            return Response(content=payloads[key], media_type="application/json", headers=headers)
+        return Response(content=gzip.decompress(payloads[key]), media_type="application/json", headers=headers)
     except Exception as e:
-        return JSONResponse(content={"error": str(e)}, status_code=500)
\ No newline at end of file
+        metrics.errors.inc(route="umap")
+        return JSONResponse(content={"error": str(e)}, status_code=500)
+
+# Liveness: the process is up and serving requests
+
+@router.get("/healthz")
+async def healthz():
+    return {"status": "ok"}
+
+# Readiness: model, index and labels are loaded and /predict can answer
+
+@router.get("/readyz")
+async def readyz():
+    content = {
+        "status": startup["status"],
+        "timings": {stage: round(seconds, 3) for stage, seconds in startup["timings"].items()},
+    }
+    if startup["error"]:
+        content["error"] = startup["error"]
+    if state is not None:
+        content["artifact_version"] = state.version
+    if is_ready():
+        return content
+    return JSONResponse(content=content, status_code=503, headers={"Retry-After": str(STARTUP_RETRY_AFTER_SECONDS)})
+
+# Batching, cache and fast-path counters for the /predict path, and the feedback writer's counters
+
+@router.get("/stats")
+async def get_stats():
+    return {"batching": batcher.stats(), "cache": prediction_cache.stats(), "paths": path_stats(),
+            "artifacts": artifact_stats(), "feedback": feedback_sink.stats()}
+
+# Latency histograms and counters (see metrics.py), plus the /stats counters, in the Prometheus text format
+
+@router.get("/metrics")
+async def get_metrics():
+    if not METRICS_ENABLED:
+        return PlainTextResponse("Metrics are disabled (METRICS_ENABLED=0).\n", status_code=404)
+    stats = {"batcher": batcher.stats(), "prediction_cache": prediction_cache.stats(), "predict_paths": path_stats(),
+             "artifacts": artifact_stats(), "feedback": feedback_sink.stats()}
+    return PlainTextResponse(metrics.render(stats), media_type="text/plain; version=0.0.4")
+
+# Reloads the index, labels and responses now, without waiting for the next check (see reload_artifacts).
+# Needs the header X-Admin-Token: <ADMIN_TOKEN>; ?force=true reloads even if the version is unchanged.
+
+@router.post("/admin/reload")
+async def admin_reload(request: Request, force: bool = False):
+    if not ADMIN_TOKEN:
+        return JSONResponse(content={"error": "Reloading is disabled (ADMIN_TOKEN is not set)."}, status_code=404)
+    token = request.headers.get("x-admin-token", "")
+    if not hmac.compare_digest(token.encode("utf-8"), ADMIN_TOKEN.encode("utf-8")):
+        logger.warning("❌ Rejected /admin/reload: invalid admin token.")
+        return JSONResponse(content={"error": "Invalid admin token."}, status_code=403)
+    if not is_ready():
+        return JSONResponse(content={"error": "The model is still loading."}, status_code=503,
+                            headers={"Retry-After": str(STARTUP_RETRY_AFTER_SECONDS)})
+    status, details = await reload_artifacts(force)
+    return JSONResponse(content={"status": status, **details}, status_code=500 if status == "failed" else 200)
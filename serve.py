@@ -0,0 +1,131 @@
+# serve.py
+# Multi-worker launcher for the web app (Linux/macOS; it relies on fork).
+#
+# `uvicorn --workers N` starts every worker as a fresh process, so each one loads its own
+# SentenceTransformer, FAISS index and label maps. Here the master process loads them once,
+# then forks the workers: they share those pages copy-on-write and only pay for what they change.
+#
+#   1. set the per-worker thread limits (cores / workers) before torch or FAISS are imported
+#   2. bind the listening socket, then load the model, index and labels (routes.preload)
+#   3. gc.freeze() so the garbage collector doesn't write to (and so copy) the loaded objects' pages
+#   4. fork the workers; each runs uvicorn on the shared socket and the kernel spreads connections
+#      between them. A worker that dies is replaced by a new fork of the master.
+#
+# Usage:  python serve.py --workers 4 [--host 0.0.0.0] [--port 10000]
+# benchmarks/worker_memory.py measures how much memory each worker really adds.
+
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+
+parser = argparse.ArgumentParser(description="Preload the model once, then fork uvicorn workers that share it.")
+parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1)))
+parser.add_argument("--host", default="0.0.0.0")
+parser.add_argument("--port", type=int, default=int(os.getenv("PORT", 10000)))
+parser.add_argument("--threads", type=int, help="Torch/FAISS threads per worker (default: cores / workers)")
+parser.add_argument("--backlog", type=int, default=2048)
+args = parser.parse_args()
+
+if not hasattr(os, "fork"):
+    sys.exit("serve.py needs fork (Linux/macOS); on Windows use uvicorn main:fastapi_app.")
+
+# 1. Thread limits, before config.py, torch or FAISS are imported
+threads = args.threads or max(1, (os.cpu_count() or 1) // args.workers)
+os.environ["INFERENCE_THREADS"] = str(threads)
+os.environ["OMP_NUM_THREADS"] = str(threads)
+os.environ["MKL_NUM_THREADS"] = str(threads)
+# The tokenizer's own thread pool doesn't survive fork
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+import uvicorn
+import routes
+from main import fastapi_app
+from config import INFERENCE_MODE
+from logger import logger
+
+if INFERENCE_MODE != "thread":
+    # Process mode starts fresh processes that load their own model, which is what this avoids
+    sys.exit("serve.py shares one loaded model between workers: set INFERENCE_MODE=thread.")
+
+# 2. Bind first so connections queue in the backlog while loading, then load everything once
+sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+sock.bind((args.host, args.port))
+sock.listen(args.backlog)
+sock.set_inheritable(True)
+
+start = time.perf_counter()
+routes.preload()
+# Created here rather than by the first worker to receive feedback, so workers can't race on the header
+routes.feedback_sink.prepare_file()
+logger.info(f"📦 Loaded model and index in {time.perf_counter() - start:.1f}s (master pid {os.getpid()}).")
+
+# 3. Everything loaded so far is permanent: keep the collector off those objects
+gc.collect()
+gc.freeze()
+
+
+def run_worker():
+    # In the forked child: uvicorn on the inherited socket; the executor and feedback writer
+    # threads start here, on first use
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    server = uvicorn.Server(uvicorn.Config(fastapi_app, log_config=None, timeout_graceful_shutdown=30))
+    server.run(sockets=[sock])
+
+
+def spawn():
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            run_worker()
+        except Exception as e:
+            logger.error(f"Worker {os.getpid()} failed: {e}")
+            code = 1
+        # Never return into the master's loop below
+        os._exit(code)
+    return pid
+
+
+# 4. Fork the workers and keep them running until SIGTERM/SIGINT
+stopping = False
+
+
+def stop(signum, frame):
+    global stopping
+    stopping = True
+    for pid in list(workers):
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+
+workers = set()
+signal.signal(signal.SIGTERM, stop)
+signal.signal(signal.SIGINT, stop)
+for _ in range(args.workers):
+    workers.add(spawn())
+logger.info(f"🚀 {args.workers} worker(s) with {threads} thread(s) each on http://{args.host}:{args.port} "
+            f"(pids {sorted(workers)})")
+
+while workers:
+    try:
+        pid, status = os.wait()
+    except ChildProcessError:
+        break
+    except InterruptedError:
+        continue
+    workers.discard(pid)
+    if not stopping:
+        logger.warning(f"Worker {pid} exited with status {status}; starting a new one.")
+        time.sleep(1)
+        workers.add(spawn())
+
+sock.close()
+logger.info("All workers stopped.")
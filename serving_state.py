@@ -0,0 +1,179 @@
+# serving_state.py
+# Everything /predict needs besides the encoder: the FAISS index, the cluster label of
+# every indexed post (in index row order) and the cluster name/response table, plus the
+# cluster prototypes of the fast path (models/prototypes.py) when the bundle has them.
+#
+# Loaded from the serving bundle (artifacts.py) when one has been built, otherwise
+# from the loose cluster_index.faiss / id_to_label.json / index_map.json files.
+# artifact_version() gives the version on disk without loading it, so the web app can tell
+# when to reload, and validate_state() checks a freshly loaded state before it is swapped in.
+
+import json
+import os
+import time
+import numpy as np
+import faiss
+from config import (BUNDLE_DIR, FAISS_INDEX_PATH, LABELS_JSON, INDEX_MAP_JSON, RESPONSES_JSON,
+                    CLUSTER_LABELS, EMBEDDING_MODEL, PROTOTYPE_MARGIN, BUNDLE_VERIFY_CHECKSUM)
+from logger import logger
+from prediction_cache import file_fingerprint
+from artifacts import BundleError, current_version_dir, open_bundle, load_bundle_ids, load_bundle_prototypes
+from models.knn import neighbor_labels, majority_vote
+from models.index_factory import apply_search_params, prepare_vectors
+from models.prototypes import PrototypeClassifier
+
+
+class ServingState:
+    def __init__(self, index, labels, clusters, version, manifest, prototypes=None):
+        self.index = index
+        self.labels = labels
+        self.clusters = clusters
+        self.version = version
+        self.manifest = manifest
+        self.metric = manifest.get("index_metric", "l2")
+        self.prototypes = prototypes
+
+    def search(self, embeddings, k):
+        # Index rows of the k nearest indexed posts of every embedding (-1 where there are fewer)
+        _, indices = self.index.search(prepare_vectors(embeddings, self.metric), k)
+        return indices
+
+    def vote(self, indices, k):
+        # Vectorised majority vote over search() results: (cluster id, share of neighbours that agreed) per row
+        labels, counts = majority_vote(neighbor_labels(self.labels, indices))
+        return [(str(label), count / k) for label, count in zip(labels.tolist(), counts.tolist())]
+
+    def search_and_vote(self, embeddings, k, timings=None, paths=None):
+        # Rows the cluster prototypes answer clearly take the fast path; the rest get one FAISS
+        # search for the whole batch, then the vote.
+        # `timings`, if given, receives the seconds spent in "prototype", "search" and "vote" (see
+        # metrics.py); `paths`, if given, is extended with "prototype" or "knn" for every row.
+        results = [None] * len(embeddings)
+        remaining = np.arange(len(embeddings))
+        if self.prototypes is not None and len(embeddings):
+            start = time.perf_counter()
+            clusters, margins = self.prototypes.predict(prepare_vectors(embeddings, self.metric))
+            fast = margins >= self.prototypes.margin
+            for i in np.flatnonzero(fast):
+                results[i] = (str(clusters[i]), self.prototypes.fast_certainty(clusters[i]))
+            remaining = np.flatnonzero(~fast)
+            if timings is not None:
+                timings["prototype"] = timings.get("prototype", 0.0) + time.perf_counter() - start
+
+        if len(remaining):
+            start = time.perf_counter()
+            indices = self.search(embeddings if len(remaining) == len(embeddings) else embeddings[remaining], k)
+            searched = time.perf_counter()
+            for i, result in zip(remaining, self.vote(indices, k)):
+                results[i] = result
+            if timings is not None:
+                timings["search"] = timings.get("search", 0.0) + searched - start
+                timings["vote"] = timings.get("vote", 0.0) + time.perf_counter() - searched
+        if paths is not None:
+            searched_rows = np.zeros(len(embeddings), dtype=bool)
+            searched_rows[remaining] = True
+            paths.extend("knn" if row else "prototype" for row in searched_rows.tolist())
+        return results
+
+
+def cluster_table(responses):
+    # cluster id -> {"name", "response"}, from CLUSTER_LABELS and app/responses.json
+    cluster_ids = sorted(set(CLUSTER_LABELS) | set(responses), key=int)
+    return {cid: {"name": CLUSTER_LABELS.get(cid), "response": responses.get(cid)} for cid in cluster_ids}
+
+
+def legacy_version():
+    return file_fingerprint(FAISS_INDEX_PATH, LABELS_JSON, INDEX_MAP_JSON, RESPONSES_JSON)
+
+
+def artifact_version():
+    # Version of the artifacts on disk: the bundle CURRENT points at, or a fingerprint of the loose files
+    version_dir = current_version_dir(BUNDLE_DIR)
+    if version_dir is not None:
+        return os.path.basename(version_dir)
+    return legacy_version()
+
+
+def validate_state(state, previous=None):
+    # Raises BundleError if `state` can't serve: labels not matching the index, or an index of another
+    # dimension than the one it replaces (the encoder is not reloaded). Also runs one search.
+    if len(state.labels) != state.index.ntotal:
+        raise BundleError(f"Artifacts {state.version}: {state.index.ntotal} vectors but {len(state.labels)} labels")
+    if previous is not None and state.index.d != previous.index.d:
+        raise BundleError(f"Artifacts {state.version}: index dimension {state.index.d}, "
+                          f"the loaded encoder gives {previous.index.d}")
+    unknown = set(np.unique(state.labels).astype(str).tolist()) - set(state.clusters)
+    if unknown:
+        logger.warning(f"Artifacts {state.version}: clusters without a name or response: {sorted(unknown)}")
+    state.search_and_vote(np.zeros((1, state.index.d), dtype=np.float32), 1)
+
+
+def load_legacy_state(timings):
+    start = time.perf_counter()
+    index = faiss.read_index(FAISS_INDEX_PATH)
+    timings["index_read"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with open(LABELS_JSON, "r") as f:
+        id_to_label = json.load(f)
+    with open(INDEX_MAP_JSON, "r") as f:
+        index_map = json.load(f)
+    if len(index_map) != index.ntotal:
+        raise BundleError(f"{FAISS_INDEX_PATH} has {index.ntotal} vectors but {INDEX_MAP_JSON} maps {len(index_map)}")
+    missing = [i for i in index_map if i not in id_to_label]
+    if missing:
+        raise BundleError(f"{len(missing)} indexed posts have no label in {LABELS_JSON} (e.g. {missing[0]})")
+    labels = np.array([int(id_to_label[i]) for i in index_map], dtype=np.int16)
+    with open(RESPONSES_JSON, "r", encoding="utf-8") as f:
+        clusters = cluster_table(json.load(f))
+    timings["map_build"] = time.perf_counter() - start
+
+    version = legacy_version()
+    manifest = {"version": version, "model_name": EMBEDDING_MODEL, "embedding_dim": index.d,
+                "num_vectors": int(index.ntotal), "index_type": type(index).__name__}
+    return ServingState(index, labels, clusters, version, manifest)
+
+
+def load_prototypes(version_dir, manifest):
+    # Fast-path classifier, with the margin from config.py if set, else the one chosen in training
+    prototypes = load_bundle_prototypes(version_dir)
+    if prototypes is None:
+        return None
+    info = manifest.get("prototypes", {})
+    margin = PROTOTYPE_MARGIN if PROTOTYPE_MARGIN is not None else info.get("margin")
+    return PrototypeClassifier(*prototypes, metric=manifest.get("index_metric", "l2"), margin=margin,
+                               certainty=info.get("certainty"))
+
+
+def load_serving_state(timings=None):
+    # Records how long each stage takes in `timings` (seconds), if given
+    timings = {} if timings is None else timings
+
+    version_dir = current_version_dir(BUNDLE_DIR)
+    if version_dir is None:
+        logger.warning(f"No serving bundle in {BUNDLE_DIR}/, loading the loose index and label files.")
+        state = load_legacy_state(timings)
+    else:
+        start = time.perf_counter()
+        manifest, index, labels, clusters = open_bundle(version_dir, verify=BUNDLE_VERIFY_CHECKSUM)
+        timings["index_read"] = time.perf_counter() - start
+        timings["map_build"] = 0.0
+        state = ServingState(index, labels, clusters, manifest["version"], manifest,
+                             load_prototypes(version_dir, manifest))
+
+    # nprobe / efSearch from config.py (they aren't saved with the index)
+    apply_search_params(state.index)
+
+    if state.manifest["model_name"] != EMBEDDING_MODEL:
+        logger.warning(f"Index was built with {state.manifest['model_name']} but config uses {EMBEDDING_MODEL}.")
+    logger.info(f"📚 Loaded {state.index.ntotal} indexed posts (artifacts {state.version}).")
+    return state
+
+
+def load_row_ids():
+    # Post id of every index row (not needed for serving, so not part of ServingState)
+    version_dir = current_version_dir(BUNDLE_DIR)
+    if version_dir is not None:
+        return load_bundle_ids(version_dir)
+    with open(INDEX_MAP_JSON, "r") as f:
+        return json.load(f)